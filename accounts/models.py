@@ -2,6 +2,7 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from core.utils import running_average
 
 # class UserManager(BaseUserManager):
 #     def create_user(self, email, password=None, **extra_fields):
@@ -109,13 +110,26 @@ class User(AbstractBaseUser, PermissionsMixin):
     def get_short_name(self):
         return self.full_name.split()[0] if self.full_name else self.email
 
+    def add_rating(self, rating):
+        """إضافة تقييم بتحديث ذري للمتوسط الجاري دون إعادة تجميع كل التقييمات"""
+        User.objects.filter(pk=self.pk).update(**running_average(rating))
+        self.refresh_from_db(fields=['rating_average', 'rating_count'])
+
+    def increment_counter(self, field, amount=1):
+        """زيادة عداد إحصائي بشكل ذري (total_items_posted أو total_orders_made)"""
+        User.objects.filter(pk=self.pk).update(**{field: models.F(field) + amount})
+        self.refresh_from_db(fields=[field])
+
     def update_rating(self):
-        from .ratings import UserRating
-        ratings = UserRating.objects.filter(rated_user=self)
-        if ratings.exists():
-            self.rating_average = ratings.aggregate(models.Avg('rating'))['rating__avg'] or 0
-            self.rating_count = ratings.count()
-            self.save()
+        """إعادة حساب التقييم من تقييمات المستخدمين والطلبات (لإصلاح الانحراف)"""
+        totals = [
+            ratings.aggregate(total=models.Sum('rating'), count=models.Count('id'))
+            for ratings in (self.received_ratings.all(), self.order_ratings_received.all())
+        ]
+        self.rating_count = sum(total['count'] for total in totals)
+        rating_sum = sum(total['total'] or 0 for total in totals)
+        self.rating_average = rating_sum / self.rating_count if self.rating_count else 0
+        self.save(update_fields=['rating_average', 'rating_count'])
 
 class UserRating(models.Model):
     rater = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_ratings', verbose_name=_('المقيم'))
@@ -207,8 +207,8 @@ class UserRatingListCreateView(generics.ListCreateAPIView):
         if rated_user == self.request.user:
             raise serializers.ValidationError('لا يمكنك تقييم نفسك')
         
-        serializer.save(rater=self.request.user, rated_user=rated_user)
-        rated_user.update_rating()
+        rating = serializer.save(rater=self.request.user, rated_user=rated_user)
+        rated_user.add_rating(rating.rating)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AIAnalysis, ChatBot, ChatBotMessage, AIModel
+from .models import AIAnalysis, AIResultCache, ChatBot, ChatBotMessage, AIModel, ModerationVerdict
 
 @admin.register(AIAnalysis)
 class AIAnalysisAdmin(admin.ModelAdmin):
@@ -24,6 +24,19 @@ class AIAnalysisAdmin(admin.ModelAdmin):
         })
     )
 
+@admin.register(AIResultCache)
+class AIResultCacheAdmin(admin.ModelAdmin):
+    list_display = ['id', 'analysis_type', 'model_version', 'hit_count', 'last_used_at', 'expires_at']
+    list_filter = ['analysis_type', 'model_version']
+    search_fields = ['content_hash']
+    readonly_fields = ['content_hash', 'created_at', 'last_used_at', 'hit_count']
+
+@admin.register(ModerationVerdict)
+class ModerationVerdictAdmin(admin.ModelAdmin):
+    list_display = ['id', 'content_type', 'object_id', 'status', 'toxicity_score', 'model_version', 'moderated_at']
+    list_filter = ['status', 'content_type', 'model_version']
+    readonly_fields = ['content_hash', 'queued_at', 'moderated_at']
+
 class ChatBotMessageInline(admin.TabularInline):
     model = ChatBotMessage
     extra = 0
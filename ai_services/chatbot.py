@@ -0,0 +1,138 @@
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+
+from .models import ChatBotMessage
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "أنت جرين بوت، مساعد ذكي متخصص في إعادة التدوير والاستدامة البيئية. أجب باحترافية وباللغة العربية."
+CONTEXT_PROMPT = "المعلومات التالية قد تساعدك في الإجابة على الأسئلة:\n{context}"
+
+
+# ردود المحاكاة المحلية لكل نية (الكلمات المفتاحية في keywords.LEXICONS['intent'])
+INTENT_RESPONSES = {
+    'تحية': [
+        'مرحباً بك في جرين بوت! أنا هنا لمساعدتك في كل ما يتعلق بإعادة التدوير والاستدامة البيئية. كيف يمكنني مساعدتك اليوم؟',
+        'أهلاً وسهلاً! أنا مساعدك الذكي في رحلة إعادة التدوير. ما الذي تود معرفته؟',
+    ],
+    'تصنيف': [
+        'يمكنني مساعدتك في تصنيف المخلفات! ارفع صورة للمخلف وسأحلله لك فوراً. أو اوصف لي المخلف وسأساعدك في تحديد فئته.',
+        'التصنيف سهل! الفئات الرئيسية هي: بلاستيك، معادن، ورق، زجاج، إلكترونيات، نسيج، وعضوي. أي نوع تريد معرفة المزيد عنه؟',
+    ],
+    'سعر': [
+        'أسعار المخلفات تعتمد على عدة عوامل: نوع المادة، الحالة، الكمية، والطلب في السوق. يمكنني اقتراح سعر مناسب إذا أخبرتني بتفاصيل المخلف.',
+        'لتحديد السعر المناسب، أحتاج معرفة: نوع المخلف، حالته، الكمية، وموقعك. هذا سيساعدني في إعطائك تقدير دقيق.',
+    ],
+    'تدوير': [
+        'إعادة التدوير عملية رائعة للبيئة! كل مادة لها طريقة معالجة خاصة. البلاستيك يُقطع ويُصهر، المعادن تُصهر وتُعاد تشكيلها، والورق يُنقع ويُعاد تكوينه.',
+        'عملية إعادة التدوير تمر بمراحل: الجمع، الفرز، التنظيف، المعالجة، ثم التصنيع. أي مرحلة تريد معرفة المزيد عنها؟',
+    ],
+    'بيئة': [
+        'إعادة التدوير تساهم بشكل كبير في حماية البيئة! توفر الطاقة، تقلل التلوث، وتحافظ على الموارد الطبيعية. كل طن معاد تدويره ينقذ الكوكب!',
+        'البيئة تستفيد من إعادة التدوير بطرق عديدة: تقليل النفايات، توفير المياه والطاقة، تقليل انبعاثات الكربون، والحفاظ على الموائل الطبيعية.',
+    ],
+    'مساعدة': [
+        'بالطبع! يمكنني مساعدتك في: تصنيف المخلفات، اقتراح الأسعار، نصائح إعادة التدوير، معلومات بيئية، وإرشادات الاستدامة. ما الذي تحتاج مساعدة فيه؟',
+        'أنا هنا لمساعدتك! خدماتي تشمل: التصنيف الذكي، تقدير الأسعار، نصائح التدوير، معلومات بيئية، وإجابات على أسئلتك. كيف يمكنني خدمتك؟',
+    ],
+}
+
+DEFAULT_RESPONSES = [
+    'شكراً لك على سؤالك! يمكنني مساعدتك في تصنيف المخلفات، اقتراح الأسعار، ونصائح إعادة التدوير. هل تريد معرفة المزيد عن أي من هذه الخدمات؟',
+    'سؤال رائع! أنا متخصص في إعادة التدوير والاستدامة البيئية. يمكنني مساعدتك في تحديد نوع المخلفات، تقدير قيمتها، وإرشادك لأفضل طرق التدوير.',
+    'أقدر اهتمامك بإعادة التدوير! لمساعدتك بشكل أفضل، يمكنك سؤالي عن: أنواع المخلفات، طرق التدوير، تقدير الأسعار، أو أي معلومات بيئية تحتاجها.',
+    'ممتاز! إعادة التدوير خطوة مهمة للبيئة. يمكنني إرشادك خلال عملية تصنيف مخلفاتك، تحديد قيمتها، وإعطائك نصائح لتحقيق أفضل عائد منها.',
+]
+
+
+def estimate_tokens(text):
+    """تقدير تقريبي لعدد التوكنات (النص العربي يقارب 3 أحرف لكل توكن)"""
+    return len(text) // 3 + 1
+
+
+@lru_cache(maxsize=1)
+def knowledge_base_documents():
+    """مستندات info.txt تُقرأ مرة واحدة لكل عملية، وتُستخدم فقط إذا تعذر الاسترجاع"""
+    try:
+        from .rag_builder import KNOWLEDGE_BASE_FILE, load_text_documents
+        return tuple(load_text_documents(KNOWLEDGE_BASE_FILE))
+    except Exception as e:
+        logger.warning("Failed to load chatbot knowledge base: %s", e)
+        return ()
+
+
+class ChatPromptBuilder:
+    """
+    تجميع رسائل البوت: تعليمات النظام، ثم أفضل المقاطع المسترجعة ضمن ميزانية توكنات،
+    ثم آخر رسائل الجلسة ضمن ميزانية منفصلة، ثم رسالة المستخدم الحالية.
+    """
+
+    def __init__(self, session, message, retrieve):
+        self.session = session
+        self.message = message
+        self.retrieve = retrieve
+        self.context_budget = getattr(settings, 'CHATBOT_CONTEXT_TOKEN_BUDGET', 1200)
+        self.history_budget = getattr(settings, 'CHATBOT_HISTORY_TOKEN_BUDGET', 800)
+        self.history_limit = getattr(settings, 'CHATBOT_HISTORY_MESSAGES', 10)
+        self.top_k = getattr(settings, 'CHATBOT_RAG_TOP_K', 4)
+
+    def context_documents(self):
+        """المقاطع المرتبطة بالرسالة، مع الرجوع لقاعدة المعرفة إذا لم يتوفر الفهرس"""
+        if getattr(settings, 'ENABLE_RAG', True):
+            try:
+                return [doc['content'] for doc in self.retrieve(self.message, top_k=self.top_k)]
+            except Exception as e:
+                logger.warning("RAG retrieval failed, falling back to knowledge base: %s", e)
+        return list(knowledge_base_documents())
+
+    def context_message(self):
+        selected = []
+        used = 0
+        for document in self.context_documents():
+            cost = estimate_tokens(document)
+            if used + cost > self.context_budget:
+                continue
+            selected.append(document)
+            used += cost
+
+        if not selected:
+            return None
+        return {"role": "system", "content": CONTEXT_PROMPT.format(context="\n\n".join(selected))}
+
+    def history_messages(self):
+        if not getattr(settings, "ENABLE_CONTEXT_AWARE_CHAT", True) or not self.history_limit:
+            return []
+
+        recent = list(
+            ChatBotMessage.objects.filter(session=self.session, message_type__in=['user', 'bot'])
+            .order_by('-created_at', '-id')
+            .values_list('message_type', 'content')[:self.history_limit + 1]
+        )
+        # رسالة المستخدم الحالية محفوظة بالفعل قبل استدعاء البوت
+        if recent and recent[0] == ('user', self.message):
+            recent = recent[1:]
+
+        history = []
+        used = 0
+        for message_type, content in recent[:self.history_limit]:
+            cost = estimate_tokens(content)
+            if used + cost > self.history_budget:
+                break
+            history.append({
+                "role": "user" if message_type == "user" else "assistant",
+                "content": content,
+            })
+            used += cost
+        history.reverse()
+        return history
+
+    def build(self):
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        context = self.context_message()
+        if context:
+            messages.append(context)
+        messages.extend(self.history_messages())
+        messages.append({"role": "user", "content": self.message})
+        return messages
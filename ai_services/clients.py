@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_API_KEY = 'your-openai-api-key-here'
+
+
+def openai_configured():
+    """هل تم ضبط مفتاح OpenAI حقيقي"""
+    api_key = getattr(settings, 'OPENAI_API_KEY', None)
+    return bool(api_key) and api_key != PLACEHOLDER_API_KEY
+
+
+def _is_retryable(error):
+    """أخطاء تستحق إعادة المحاولة: تجاوز الحد (429) وأخطاء الخادم (5xx) والشبكة"""
+    import openai
+
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelProvider:
+    """
+    طبقة الوصول غير المتزامنة لمزود النماذج.
+    عميل واحد لكل حلقة أحداث مع تجميع الاتصالات، وحد أقصى للطلبات المتزامنة لكل نموذج،
+    ومهلة لكل محاولة، وإعادة المحاولة مع تأخير أُسّي عشوائي عند 429 و5xx.
+    """
+
+    def __init__(self, concurrency=None, timeout=30, max_retries=3, backoff_base=0.5, backoff_max=8.0):
+        self.concurrency = concurrency or {'default': 8}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # العملاء والإشارات مرتبطة بحلقة الأحداث التي أُنشئت فيها
+        self._clients = weakref.WeakKeyDictionary()
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._loop = None
+        self._loop_pid = None
+        self._loop_lock = threading.Lock()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            import openai
+
+            client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+            self._clients[loop] = client
+        return client
+
+    def _semaphore(self, model):
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if model not in semaphores:
+            limit = self.concurrency.get(model, self.concurrency.get('default', 8))
+            semaphores[model] = asyncio.Semaphore(limit)
+        return semaphores[model]
+
+    def _backoff(self, attempt, error):
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _with_retries(self, model, request, acquire=True):
+        """
+        تنفيذ الطلب مع إعادة المحاولة.
+        acquire=False إذا كان المستدعي يحجز مكان النموذج بنفسه (البث).
+        """
+        attempt = 0
+        while True:
+            try:
+                if not acquire:
+                    return await asyncio.wait_for(request(), self.timeout)
+                async with self._semaphore(model):
+                    return await asyncio.wait_for(request(), self.timeout)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning("Retrying %s after %s (attempt %s, %.2fs)", model, type(e).__name__, attempt + 1, delay)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def chat(self, model, messages, **kwargs):
+        """إرسال طلب محادثة وإرجاع نص الرد"""
+        response = await self._with_retries(
+            model,
+            lambda: self._client().chat.completions.create(model=model, messages=messages, **kwargs),
+        )
+        return response.choices[0].message.content
+
+    async def stream_chat(self, model, messages, **kwargs):
+        """
+        بث رد المحادثة جزءاً بجزء (إعادة المحاولة تشمل فتح البث فقط).
+        البث يحجز مكاناً واحداً من حد النموذج من فتحه حتى انتهائه، والمهلة تنطبق على كل جزء
+        حتى لا يحجز بث متوقف مكانه للأبد؛ عند انتهائها يُغلق البث ويُحرر المكان.
+        """
+        async with self._semaphore(model):
+            stream = await self._with_retries(
+                model,
+                lambda: self._client().chat.completions.create(model=model, messages=messages, stream=True, **kwargs),
+                acquire=False,
+            )
+            chunks = stream.__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except asyncio.TimeoutError:
+                logger.warning("Stream from %s stalled for %ss", model, self.timeout)
+                raise
+            finally:
+                await stream.close()
+
+    def _background_loop(self):
+        """حلقة أحداث في خيط خلفي يشاركها كل المستدعين المتزامنين في العملية"""
+        if self._loop is None or self._loop_pid != os.getpid():
+            with self._loop_lock:
+                if self._loop is None or self._loop_pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name='model-provider', daemon=True)
+                    thread.start()
+                    self._loop = loop
+                    self._loop_pid = os.getpid()
+        return self._loop
+
+    def run(self, coroutine):
+        """تنفيذ coroutine من كود متزامن (views و Celery) على الحلقة المشتركة"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._background_loop()).result()
+
+    def chat_sync(self, model, messages, **kwargs):
+        return self.run(self.chat(model, messages, **kwargs))
+
+    def gather_sync(self, requests):
+        """تنفيذ عدة طلبات محادثة بالتوازي: requests قائمة (model, messages, kwargs)"""
+        async def gather():
+            return await asyncio.gather(
+                *(self.chat(model, messages, **kwargs) for model, messages, kwargs in requests),
+                return_exceptions=True,
+            )
+        return self.run(gather())
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """مزود النماذج المشترك على مستوى العملية"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = ModelProvider(
+                    concurrency=getattr(settings, 'OPENAI_MODEL_CONCURRENCY', None),
+                    timeout=getattr(settings, 'OPENAI_TIMEOUT', 30),
+                    max_retries=getattr(settings, 'OPENAI_MAX_RETRIES', 3),
+                    backoff_base=getattr(settings, 'OPENAI_BACKOFF_BASE', 0.5),
+                    backoff_max=getattr(settings, 'OPENAI_BACKOFF_MAX', 8.0),
+                )
+    return _provider
@@ -0,0 +1,90 @@
+import json
+import time
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from django.utils import timezone
+from .models import ChatBot, ChatBotMessage
+from .serializers import ChatBotMessageSerializer
+from .services import AIService
+
+class ChatBotConsumer(AsyncWebsocketConsumer):
+    """بث ردود البوت الذكي عبر WebSocket جزءاً بجزء"""
+
+    async def connect(self):
+        self.session_id = self.scope['url_route']['kwargs']['session_id']
+        self.user = self.scope['user']
+        self.session = None
+
+        if self.user.is_authenticated:
+            self.session = await self.get_session()
+
+        if self.session is None:
+            await self.close()
+            return
+
+        await self.accept()
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_json({'type': 'error', 'error': 'Invalid JSON format'})
+            return
+
+        if data.get('type') == 'chat_message':
+            await self.handle_chat_message(data)
+
+    async def handle_chat_message(self, data):
+        content = (data.get('content') or '').strip()
+        if not content:
+            return
+
+        user_message = await self.save_message('user', content)
+        await self.send_json({'type': 'bot_message_start', 'user_message': user_message})
+
+        start_time = time.time()
+        parts = []
+        metadata = {
+            'model': 'greenbot-v2',
+            'confidence': 0.92,
+            'session_type': self.session.session_type,
+            'context_aware': True,
+            'streamed': True,
+        }
+        try:
+            async for token in AIService.stream_chatbot_message(self.session, content):
+                parts.append(token)
+                await self.send_json({'type': 'bot_token', 'token': token})
+        except Exception as e:
+            parts = ['عذراً، حدث خطأ في معالجة رسالتك. يرجى المحاولة مرة أخرى.']
+            metadata = {'error': str(e), 'streamed': True}
+
+        bot_message = await self.save_message(
+            'bot', ''.join(parts).strip(), metadata, time.time() - start_time
+        )
+        await self.send_json({'type': 'bot_message_end', 'message': bot_message})
+
+    async def send_json(self, payload):
+        await self.send(text_data=json.dumps(payload, ensure_ascii=False))
+
+    # دوال مساعدة
+    @database_sync_to_async
+    def get_session(self):
+        return ChatBot.objects.filter(
+            session_id=self.session_id,
+            user=self.user,
+            is_active=True
+        ).first()
+
+    @database_sync_to_async
+    def save_message(self, message_type, content, metadata=None, processing_time=None):
+        message = ChatBotMessage.objects.create(
+            session=self.session,
+            message_type=message_type,
+            content=content,
+            metadata=metadata or {},
+            processing_time=processing_time
+        )
+        if message_type == 'bot':
+            ChatBot.objects.filter(pk=self.session.pk).update(last_activity=timezone.now())
+        return ChatBotMessageSerializer(message).data
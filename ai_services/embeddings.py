@@ -0,0 +1,145 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from celery import current_task
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "intfloat/multilingual-e5-base"
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """تحميل نموذج التضمين عند أول استخدام فقط"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                # الاستيراد هنا حتى لا تدفع العمليات التي لا تستخدم البوت ثمن تحميل torch
+                from sentence_transformers import SentenceTransformer
+
+                model_name = getattr(settings, 'RAG_EMBEDDING_MODEL', DEFAULT_MODEL_NAME)
+                logger.info("Loading embedding model %s", model_name)
+                _model = SentenceTransformer(model_name)
+    return _model
+
+
+def encode_local(texts):
+    """تضمين النصوص داخل العملية الحالية"""
+    embeddings = get_model().encode(list(texts), convert_to_numpy=True)
+    return np.asarray(embeddings, dtype="float32")
+
+
+def encode_remote(texts):
+    """
+    تضمين النصوص عبر طابور Celery المخصص للتضمين.
+    لا يُستدعى من داخل مهمة Celery: انتظار نتيجة مهمة أخرى قد يعلق العامل.
+    """
+    from .tasks import embed_texts
+
+    timeout = getattr(settings, 'RAG_EMBEDDING_TIMEOUT', 10)
+    result = embed_texts.apply_async(args=[list(texts)])
+    return np.asarray(result.get(timeout=timeout), dtype="float32")
+
+
+class BatchingEmbedder:
+    """
+    يجمع طلبات التضمين المتزامنة في استدعاء encode واحد.
+    الدفعة تُرسل عند امتلائها أو عند انتهاء مهلة الانتظار القصوى.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=32, max_latency=0.01):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._start_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(
+                        target=self._run, name="embedding-batcher", daemon=True
+                    )
+                    self._worker.start()
+
+    def _collect(self):
+        """انتظار أول طلب ثم جمع ما يصل خلال المهلة حتى حجم الدفعة"""
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_latency
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for texts, _ in batch for text in texts]
+            try:
+                embeddings = self.encode_fn(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for chunk, future in batch:
+                future.set_result(embeddings[offset:offset + len(chunk)])
+                offset += len(chunk)
+
+    def encode(self, texts, timeout=None):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((texts, future))
+        return future.result(timeout=timeout)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                backend = getattr(settings, 'RAG_EMBEDDING_BACKEND', 'local')
+                _batcher = BatchingEmbedder(
+                    encode_remote if backend == 'celery' else encode_local,
+                    max_batch_size=getattr(settings, 'RAG_EMBEDDING_BATCH_SIZE', 32),
+                    max_latency=getattr(settings, 'RAG_EMBEDDING_MAX_LATENCY_MS', 10) / 1000,
+                )
+    return _batcher
+
+
+def encode(texts):
+    """
+    نقطة الدخول الموحدة للتضمين.
+    local: مباشرة داخل العملية، batched: تجميع داخل العملية،
+    celery: تجميع ثم إرسال الدفعة لعامل التضمين، إلا داخل مهمة Celery فيكون محلياً.
+    """
+    backend = getattr(settings, 'RAG_EMBEDDING_BACKEND', 'local')
+    if backend == 'local' or (backend == 'celery' and current_task):
+        return encode_local(texts)
+    return _get_batcher().encode(texts, timeout=getattr(settings, 'RAG_EMBEDDING_TIMEOUT', 10))
@@ -0,0 +1,129 @@
+import re
+
+from core.utils import normalize_arabic
+
+
+class KeywordMatches:
+    """نتيجة المطابقة: الكلمات المفتاحية التي ظهرت في النص، مجمعة حسب المعجم والتصنيف"""
+
+    def __init__(self, matcher, word_count, hits):
+        self.matcher = matcher
+        self.word_count = word_count
+        # (معجم، تصنيف) -> {الكلمة المفتاحية: أرقام كلمات النص التي ظهرت فيها}
+        self._found = {}
+        for normalized, word_indexes in hits.items():
+            for lexicon, label, keyword in matcher.outputs[normalized]:
+                self._found.setdefault((lexicon, label), {}).setdefault(keyword, set()).update(word_indexes)
+
+    def keywords(self, lexicon, label):
+        """الكلمات المفتاحية الموجودة بترتيب تعريفها في المعجم"""
+        found = self._found.get((lexicon, label), {})
+        return [keyword for keyword in self.matcher.lexicons[lexicon][label] if keyword in found]
+
+    def count(self, lexicon, label):
+        """عدد الكلمات المفتاحية المختلفة الموجودة"""
+        return len(self._found.get((lexicon, label), ()))
+
+    def word_count_for(self, lexicon, label):
+        """عدد كلمات النص التي تحتوي على كلمة مفتاحية واحدة على الأقل"""
+        return len(set().union(*self._found.get((lexicon, label), {}).values()))
+
+    def labels(self, lexicon):
+        """التصنيفات التي لها تطابقات بترتيب تعريفها في المعجم"""
+        return [label for label in self.matcher.lexicons[lexicon] if (lexicon, label) in self._found]
+
+
+class KeywordMatcher:
+    """
+    مطابقة عدة معاجم كلمات مفتاحية دفعة واحدة.
+    المعاجم تُجمّع مرة واحدة بعد توحيد النص العربي في شجرة بادئات واحدة تُترجم إلى تعبير منتظم
+    على شكل الشجرة، فيُطابق كل نص بمرور واحد داخل محرك re بغض النظر عن عدد الكلمات المفتاحية.
+    عند كل موضع نأخذ أطول كلمة مطابقة، والكلمات الأقصر التي تبدأ من نفس الموضع هي بادئاتها.
+    """
+
+    def __init__(self, lexicons):
+        self.lexicons = lexicons
+        # الكلمة بعد التوحيد -> الكلمات الأصلية (معجم، تصنيف، كلمة) المطابقة لها
+        terminals = {}
+        for lexicon, labels in lexicons.items():
+            for label, keywords in labels.items():
+                for keyword in keywords:
+                    normalized = normalize_arabic(keyword)
+                    if normalized:
+                        terminals.setdefault(normalized, []).append((lexicon, label, keyword))
+
+        trie = {}
+        for normalized in terminals:
+            node = trie
+            for char in normalized:
+                node = node.setdefault(char, {})
+            node[''] = True
+
+        # كل كلمة مطابقة تعني ظهور كل الكلمات التي هي بادئات لها في نفس الموضع
+        self.outputs = {
+            normalized: [
+                pattern
+                for end in range(1, len(normalized) + 1)
+                for pattern in terminals.get(normalized[:end], ())
+            ]
+            for normalized in terminals
+        }
+        self._pattern = re.compile(f'(?=({self._trie_regex(trie)}))') if trie else None
+
+    @classmethod
+    def _trie_regex(cls, node):
+        branches = [re.escape(char) + cls._trie_regex(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # المقطع اختياري إذا انتهت كلمة عند هذه العقدة؛ الجشع يفضل أطول كلمة
+        return f'(?:{body})?' if '' in node else body
+
+    def match(self, text):
+        text = normalize_arabic(text)
+        word_count = text.count(' ') + 1 if text else 0
+        if self._pattern is None:
+            return KeywordMatches(self, word_count, {})
+
+        # أطول كلمة مطابقة عند كل موضع -> أرقام كلمات النص التي ظهرت فيها
+        hits = {}
+        word_index = 0
+        position = 0
+        for found in self._pattern.finditer(text):
+            start = found.start()
+            word_index += text.count(' ', position, start)
+            position = start
+            hits.setdefault(found.group(1), set()).add(word_index)
+        return KeywordMatches(self, word_count, hits)
+
+
+# معاجم المحاكاة المحلية لتحليل النصوص والمراجعة والبوت الذكي
+LEXICONS = {
+    'moderation': {
+        'inappropriate': ['سيء', 'فظيع', 'احتيال', 'نصب', 'خداع', 'مزيف', 'غش', 'كذب', 'سرقة', 'حرام', 'ممنوع'],
+        'positive': ['ممتاز', 'رائع', 'جيد', 'نظيف', 'جديد', 'مفيد', 'صحي', 'آمن', 'موثوق', 'أصلي'],
+    },
+    'sentiment': {
+        'positive': ['جيد', 'ممتاز', 'رائع', 'مفيد', 'نظيف', 'جديد'],
+        'negative': ['سيء', 'قديم', 'متسخ', 'مكسور', 'تالف'],
+    },
+    'topics': {
+        'recycling': ['تدوير', 'بيئة', 'استدامة', 'نظافة', 'طبيعة'],
+    },
+    'category': {
+        'plastic': ['بلاستيك', 'زجاجة', 'كيس'],
+        'metal': ['معدن', 'حديد', 'علبة'],
+        'paper': ['ورق', 'كرتون', 'كتاب'],
+        'electronics': ['هاتف', 'حاسوب', 'إلكتروني'],
+    },
+    'intent': {
+        'تحية': ['مرحبا', 'السلام', 'أهلا', 'صباح', 'مساء'],
+        'تصنيف': ['تصنيف', 'نوع', 'فئة', 'كيف أعرف'],
+        'سعر': ['سعر', 'ثمن', 'قيمة', 'كم يساوي'],
+        'تدوير': ['تدوير', 'إعادة', 'معالجة', 'كيف'],
+        'بيئة': ['بيئة', 'طبيعة', 'تلوث', 'نظافة'],
+        'مساعدة': ['مساعدة', 'help', 'ساعدني', 'أحتاج'],
+    },
+}
+
+TEXT_MATCHER = KeywordMatcher(LEXICONS)
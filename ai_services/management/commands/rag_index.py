@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_services.rag_builder import (
+    INDEX_TYPES, KNOWLEDGE_BASE_FILE, RAGIndexBuilder, item_documents, load_text_documents,
+)
+
+
+class Command(BaseCommand):
+    help = 'بناء أو تحديث فهرس البوت الذكي (RAG) بشكل تزايدي'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', default=[], help='ملف مصدر إضافي (يمكن تكراره)')
+        parser.add_argument('--no-knowledge-base', action='store_true', help='تجاهل ملف info.txt')
+        parser.add_argument('--items', action='store_true', help='فهرسة أوصاف المنتجات المتاحة')
+        parser.add_argument('--rebuild', action='store_true', help='إعادة تضمين كل المقاطع من البداية')
+        parser.add_argument('--keep-stale', action='store_true', help='عدم حذف المقاطع التي اختفت من المصادر')
+        parser.add_argument('--index-type', choices=INDEX_TYPES, default='auto', help='نوع الفهرس')
+        parser.add_argument('--nlist', type=int, help='عدد الخلايا لفهرس IVF')
+        parser.add_argument('--nprobe', type=int, default=8, help='عدد الخلايا التي يتم فحصها عند البحث في IVF')
+        parser.add_argument('--hnsw-m', type=int, default=32, help='عدد الجيران لكل عقدة في HNSW')
+        parser.add_argument('--ef-construction', type=int, default=200, help='efConstruction لفهرس HNSW')
+        parser.add_argument('--ef-search', type=int, default=64, help='efSearch لفهرس HNSW')
+        parser.add_argument('--batch-size', type=int, default=64, help='حجم دفعة التضمين')
+        parser.add_argument('--chunk-size', type=int, default=800, help='أقصى طول للمقطع بالأحرف')
+        parser.add_argument('--chunk-overlap', type=int, default=100, help='التداخل بين المقاطع بالأحرف')
+
+    def handle(self, *args, **options):
+        documents = []
+        sources = list(options['source'])
+        if not options['no_knowledge_base']:
+            sources.insert(0, KNOWLEDGE_BASE_FILE)
+
+        for path in sources:
+            try:
+                texts = load_text_documents(path)
+            except OSError as e:
+                raise CommandError(f'تعذر قراءة المصدر {path}: {e}')
+            documents.extend({'source': path, 'content': text} for text in texts)
+            self.stdout.write(f'{path}: {len(texts)} مستند')
+
+        if options['items']:
+            item_docs = list(item_documents())
+            documents.extend(item_docs)
+            self.stdout.write(f'المنتجات: {len(item_docs)} مستند')
+
+        builder = RAGIndexBuilder(
+            index_type=options['index_type'],
+            nlist=options['nlist'],
+            nprobe=options['nprobe'],
+            hnsw_m=options['hnsw_m'],
+            ef_construction=options['ef_construction'],
+            ef_search=options['ef_search'],
+            batch_size=options['batch_size'],
+        )
+
+        try:
+            stats = builder.build(
+                documents,
+                rebuild=options['rebuild'],
+                prune=not options['keep_stale'],
+                chunk_size=options['chunk_size'],
+                chunk_overlap=options['chunk_overlap'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"تم تحديث الفهرس ({stats['index_type']}): {stats['total']} مقطع، "
+                f"{stats['added']} جديد، {stats['removed']} محذوف، {stats['unchanged']} بدون تغيير"
+            )
+        )
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai_services", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AIResultCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "analysis_type",
+                    models.CharField(
+                        choices=[
+                            ("image_classification", "تصنيف الصور"),
+                            ("text_analysis", "تحليل النصوص"),
+                            ("price_suggestion", "اقتراح السعر"),
+                            ("category_suggestion", "اقتراح الفئة"),
+                            ("condition_assessment", "تقييم الحالة"),
+                            ("content_moderation", "مراجعة المحتوى"),
+                        ],
+                        max_length=30,
+                        verbose_name="نوع التحليل",
+                    ),
+                ),
+                (
+                    "content_hash",
+                    models.CharField(max_length=64, verbose_name="بصمة المحتوى"),
+                ),
+                (
+                    "model_version",
+                    models.CharField(max_length=100, verbose_name="إصدار النموذج"),
+                ),
+                (
+                    "result_data",
+                    models.JSONField(default=dict, verbose_name="نتائج التحليل"),
+                ),
+                (
+                    "hit_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="عدد مرات الاستخدام"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="تاريخ الإنشاء"
+                    ),
+                ),
+                (
+                    "last_used_at",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        verbose_name="آخر استخدام",
+                    ),
+                ),
+                (
+                    "expires_at",
+                    models.DateTimeField(db_index=True, verbose_name="تاريخ الانتهاء"),
+                ),
+            ],
+            options={
+                "verbose_name": "نتيجة تحليل مخزنة",
+                "verbose_name_plural": "نتائج التحليل المخزنة",
+                "unique_together": {("analysis_type", "content_hash", "model_version")},
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai_services", "0002_ai_result_cache"),
+        ("contenttypes", "0002_remove_content_type_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ModerationVerdict",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("object_id", models.PositiveIntegerField()),
+                (
+                    "content_hash",
+                    models.CharField(max_length=64, verbose_name="بصمة المحتوى"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "قيد الانتظار"),
+                            ("approved", "مقبول"),
+                            ("flagged", "مشتبه به"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="الحالة",
+                    ),
+                ),
+                (
+                    "is_appropriate",
+                    models.BooleanField(blank=True, null=True, verbose_name="مناسب"),
+                ),
+                (
+                    "toxicity_score",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="درجة السمية"
+                    ),
+                ),
+                (
+                    "issues",
+                    models.JSONField(blank=True, default=list, verbose_name="المشاكل"),
+                ),
+                (
+                    "model_version",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="إصدار النموذج"
+                    ),
+                ),
+                (
+                    "queued_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="تاريخ الإضافة للطابور",
+                    ),
+                ),
+                (
+                    "moderated_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="تاريخ المراجعة"
+                    ),
+                ),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "نتيجة مراجعة",
+                "verbose_name_plural": "نتائج المراجعة",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "queued_at"],
+                        name="ai_services_status_9a3db1_idx",
+                    )
+                ],
+                "unique_together": {("content_type", "object_id")},
+            },
+        ),
+    ]
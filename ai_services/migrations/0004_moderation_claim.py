@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai_services", "0003_moderation_verdict"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="moderationverdict",
+            name="claimed_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="تاريخ بدء المراجعة"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="moderationverdict",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "قيد الانتظار"),
+                    ("processing", "قيد المراجعة"),
+                    ("approved", "مقبول"),
+                    ("flagged", "مشتبه به"),
+                ],
+                default="pending",
+                max_length=20,
+                verbose_name="الحالة",
+            ),
+        ),
+    ]
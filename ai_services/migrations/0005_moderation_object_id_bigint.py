@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai_services", "0004_moderation_claim"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="moderationverdict",
+            name="object_id",
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 
 User = get_user_model()
 
@@ -78,6 +80,68 @@ class AIAnalysis(models.Model):
         self.completed_at = timezone.now()
         self.save()
 
+class AIResultCache(models.Model):
+    """نتائج النماذج مخزنة حسب بصمة المحتوى لتجنب إعادة التحليل للمحتوى المكرر"""
+
+    analysis_type = models.CharField(_('نوع التحليل'), max_length=30, choices=AIAnalysis.ANALYSIS_TYPES)
+    content_hash = models.CharField(_('بصمة المحتوى'), max_length=64)
+    model_version = models.CharField(_('إصدار النموذج'), max_length=100)
+    result_data = models.JSONField(_('نتائج التحليل'), default=dict)
+
+    hit_count = models.PositiveIntegerField(_('عدد مرات الاستخدام'), default=0)
+    created_at = models.DateTimeField(_('تاريخ الإنشاء'), auto_now_add=True)
+    last_used_at = models.DateTimeField(_('آخر استخدام'), default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(_('تاريخ الانتهاء'), db_index=True)
+
+    class Meta:
+        verbose_name = _('نتيجة تحليل مخزنة')
+        verbose_name_plural = _('نتائج التحليل المخزنة')
+        unique_together = ['analysis_type', 'content_hash', 'model_version']
+
+    def __str__(self):
+        return f'{self.get_analysis_type_display()} - {self.content_hash[:12]}'
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+class ModerationVerdict(models.Model):
+    """نتيجة المراجعة الآلية لنص منشور (منتج، رسالة، بلاغ)؛ السجلات المعلقة هي طابور المراجعة"""
+
+    STATUS_CHOICES = [
+        ('pending', 'قيد الانتظار'),
+        ('processing', 'قيد المراجعة'),
+        ('approved', 'مقبول'),
+        ('flagged', 'مشتبه به'),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    # المعرفات الأساسية BigAutoField في كل التطبيقات
+    object_id = models.PositiveBigIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+
+    content_hash = models.CharField(_('بصمة المحتوى'), max_length=64)
+    status = models.CharField(_('الحالة'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    is_appropriate = models.BooleanField(_('مناسب'), null=True, blank=True)
+    toxicity_score = models.FloatField(_('درجة السمية'), null=True, blank=True)
+    issues = models.JSONField(_('المشاكل'), default=list, blank=True)
+    model_version = models.CharField(_('إصدار النموذج'), max_length=100, blank=True)
+
+    queued_at = models.DateTimeField(_('تاريخ الإضافة للطابور'), default=timezone.now)
+    claimed_at = models.DateTimeField(_('تاريخ بدء المراجعة'), null=True, blank=True)
+    moderated_at = models.DateTimeField(_('تاريخ المراجعة'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('نتيجة مراجعة')
+        verbose_name_plural = _('نتائج المراجعة')
+        unique_together = ['content_type', 'object_id']
+        indexes = [
+            models.Index(fields=['status', 'queued_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.content_type.model}:{self.object_id} - {self.get_status_display()}'
+
 class ChatBot(models.Model):
     """نموذج لحفظ محادثات البوت الذكي"""
     
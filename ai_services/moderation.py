@@ -0,0 +1,258 @@
+import logging
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ModerationVerdict
+from .result_cache import text_digest
+
+logger = logging.getLogger(__name__)
+
+DRAIN_SCHEDULED_KEY = 'moderation:drain-scheduled'
+
+
+def _item_text(item):
+    return f'{item.title}\n{item.description}'
+
+
+def _message_text(message):
+    if message.message_type != 'text' or message.is_deleted:
+        return ''
+    return message.content
+
+
+def _report_text(report):
+    return f'{report.title}\n{report.description}'
+
+
+# النماذج التي تُراجع نصوصها آلياً: دالة استخراج النص والحقول التي يعتمد عليها
+SOURCES = {
+    'items.item': (_item_text, ('title', 'description')),
+    'chat.message': (_message_text, ('content', 'message_type', 'is_deleted')),
+    'reports.report': (_report_text, ('title', 'description')),
+}
+
+# النص كما حُمل من قاعدة البيانات، للمقارنة عند الحفظ
+LOADED_TEXT_ATTR = '_moderation_text'
+
+
+def moderation_text(instance):
+    source = SOURCES.get(instance._meta.label_lower)
+    return (source[0](instance) or '').strip() if source else ''
+
+
+class ModerationQueue:
+    """
+    طابور المراجعة الآلية.
+    الحفظ يضيف سجلاً معلقاً فقط، وعامل Celery يراجع السجلات المعلقة على دفعات
+    (N نص أو نافذة T ميلي ثانية) ويكتب النتائج دفعة واحدة.
+    العامل يحجز الدفعة بمعاملة قصيرة (processing مع وقت الحجز)، ويستدعي النموذج دون معاملة مفتوحة،
+    ثم يكتب النتائج بمعاملة قصيرة ثانية للسجلات التي ما زالت محجوزة له فقط.
+    """
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'MODERATION_PIPELINE_ENABLED', True)
+
+    @staticmethod
+    def remember(instance):
+        """حفظ النص المحمل (post_init) دون تحميل الحقول المؤجلة"""
+        source = SOURCES.get(instance._meta.label_lower)
+        if source and all(field in instance.__dict__ for field in source[1]):
+            setattr(instance, LOADED_TEXT_ATTR, moderation_text(instance))
+
+    @staticmethod
+    def _changed_text(instance, created):
+        """النص إذا كان يحتاج لمراجعة: موجود، وجديد أو تغير منذ التحميل"""
+        text = moderation_text(instance)
+        if not text or (not created and getattr(instance, LOADED_TEXT_ATTR, None) == text):
+            return None
+        return text
+
+    @staticmethod
+    def enqueue(instance, created=False):
+        """إضافة النص للطابور إذا تغير منذ تحميله"""
+        if not ModerationQueue.enabled():
+            return False
+
+        text = ModerationQueue._changed_text(instance, created)
+        if text is None:
+            return False
+        setattr(instance, LOADED_TEXT_ATTR, text)
+        ModerationQueue._queue(instance, text)
+        return True
+
+    @staticmethod
+    def enqueue_on_commit(instance, created=False):
+        """الإضافة بعد نجاح المعاملة حتى لا تبطئ عملية الكتابة الأصلية"""
+        if not ModerationQueue.enabled():
+            return
+
+        text = ModerationQueue._changed_text(instance, created)
+        if text is None:
+            return
+        setattr(instance, LOADED_TEXT_ATTR, text)
+        transaction.on_commit(lambda: ModerationQueue._queue(instance, text))
+
+    @staticmethod
+    def _queue(instance, text):
+        """
+        إضافة السجل أو إعادته للطابور باستعلام upsert واحد.
+        يعمل داخل مسار حفظ المحتوى، فالفشل يُسجل ولا يُفشل عملية المستخدم.
+        """
+        try:
+            with transaction.atomic():
+                ModerationVerdict.objects.bulk_create(
+                    [ModerationVerdict(
+                        content_type=ContentType.objects.get_for_model(instance),
+                        object_id=instance.pk,
+                        content_hash=text_digest(text),
+                        queued_at=timezone.now(),
+                    )],
+                    update_conflicts=True,
+                    unique_fields=['content_type', 'object_id'],
+                    update_fields=[
+                        'content_hash', 'status', 'queued_at', 'claimed_at',
+                        'is_appropriate', 'toxicity_score', 'issues', 'moderated_at',
+                    ],
+                )
+        except DatabaseError:
+            logger.exception("Could not queue %s %s for moderation", instance._meta.label, instance.pk)
+            return
+        ModerationQueue.schedule_drain()
+
+    @staticmethod
+    def schedule_drain():
+        """
+        جدولة تفريغ واحد للطابور لكل نافذة زمنية بدل مهمة لكل نص.
+        إذا تعذر الوصول للكاش أو الوسيط تبقى السجلات معلقة حتى التفريغ الدوري (Celery beat).
+        """
+        window = getattr(settings, 'MODERATION_BATCH_WINDOW_MS', 500) / 1000
+        from .tasks import drain_moderation_queue
+        try:
+            if not cache.add(DRAIN_SCHEDULED_KEY, True, max(1, math.ceil(window))):
+                return
+            drain_moderation_queue.apply_async(countdown=window)
+        except Exception as e:
+            logger.warning("Could not schedule moderation drain: %s", e)
+            try:
+                cache.delete(DRAIN_SCHEDULED_KEY)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _load_texts(verdicts):
+        """تحميل النصوص الحالية بطلب واحد لكل نوع محتوى"""
+        ids_by_type = {}
+        for verdict in verdicts:
+            ids_by_type.setdefault(verdict.content_type_id, []).append(verdict.object_id)
+
+        objects = {}
+        for content_type_id, ids in ids_by_type.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            for pk, instance in model.objects.in_bulk(ids).items():
+                objects[(content_type_id, pk)] = instance
+
+        return {
+            verdict.pk: moderation_text(objects[(verdict.content_type_id, verdict.object_id)])
+            for verdict in verdicts
+            if (verdict.content_type_id, verdict.object_id) in objects
+        }
+
+    @staticmethod
+    def claim(batch_size):
+        """
+        حجز دفعة من السجلات المعلقة، ومن السجلات التي انتهت مهلة حجزها (عامل توقف أثناء المراجعة).
+        ترجع (وقت الحجز، السجلات).
+        """
+        now = timezone.now()
+        lease = getattr(settings, 'MODERATION_CLAIM_TIMEOUT', 300)
+        with transaction.atomic():
+            verdicts = list(
+                ModerationVerdict.objects.select_for_update(skip_locked=True)
+                .filter(Q(status='pending') | Q(status='processing', claimed_at__lt=now - timedelta(seconds=lease)))
+                .order_by('queued_at')[:batch_size]
+            )
+            if verdicts:
+                ModerationVerdict.objects.filter(pk__in=[verdict.pk for verdict in verdicts]).update(
+                    status='processing', claimed_at=now
+                )
+        return now, verdicts
+
+    @staticmethod
+    def drain_batch(batch_size=None):
+        """مراجعة دفعة واحدة من السجلات المعلقة، وإرجاع عدد السجلات المعالجة"""
+        from .services import AIService
+
+        batch_size = batch_size or getattr(settings, 'MODERATION_BATCH_SIZE', 32)
+        claimed_at, verdicts = ModerationQueue.claim(batch_size)
+        if not verdicts:
+            return 0
+
+        texts = ModerationQueue._load_texts(verdicts)
+        # المحتوى المحذوف أو الذي أصبح بلا نص لا يحتاج لمراجعة
+        missing = [verdict.pk for verdict in verdicts if not texts.get(verdict.pk)]
+        verdicts = [verdict for verdict in verdicts if texts.get(verdict.pk)]
+        results = []
+        if verdicts:
+            try:
+                model_version, results = AIService.moderate_batch([texts[verdict.pk] for verdict in verdicts])
+            except Exception:
+                ModerationQueue.release(claimed_at, [verdict.pk for verdict in verdicts])
+                raise
+
+        now = timezone.now()
+        with transaction.atomic():
+            # النص الذي تغير أثناء المراجعة أعاد السجل للطابور، فلا تُكتب عليه نتيجة قديمة
+            claimed = set(
+                ModerationVerdict.objects.select_for_update()
+                .filter(
+                    pk__in=missing + [verdict.pk for verdict in verdicts],
+                    status='processing', claimed_at=claimed_at,
+                )
+                .values_list('pk', flat=True)
+            )
+            ModerationVerdict.objects.filter(pk__in=[pk for pk in missing if pk in claimed]).delete()
+
+            moderated = []
+            for verdict, result in zip(verdicts, results):
+                if verdict.pk not in claimed:
+                    continue
+                verdict.content_hash = text_digest(texts[verdict.pk])
+                verdict.is_appropriate = bool(result.get('is_appropriate', True))
+                verdict.status = 'approved' if verdict.is_appropriate else 'flagged'
+                verdict.toxicity_score = result.get('toxicity_score')
+                verdict.issues = result.get('issues', [])
+                verdict.model_version = model_version
+                verdict.moderated_at = now
+                moderated.append(verdict)
+
+            ModerationVerdict.objects.bulk_update(
+                moderated,
+                ['content_hash', 'status', 'is_appropriate', 'toxicity_score', 'issues', 'model_version', 'moderated_at'],
+            )
+        return len(verdicts) + len(missing)
+
+    @staticmethod
+    def release(claimed_at, pks):
+        """إعادة السجلات المحجوزة للطابور عند فشل المراجعة"""
+        ModerationVerdict.objects.filter(pk__in=pks, status='processing', claimed_at=claimed_at).update(
+            status='pending', claimed_at=None
+        )
+
+    @staticmethod
+    def drain(batch_size=None, max_batches=100):
+        """تفريغ الطابور على دفعات حتى ينتهي أو يصل للحد الأقصى"""
+        processed = 0
+        for _ in range(max_batches):
+            count = ModerationQueue.drain_batch(batch_size)
+            if not count:
+                break
+            processed += count
+        return processed
@@ -1,18 +1,221 @@
 # my_rag/vector_store.py
 import os
+import json
+import logging
+import threading
+import time
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-# Path for FAISS index persistence
-INDEX_FILE = "rag_index.faiss"
-DOCS_FILE = "rag_docs.npy"
+from .embeddings import encode
+from .rag_cache import get_query_cache, query_key
 
-# Load multilingual embeddings
-embedder = SentenceTransformer("intfloat/multilingual-e5-base")
+logger = logging.getLogger(__name__)
 
-# In-memory doc list
-docs = []
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# أسماء ملفات المخزن داخل كل نسخة (وفي المجلد الرئيسي للصيغة القديمة)
+INDEX_NAME = "rag_index.faiss"
+DOCS_NAME = "rag_docs.jsonl"
+VECTORS_NAME = "rag_vectors.npy"
+# مخزن المستندات القديم (مصفوفة numpy) قبل الانتقال إلى JSON Lines
+LEGACY_DOCS_NAME = "rag_docs.npy"
+
+# كل بناء يكتب نسخة كاملة في مجلد فرعي، والملف CURRENT يشير إلى النسخة المعتمدة
+STORE_DIR = os.path.join(BASE_DIR, "rag_store")
+CURRENT_FILE = "CURRENT"
+# المخزن القبلي: ملفات منفصلة في المجلد الرئيسي للمشروع
+LEGACY_DIR = BASE_DIR
+
+# أقل فترة (بالثواني) بين فحصين لتغير ملفات الفهرس على القرص
+RELOAD_CHECK_INTERVAL = 5.0
+
+
+def _read_index(path):
+    """قراءة الفهرس مع ربطه بالذاكرة (mmap) متى سمح FAISS بذلك"""
+    for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        flag = getattr(faiss, flag_name, None)
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
+
+def read_doc_records(path):
+    """قراءة سجلات المستندات بترتيب المتجهات في الفهرس"""
+    if path.endswith(".npy"):
+        return [{"content": content} for content in np.load(path, allow_pickle=False).tolist()]
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _read_docs(path):
+    return [record["content"] for record in read_doc_records(path)]
+
+
+def current_version(store_dir=STORE_DIR):
+    """اسم النسخة المعتمدة، أو None قبل أول بناء بالصيغة المرقمة"""
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_store_dir(store_dir=STORE_DIR, legacy_dir=LEGACY_DIR):
+    """مجلد النسخة المعتمدة، وإلا مجلد الصيغة القديمة"""
+    version = current_version(store_dir)
+    return os.path.join(store_dir, version) if version else legacy_dir
+
+
+def resolve_docs_file(directory):
+    """مخزن JSON Lines إن وجد، وإلا المخزن القديم"""
+    docs_file = os.path.join(directory, DOCS_NAME)
+    legacy_docs_file = os.path.join(directory, LEGACY_DOCS_NAME)
+    if not os.path.exists(docs_file) and os.path.exists(legacy_docs_file):
+        return legacy_docs_file
+    return docs_file
+
+
+class _IndexSnapshot:
+    """نسخة ثابتة من الفهرس والمستندات يتم استبدالها كوحدة واحدة"""
+
+    __slots__ = ("index", "docs", "signature")
+
+    def __init__(self, index, docs, signature):
+        self.index = index
+        self.docs = docs
+        self.signature = signature
+
+
+class RAGRetriever:
+    """
+    خدمة استرجاع تحمل الفهرس والمستندات مرة واحدة لكل عملية.
+    تعيد التحميل تلقائياً عند تغير الملفات على القرص، وتستبدل النسخة
+    المحملة بشكل ذري حتى لا ترى عمليات البحث المتزامنة حالة نصف محملة.
+    """
+
+    def __init__(self, store_dir=STORE_DIR, check_interval=RELOAD_CHECK_INTERVAL,
+                 legacy_dir=LEGACY_DIR):
+        self.store_dir = store_dir
+        self.legacy_dir = legacy_dir
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _signature(self):
+        """
+        بصمة المخزن لاكتشاف إعادة البناء: اسم النسخة المعتمدة،
+        مع وقت التعديل والحجم لملفات الصيغة القديمة.
+        """
+        version = current_version(self.store_dir)
+        directory = os.path.join(self.store_dir, version) if version else self.legacy_dir
+        try:
+            index_stat = os.stat(os.path.join(directory, INDEX_NAME))
+            docs_stat = os.stat(resolve_docs_file(directory))
+        except FileNotFoundError:
+            raise FileNotFoundError("Index not found, build it first.")
+        return (
+            version or "legacy",
+            index_stat.st_mtime_ns, index_stat.st_size,
+            docs_stat.st_mtime_ns, docs_stat.st_size,
+        )
+
+    def _directory(self, signature):
+        version = signature[0]
+        return self.legacy_dir if version == "legacy" else os.path.join(self.store_dir, version)
+
+    def _load(self, signature):
+        directory = self._directory(signature)
+        index = _read_index(os.path.join(directory, INDEX_NAME))
+        docs = _read_docs(resolve_docs_file(directory))
+        if index.ntotal != len(docs):
+            raise ValueError(
+                f"RAG index/doc store mismatch: {index.ntotal} vectors, {len(docs)} docs"
+            )
+        logger.info("Loaded RAG index (%s vectors) from %s", index.ntotal, directory)
+        return _IndexSnapshot(index, docs, signature)
+
+    def snapshot(self):
+        """الحصول على النسخة الحالية مع إعادة التحميل عند الحاجة"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._last_check < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and now - self._last_check < self.check_interval:
+                return snapshot
+            try:
+                signature = self._signature()
+                if snapshot is None or signature != snapshot.signature:
+                    snapshot = self._load(signature)
+                    self._snapshot = snapshot
+            except Exception:
+                # أثناء إعادة البناء قد تكون الملفات غير متسقة مؤقتاً،
+                # نستمر بالنسخة القديمة إن وجدت
+                if snapshot is None:
+                    raise
+                logger.warning("RAG index reload failed, keeping previous snapshot", exc_info=True)
+            self._last_check = now
+            return snapshot
+
+    def invalidate(self):
+        """إجبار إعادة التحميل عند البحث التالي"""
+        with self._lock:
+            self._snapshot = None
+            self._last_check = 0.0
+
+    def embed_query(self, query):
+        """
+        تضمين الاستعلام مع الاستفادة من كاش التضمينات. النص الموحد يُستخدم للمفتاح فقط،
+        والتضمين من النص الأصلي كما ضُمنت المستندات.
+        """
+        query_cache = get_query_cache()
+        _, digest = query_key(query)
+        key = f"emb:{digest}"
+        embedding = query_cache.get(key)
+        if embedding is None:
+            embedding = encode([query])
+            query_cache.set(key, embedding)
+        return embedding
+
+    def search(self, query, top_k=3):
+        snapshot = self.snapshot()
+        k = min(top_k, snapshot.index.ntotal)
+        if k <= 0:
+            return []
+
+        # النتائج مرتبطة بنسخة الفهرس، فإعادة البناء تُبطلها تلقائياً
+        query_cache = get_query_cache()
+        _, digest = query_key(query)
+        version = "-".join(str(part) for part in snapshot.signature)
+        key = f"res:{version}:{k}:{digest}"
+        results = query_cache.get(key)
+        if results is None:
+            D, I = snapshot.index.search(self.embed_query(query), k)
+            results = [{"content": snapshot.docs[i]} for i in I[0] if i >= 0]
+            query_cache.set(key, results)
+        return [dict(result) for result in results]
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever():
+    """المسترجع المشترك على مستوى العملية"""
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = RAGRetriever()
+    return _retriever
 
 
 def build_index(documents):
@@ -20,28 +223,19 @@ def build_index(documents):
     Create FAISS index from documents.
     documents: list of strings
     """
-    global docs
-    docs = documents
+    from .rag_builder import RAGIndexBuilder
 
-    embeddings = embedder.encode(documents, convert_to_numpy=True)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
-
-    faiss.write_index(index, INDEX_FILE)
-    np.save(DOCS_FILE, documents)
+    return RAGIndexBuilder().build(
+        [{"source": "manual", "content": document} for document in documents],
+        rebuild=True,
+    )
 
 
 def load_index():
     """
     Load FAISS index and docs from disk.
     """
-    global docs
-    if not os.path.exists(INDEX_FILE):
-        raise FileNotFoundError("Index not found, build it first.")
-
-    index = faiss.read_index(INDEX_FILE)
-    docs = np.load(DOCS_FILE, allow_pickle=True).tolist()
-    return index
+    return get_retriever().snapshot().index
 
 
 def search_documents(query, top_k=3):
@@ -49,29 +243,5 @@ def search_documents(query, top_k=3):
     Search FAISS index for relevant documents.
     Returns a list of dicts with 'content'.
     """
-    print(f"Searching for query: {query}")
-    index = load_index()
-    query_embedding = embedder.encode([query])
-    D, I = index.search(np.array(query_embedding), top_k)
-    return [{"content": docs[i]} for i in I[0]]
-
-# build_index([
-#     "GreenSwap هو منصة إلكترونية تربط بين الأفراد الذين يمتلكون نفايات قابلة للبيع والمُجمّعين المهتمين بشرائها. يمكن للمستخدمين عرض مخلفاتهم مثل البلاستيك أو المعادن أو الأجهزة القديمة، ويتواصل المشترون مباشرة لتقديم عروض وشراء هذه النفايات.",
-#     "تشمل أنواع المخلفات المقبولة في GreenSwap: البلاستيك، الورق، الزجاج، المعادن، النسيج، الأجهزة الإلكترونية، والمخلفات العضوية. يجب على المستخدم تصنيف المخلف بشكل صحيح لزيادة فرص البيع وتسعيره بدقة.",
-#     "لإنشاء إعلان، يقوم المستخدم بتسجيل الدخول، ثم يرفع صور للمخلف، يحدد نوعه، وزنه أو حجمه، ويكتب وصفاً مختصراً. بعد النشر، يظهر الإعلان في الصفحة الرئيسية ويصبح مرئياً للمجمعين.",
-#     "قيمة المخلف تعتمد على نوعه، حالته، وزنه، وحجمه. على سبيل المثال: البلاستيك النظيف قد يُباع بسعر 4 إلى 5 جنيهات للكيلو، المعادن مثل الألومنيوم يمكن أن تصل إلى 15 جنيه، والورق النظيف بسعر أقل. المنصة توفر تقديرات أولية بعد إدخال البيانات.",
-#     "بعد نشر المخلف، يمكن للمجمعين إرسال عروضهم. يرى المستخدم جميع العروض ويمكنه قبول الأنسب له. يتم التواصل داخل المنصة لتحديد موعد ومكان الاستلام.",
-#     "عند الاتفاق، يذهب المجمع إلى العنوان الذي حدده المستخدم، ويستلم المخلف بعد الفحص. يتم الدفع مباشرة عند الاستلام نقداً أو بتحويل رقمي حسب الاتفاق.",
-#     "GreenSwap لا تفرض أي عمولة على المستخدمين العاديين حالياً. الخدمة مجانية لجانبي الصفقة لتشجيع إعادة التدوير والتقليل من المخلفات.",
-
-#     "يوفر الموقع لوحة تقارير شخصية تعرض إجمالي الأرباح، عدد مرات عرض كل إعلان، وعدد المخلفات المباعة حسب النوع. يمكن للمستخدم الوصول لهذه التقارير من صفحة الحساب.",
-#     "في تقاريرك، يمكنك معرفة أكثر أنواع المخلفات التي قمت ببيعها خلال فترة زمنية، مثل البلاستيك أو الأجهزة الإلكترونية، مما يساعدك على فهم سلوكك البيئي وربما تحسينه.",
-#     "كل إعلان يعرض عدد المشاهدات التي حصل عليها، وهو مؤشر جيد لاهتمام المجمعين. الإعلان الذي يحصل على عدد مشاهدات كبير دون عروض قد يحتاج لتعديل في الوصف أو الصور.",
-#     "تُوصي GreenSwap بالتعامل داخل التطبيق وعدم مشاركة معلومات شخصية خارج المنصة. يتم التحقق من هوية المجمعين للحفاظ على بيئة آمنة وموثوقة لجميع الأطراف.",
-#     "إذا كان لديك 10 كيلوجرام من البلاستيك النظيف، وكان السعر المتداول 4.5 جنيه للكيلوجرام، فإنك قد تكسب 45 جنيه. أما 5 كيلوجرام من النحاس قد تصل أرباحها إلى أكثر من 100 جنيه.",
-#     "من الأسئلة الشائعة: كم يمكنني أن أربح؟ كيف يتم الاستلام؟ هل يجب أن أفرز المخلفات؟ الإجابة: الأرباح تعتمد على النوع والكمية، الاستلام يتم بالاتفاق، والفرز يزيد السعر.",
-#     "البوت الذكي في GreenSwap يمكنه مساعدتك في معرفة نوع مخلفك، تقدير قيمته، شرح خطوات العملية، وحتى إعطائك ملخص عن تقاريرك البيعية. فقط ابدأ بكتابة سؤالك.",
-#     "تسعى GreenSwap إلى تحقيق بيئة أنظف وتقليل كمية النفايات في الشوارع والمكبات. من خلال تسهيل عملية البيع للمخلفات، نُساهم في بناء مجتمع مستدام وواعٍ بيئياً.",
-
-# ])
-# print("RAG index built and saved.")
\ No newline at end of file
+    logger.debug("Searching for query: %s", query)
+    return get_retriever().search(query, top_k)
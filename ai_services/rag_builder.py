@@ -0,0 +1,306 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+from .embeddings import encode
+from .my_rag import (
+    CURRENT_FILE, DOCS_NAME, INDEX_NAME, LEGACY_DIR, LEGACY_DOCS_NAME, STORE_DIR, VECTORS_NAME,
+    current_version, get_retriever, read_doc_records, resolve_store_dir,
+)
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_BASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "info.txt")
+
+INDEX_TYPES = ("auto", "flat", "ivf", "hnsw")
+
+# عدد المقاطع الذي يبدأ عنده النوع auto باستخدام فهرس تقريبي بدل البحث الدقيق
+ANN_THRESHOLD = 20000
+
+SENTENCE_END_RE = re.compile(r'(?<=[.!؟?\n])\s+')
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_text(text, max_chars=800, overlap=100):
+    """تقسيم النص إلى مقاطع على حدود الجمل مع تداخل بسيط بين المقاطع"""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    # الجمل الأطول من الحد تُقطع إلى نوافذ متداخلة
+    pieces = []
+    step = max(max_chars - overlap, 1)
+    for sentence in SENTENCE_END_RE.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[step:]
+        if sentence:
+            pieces.append(sentence)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap else ""
+            # بداية التداخل على حدود كلمة
+            tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+            current = tail if len(tail) + len(piece) + 1 <= max_chars else ""
+        current = f"{current} {piece}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def load_text_documents(path):
+    """
+    قراءة ملف مصدر.
+    الملفات التي كل أسطرها نصوص بين علامتي تنصيص (مثل info.txt) تعتبر كل سطر مستنداً،
+    وغير ذلك تفصل المستندات بسطر فارغ.
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if lines and all(line.startswith('"') for line in lines):
+        return [line.rstrip(",").strip().strip('"').strip() for line in lines]
+    return [block.strip() for block in re.split(r'\n\s*\n', text) if block.strip()]
+
+
+def item_documents():
+    """نصوص المنتجات المتاحة كمصدر إضافي للفهرسة"""
+    from items.models import Item
+
+    items = (
+        Item.objects.filter(status='available')
+        .select_related('category')
+        .only('id', 'title', 'description', 'location', 'category__name_ar')
+    )
+    for item in items.iterator(chunk_size=500):
+        yield {
+            "source": f"item:{item.id}",
+            "content": f"{item.title} - {item.category.name_ar}\n{item.description}\n{item.location}",
+        }
+
+
+class RAGIndexBuilder:
+    """
+    بناء فهرس RAG بشكل تزايدي.
+    المتجهات تحفظ في ملف خام مستقل عن الفهرس، فلا يُعاد تضمين إلا المقاطع
+    التي تغيرت بصمتها، ويمكن إعادة بناء أي نوع فهرس دون استدعاء النموذج.
+    كل بناء يكتب نسخة كاملة في مجلد جديد ثم يبدّل مؤشر النسخة الحالية مرة واحدة،
+    فلا يرى المسترجع أبداً فهرساً من بناء ومستندات من بناء آخر.
+    """
+
+    def __init__(self, store_dir=STORE_DIR, legacy_dir=LEGACY_DIR,
+                 index_type="auto", nlist=None, nprobe=8, hnsw_m=32,
+                 ef_construction=200, ef_search=64, batch_size=64, keep_versions=2):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type}")
+        self.store_dir = store_dir
+        self.legacy_dir = legacy_dir
+        self.keep_versions = keep_versions
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.batch_size = batch_size
+
+    def load_store(self, directory=None):
+        """تحميل السجلات والمتجهات الحالية، مع الترحيل من الصيغة القديمة"""
+        directory = directory or resolve_store_dir(self.store_dir, self.legacy_dir)
+        docs_file = os.path.join(directory, DOCS_NAME)
+        vectors_file = os.path.join(directory, VECTORS_NAME)
+        index_file = os.path.join(directory, INDEX_NAME)
+        legacy_docs_file = os.path.join(directory, LEGACY_DOCS_NAME)
+        if os.path.exists(docs_file) and os.path.exists(vectors_file):
+            records = read_doc_records(docs_file)
+            vectors = np.load(vectors_file)
+            if len(records) == len(vectors):
+                return records, vectors
+            logger.warning("RAG doc store and vectors are out of sync, starting from scratch")
+            return [], None
+
+        # الصيغة القديمة: فهرس دقيق يمكن استرجاع متجهاته مباشرة
+        if os.path.exists(legacy_docs_file) and os.path.exists(index_file):
+            try:
+                index = faiss.read_index(index_file)
+                records = read_doc_records(legacy_docs_file)
+                if index.ntotal == len(records):
+                    for record in records:
+                        record.setdefault("source", "legacy")
+                        record["hash"] = content_hash(record["content"])
+                    return records, index.reconstruct_n(0, index.ntotal)
+            except RuntimeError:
+                logger.warning("Could not migrate legacy RAG index", exc_info=True)
+        return [], None
+
+    def _resolve_index_type(self, count):
+        if self.index_type != "auto":
+            return self.index_type
+        return "flat" if count < ANN_THRESHOLD else "hnsw"
+
+    def _new_index(self, index_type, vectors):
+        dim = vectors.shape[1]
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m)
+            index.hnsw.efConstruction = self.ef_construction
+            index.add(vectors)
+            index.hnsw.efSearch = self.ef_search
+            return index
+
+        if index_type == "ivf":
+            nlist = self.nlist or max(1, int(4 * math.sqrt(len(vectors))))
+            nlist = min(nlist, len(vectors))
+            quantizer = faiss.IndexFlatL2(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+            index.train(vectors)
+            index.add(vectors)
+            index.nprobe = min(self.nprobe, nlist)
+            return index
+
+        index = faiss.IndexFlatL2(dim)
+        index.add(vectors)
+        return index
+
+    @staticmethod
+    def _index_type_of(index):
+        if isinstance(index, faiss.IndexHNSWFlat):
+            return "hnsw"
+        if isinstance(index, faiss.IndexIVFFlat):
+            return "ivf"
+        return "flat"
+
+    def _embed(self, texts):
+        batches = [
+            encode(texts[start:start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        return np.vstack(batches).astype("float32")
+
+    def build(self, documents, rebuild=False, prune=True, chunk_size=800, chunk_overlap=100):
+        """
+        documents: قائمة قواميس تحتوي على source و content.
+        rebuild: تجاهل المخزن الحالي وإعادة تضمين كل شيء.
+        prune: حذف المقاطع التي لم تعد موجودة في المصادر.
+        """
+        chunks = []
+        seen = set()
+        for document in documents:
+            for chunk in chunk_text(document["content"], chunk_size, chunk_overlap):
+                digest = content_hash(chunk)
+                if digest not in seen:
+                    seen.add(digest)
+                    chunks.append({"hash": digest, "source": document["source"], "content": chunk})
+
+        version = current_version(self.store_dir)
+        directory = os.path.join(self.store_dir, version) if version else self.legacy_dir
+        records, vectors = ([], None) if rebuild else self.load_store(directory)
+        positions = {record["hash"]: position for position, record in enumerate(records)}
+
+        kept = [position for position, record in enumerate(records) if not prune or record["hash"] in seen]
+        new_chunks = [chunk for chunk in chunks if chunk["hash"] not in positions]
+        removed = len(records) - len(kept)
+
+        stats = {"total": len(kept) + len(new_chunks), "added": len(new_chunks),
+                 "removed": removed, "unchanged": len(kept)}
+        if stats["total"] == 0:
+            raise ValueError("No documents to index")
+
+        new_vectors = self._embed([chunk["content"] for chunk in new_chunks]) if new_chunks else None
+        if removed:
+            records = [records[position] for position in kept]
+            vectors = vectors[kept]
+        records = records + new_chunks
+        if new_vectors is not None:
+            vectors = new_vectors if vectors is None or not len(vectors) else np.vstack([vectors, new_vectors])
+
+        index_type = self._resolve_index_type(len(records))
+        stats["index_type"] = index_type
+
+        index = None
+        index_file = os.path.join(directory, INDEX_NAME)
+        if not rebuild and not removed and os.path.exists(index_file):
+            existing = faiss.read_index(index_file)
+            if (self._index_type_of(existing) == index_type
+                    and existing.ntotal == len(records) - len(new_chunks)):
+                # لا تغيير؛ المخزن بالصيغة القديمة يُنقل مع ذلك إلى نسخة مرقمة
+                if not new_chunks and version:
+                    stats["version"] = version
+                    return stats
+                # إلحاق المقاطع الجديدة بالفهرس الحالي دون إعادة بنائه
+                index = existing
+                if new_vectors is not None:
+                    index.add(new_vectors)
+        if index is None:
+            index = self._new_index(index_type, vectors)
+
+        stats["version"] = self._publish(index, records, vectors)
+        get_retriever().invalidate()
+        return stats
+
+    def _publish(self, index, records, vectors):
+        """كتابة نسخة كاملة في مجلد جديد ثم تبديل المؤشر إليها بعملية os.replace واحدة"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        version = f"{datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        staging = os.path.join(self.store_dir, f".{version}.tmp")
+        os.makedirs(staging)
+        try:
+            _save_vectors(os.path.join(staging, VECTORS_NAME), vectors)
+            _save_records(os.path.join(staging, DOCS_NAME), records)
+            faiss.write_index(index, os.path.join(staging, INDEX_NAME))
+            os.rename(staging, os.path.join(self.store_dir, version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        pointer = os.path.join(self.store_dir, CURRENT_FILE)
+        with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(f"{pointer}.tmp", pointer)
+        self._prune_versions(version)
+        return version
+
+    def _prune_versions(self, current):
+        """
+        حذف النسخ الأقدم مع إبقاء آخر keep_versions نسخة، حتى تكمل العمليات
+        التي لم تكتشف التبديل بعد قراءة النسخة التي تعمل عليها.
+        """
+        versions = sorted(
+            name for name in os.listdir(self.store_dir)
+            if not name.startswith(".") and name != CURRENT_FILE
+            and os.path.isdir(os.path.join(self.store_dir, name))
+        )
+        stale = [name for name in versions if name != current][:max(len(versions) - self.keep_versions, 0)]
+        for name in stale:
+            shutil.rmtree(os.path.join(self.store_dir, name), ignore_errors=True)
+
+
+def _save_vectors(path, vectors):
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype="float32"), allow_pickle=False)
+
+
+def _save_records(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(
+                {"hash": record["hash"], "source": record.get("source", ""), "content": record["content"]},
+                ensure_ascii=False,
+            ))
+            f.write("\n")
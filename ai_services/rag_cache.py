@@ -0,0 +1,101 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.utils import normalize_arabic
+
+
+def query_key(query):
+    """مفتاح ثابت للاستعلام بعد توحيد النص العربي"""
+    normalized = normalize_arabic(query)
+    return normalized, hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+class QueryCache:
+    """
+    ذاكرة LRU محدودة لتضمينات الاستعلامات ونتائج البحث.
+    يمكن ربطها بكاش Django لمشاركة النتائج بين العمليات.
+    """
+
+    def __init__(self, max_size=1024, shared=False, timeout=3600, prefix='rag'):
+        self.max_size = max_size
+        self.shared = shared
+        self.timeout = timeout
+        self.prefix = prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _shared_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        if self.shared:
+            value = cache.get(self._shared_key(key))
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.shared:
+            cache.set(self._shared_key(key), value, self.timeout)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'shared': self.shared,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """كاش الاستعلامات المشترك على مستوى العملية"""
+    global _query_cache
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = QueryCache(
+                    max_size=getattr(settings, 'RAG_QUERY_CACHE_SIZE', 1024),
+                    shared=getattr(settings, 'RAG_QUERY_CACHE_SHARED', False),
+                    timeout=getattr(settings, 'RAG_QUERY_CACHE_TIMEOUT', 3600),
+                )
+    return _query_cache
@@ -0,0 +1,199 @@
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.utils import normalize_arabic
+
+from .models import AIResultCache
+
+logger = logging.getLogger(__name__)
+
+# يُرفع عند تغيير صياغة الطلبات المرسلة للنموذج حتى لا تُستخدم نتائج قديمة
+PROMPT_VERSION = 'v1'
+
+CACHE_PREFIX = 'ai_result'
+# مرات الاستخدام تُجمع في الكاش وتُنقل إلى الجدول عند تشغيل evict
+HITS_PREFIX = f'{CACHE_PREFIX}:hits'
+HIT_BUFFER_TIMEOUT = 24 * 3600
+HIT_FLUSH_CHUNK = 1000
+
+
+def text_digest(text):
+    """بصمة SHA-256 للنص بعد توحيده"""
+    return hashlib.sha256(normalize_arabic(text or '').encode('utf-8')).hexdigest()
+
+
+def file_digest(field_file, chunk_size=64 * 1024):
+    """بصمة SHA-256 لمحتوى الملف دون تحميله كاملاً في الذاكرة"""
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        field_file.seek(0)
+        for chunk in iter(lambda: field_file.read(chunk_size), b''):
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    ذاكرة نتائج التحليلات حسب المحتوى: (نوع التحليل، بصمة المحتوى، إصدار النموذج).
+    الطبقة الأولى كاش Django والثانية جدول AIResultCache، مع مدة صلاحية وحد أقصى للسجلات.
+    القراءة لا تكتب في قاعدة البيانات: مرات الاستخدام تُسجل في الكاش وتُنقل دفعة واحدة قبل الحذف.
+    """
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'AI_RESULT_CACHE_ENABLED', True)
+
+    @staticmethod
+    def model_version(analysis_type):
+        if analysis_type == 'image_classification':
+            model = getattr(settings, 'OPENAI_VISION_MODEL', 'gpt-4o-mini')
+        else:
+            model = getattr(settings, 'OPENAI_TEXT_MODEL', 'gpt-4o-mini')
+        return f'{model}:{PROMPT_VERSION}'
+
+    @staticmethod
+    def key_for(analysis):
+        """مفتاح التحليل، أو None إذا لم يكن هناك محتوى يمكن بصمه"""
+        if analysis.analysis_type == 'image_classification':
+            if not analysis.input_image:
+                return None
+            digest = file_digest(analysis.input_image)
+        else:
+            if not analysis.input_text:
+                return None
+            digest = text_digest(analysis.input_text)
+        return analysis.analysis_type, digest, ResultCache.model_version(analysis.analysis_type)
+
+    @staticmethod
+    def _cache_key(key):
+        analysis_type, digest, model_version = key
+        return f'{CACHE_PREFIX}:{analysis_type}:{model_version}:{digest}'
+
+    @staticmethod
+    def _timeout():
+        return getattr(settings, 'AI_RESULT_CACHE_TTL', 7 * 24 * 3600)
+
+    @staticmethod
+    def get(key):
+        """إرجاع result_data المخزنة أو None"""
+        if key is None or not ResultCache.enabled():
+            return None
+
+        cache_key = ResultCache._cache_key(key)
+        result_data = cache.get(cache_key)
+        now = timezone.now()
+        if result_data is None:
+            analysis_type, digest, model_version = key
+            entry = (
+                AIResultCache.objects.filter(
+                    analysis_type=analysis_type, content_hash=digest,
+                    model_version=model_version, expires_at__gt=now,
+                )
+                .only('result_data', 'expires_at')
+                .first()
+            )
+            if entry is None:
+                return None
+            result_data = entry.result_data
+            remaining = int((entry.expires_at - now).total_seconds())
+            cache.set(cache_key, result_data, max(remaining, 1))
+
+        ResultCache.record_hit(key, now)
+        return result_data
+
+    @staticmethod
+    def record_hit(key, used_at):
+        """تسجيل استخدام النتيجة في الكاش برقم تسلسلي"""
+        counter_key = f'{HITS_PREFIX}:count'
+        cache.add(counter_key, 0, None)
+        try:
+            sequence = cache.incr(counter_key)
+        except ValueError:
+            # حُذف العداد من الكاش للتو؛ فقدان استخدام واحد مقبول
+            return
+        cache.set(f'{HITS_PREFIX}:{sequence}', (*key, used_at), HIT_BUFFER_TIMEOUT)
+
+    @staticmethod
+    def flush_hits():
+        """نقل مرات الاستخدام المسجلة منذ آخر نقل إلى الجدول؛ ترجع عددها"""
+        count = cache.get(f'{HITS_PREFIX}:count') or 0
+        flushed_key = f'{HITS_PREFIX}:flushed'
+        flushed = cache.get(flushed_key, 0)
+        if count < flushed:
+            # العداد بدأ من جديد بعد مسح الكاش
+            flushed = 0
+        if count == flushed:
+            return 0
+
+        hits = {}
+        for start in range(flushed + 1, count + 1, HIT_FLUSH_CHUNK):
+            end = min(start + HIT_FLUSH_CHUNK, count + 1)
+            event_keys = [f'{HITS_PREFIX}:{sequence}' for sequence in range(start, end)]
+            for analysis_type, digest, model_version, used_at in cache.get_many(event_keys).values():
+                key = (analysis_type, digest, model_version)
+                total, last_used_at = hits.get(key, (0, used_at))
+                hits[key] = (total + 1, max(last_used_at, used_at))
+            cache.delete_many(event_keys)
+
+        # استعلام واحد لكل نتيجة مستخدمة مهما بلغ عدد مرات استخدامها
+        with transaction.atomic():
+            for (analysis_type, digest, model_version), (total, last_used_at) in hits.items():
+                AIResultCache.objects.filter(
+                    analysis_type=analysis_type, content_hash=digest, model_version=model_version
+                ).update(hit_count=F('hit_count') + total, last_used_at=last_used_at)
+        cache.set(flushed_key, count, None)
+        return sum(total for total, _ in hits.values())
+
+    @staticmethod
+    def set(key, result_data):
+        if key is None or not ResultCache.enabled():
+            return
+
+        timeout = ResultCache._timeout()
+        now = timezone.now()
+        analysis_type, digest, model_version = key
+        try:
+            AIResultCache.objects.update_or_create(
+                analysis_type=analysis_type,
+                content_hash=digest,
+                model_version=model_version,
+                defaults={
+                    'result_data': result_data,
+                    'last_used_at': now,
+                    'expires_at': now + timedelta(seconds=timeout),
+                },
+            )
+        except IntegrityError:
+            # طلب متزامن حفظ نفس النتيجة أولاً
+            logger.debug("AI result cache entry already stored for %s", key)
+        cache.set(ResultCache._cache_key(key), result_data, timeout)
+
+    @staticmethod
+    def evict(max_entries=None):
+        """نقل مرات الاستخدام ثم حذف السجلات المنتهية ثم الأقدم استخداماً فوق الحد الأقصى"""
+        if max_entries is None:
+            max_entries = getattr(settings, 'AI_RESULT_CACHE_MAX_ENTRIES', 50000)
+
+        ResultCache.flush_hits()
+
+        expired = AIResultCache.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+        trimmed = 0
+        cutoff = (
+            AIResultCache.objects.order_by('-last_used_at', '-id')
+            .values_list('last_used_at', flat=True)[max_entries:max_entries + 1]
+        )
+        cutoff = list(cutoff)
+        if cutoff:
+            trimmed = AIResultCache.objects.filter(last_used_at__lte=cutoff[0]).delete()[0]
+        return expired, trimmed
@@ -9,7 +9,7 @@ def process_ai_analysis(analysis_id):
         analysis = AIAnalysis.objects.get(id=analysis_id)
         
         if analysis.analysis_type == 'image_classification':
-            AIService.analyze_image(analysis)
+            AIService.classify_waste_image(analysis)
         elif analysis.analysis_type == 'text_analysis':
             AIService.analyze_text(analysis)
         elif analysis.analysis_type == 'price_suggestion':
@@ -36,6 +36,14 @@ def cleanup_old_analyses():
     
     return f"Deleted {deleted_count} old analyses"
 
+@shared_task
+def evict_result_cache():
+    """حذف نتائج التحليل المخزنة المنتهية والزائدة عن الحد"""
+    from .result_cache import ResultCache
+
+    expired, trimmed = ResultCache.evict()
+    return f"Evicted {expired} expired and {trimmed} least recently used cached results"
+
 @shared_task
 def update_model_metrics():
     """تحديث مقاييس أداء النماذج"""
@@ -66,4 +74,22 @@ def update_model_metrics():
         
         model.save()
     
-    return "Model metrics updated successfully"
\ No newline at end of file
+    return "Model metrics updated successfully"
+
+@shared_task
+def embed_texts(texts):
+    """تضمين دفعة نصوص على عامل التضمين المخصص"""
+    from .embeddings import encode_local
+
+    return encode_local(texts).tolist()
+
+@shared_task
+def drain_moderation_queue():
+    """مراجعة النصوص المعلقة في طابور المراجعة على دفعات"""
+    from django.core.cache import cache
+    from .moderation import DRAIN_SCHEDULED_KEY, ModerationQueue
+
+    # السماح بجدولة تفريغ جديد للنصوص التي تصل أثناء هذا التفريغ
+    cache.delete(DRAIN_SCHEDULED_KEY)
+    processed = ModerationQueue.drain()
+    return f"Moderated {processed} queued texts"
@@ -0,0 +1,897 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+import faiss
+import httpx
+import numpy as np
+import openai
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from .models import AIAnalysis, AIResultCache, ChatBot, ChatBotMessage, ModerationVerdict
+from .moderation import ModerationQueue
+from .keywords import KeywordMatcher, TEXT_MATCHER
+from .chatbot import ChatPromptBuilder
+from .clients import ModelProvider
+from .routing import websocket_urlpatterns
+from .result_cache import ResultCache
+from .services import AIService
+from . import embeddings, my_rag
+from .embeddings import BatchingEmbedder
+from .my_rag import RAGRetriever
+from .rag_builder import RAGIndexBuilder
+from .rag_cache import QueryCache, query_key
+
+User = get_user_model()
+
+class ChatPromptBuilderTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='bot@example.com', password='testpass123', full_name='Bot User')
+        self.session = ChatBot.objects.create(user=self.user, session_id='session-1')
+
+    def test_context_and_history(self):
+        """اختبار تجميع السياق والسجل والرسالة الحالية"""
+        ChatBotMessage.objects.create(session=self.session, message_type='user', content='مرحبا')
+        ChatBotMessage.objects.create(session=self.session, message_type='bot', content='أهلاً بك')
+        ChatBotMessage.objects.create(session=self.session, message_type='user', content='كم سعر البلاستيك؟')
+
+        retrieve = lambda query, top_k: [{'content': 'البلاستيك 4 جنيه للكيلو'}]
+        messages = ChatPromptBuilder(self.session, 'كم سعر البلاستيك؟', retrieve).build()
+
+        self.assertEqual(messages[0]['role'], 'system')
+        self.assertIn('البلاستيك 4 جنيه للكيلو', messages[1]['content'])
+        self.assertEqual([m['content'] for m in messages[2:]], ['مرحبا', 'أهلاً بك', 'كم سعر البلاستيك؟'])
+        self.assertEqual(messages[3]['role'], 'assistant')
+
+    @override_settings(CHATBOT_CONTEXT_TOKEN_BUDGET=10)
+    def test_context_respects_token_budget(self):
+        """اختبار استبعاد المقاطع التي تتجاوز ميزانية التوكنات"""
+        retrieve = lambda query, top_k: [{'content': 'ا' * 300}, {'content': 'قصير'}]
+        context = ChatPromptBuilder(self.session, 'سؤال', retrieve).context_message()
+        self.assertNotIn('ا' * 300, context['content'])
+        self.assertIn('قصير', context['content'])
+
+
+@override_settings(OPENAI_API_KEY='sk-test')
+class ResultCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='cache@example.com', password='testpass123', full_name='Cache User')
+
+    def analyze(self, text):
+        analysis = AIAnalysis.objects.create(user=self.user, analysis_type='text_analysis', input_text=text)
+        return analysis, AIService.analyze_text(analysis)
+
+    def test_duplicate_text_served_from_cache(self):
+        """اختبار إكمال التحليل المكرر من الذاكرة دون استدعاء النموذج"""
+        with mock.patch.object(AIService, '_analyze_text_with_openai', return_value={'confidence': 90, 'sentiment': 'positive'}) as request:
+            self.analyze('زجاجات  بلاستيك نظيفة')
+            cache.clear()
+            analysis, result = self.analyze('زُجاجات بلاستيك نظيفة')
+
+        request.assert_called_once()
+        self.assertEqual(result['sentiment'], 'positive')
+        analysis.refresh_from_db()
+        self.assertEqual(analysis.status, 'completed')
+        self.assertEqual(analysis.confidence_score, 0.9)
+        self.assertEqual(AIResultCache.objects.get().hit_count, 0)
+        ResultCache.evict()
+        self.assertEqual(AIResultCache.objects.get().hit_count, 1)
+
+    def test_hits_buffered_until_eviction(self):
+        """اختبار أن القراءة من الكاش لا تكتب في قاعدة البيانات وأن evict ينقل العدد مجمعاً"""
+        key = ('text_analysis', 'digest', 'model:v1')
+        ResultCache.set(key, {'sentiment': 'neutral'})
+        stored = AIResultCache.objects.get()
+
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(ResultCache.get(key), {'sentiment': 'neutral'})
+
+        self.assertEqual(ResultCache.flush_hits(), 3)
+        entry = AIResultCache.objects.get()
+        self.assertEqual(entry.hit_count, 3)
+        self.assertGreater(entry.last_used_at, stored.last_used_at)
+
+        ResultCache.get(key)
+        self.assertEqual(ResultCache.evict(), (0, 0))
+        self.assertEqual(AIResultCache.objects.get().hit_count, 4)
+        self.assertEqual(ResultCache.flush_hits(), 0)
+
+    def test_fallback_result_not_cached(self):
+        """اختبار عدم حفظ نتيجة المحاكاة عند فشل النموذج"""
+        with mock.patch.object(AIService, '_analyze_text_with_openai', side_effect=RuntimeError('boom')):
+            analysis, result = self.analyze('كرتون مستعمل')
+
+        self.assertIn('sentiment', result)
+        self.assertFalse(AIResultCache.objects.exists())
+
+
+class ModerationQueueTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='mod@example.com', password='testpass123', full_name='Mod User')
+
+    def test_reports_moderated_in_batches(self):
+        """اختبار إضافة البلاغات للطابور ومراجعتها على دفعات"""
+        from reports.models import Report
+
+        with mock.patch.object(ModerationQueue, 'schedule_drain'), self.captureOnCommitCallbacks(execute=True):
+            Report.objects.create(reporter=self.user, report_type='fraud', title='بلاغ', description='هذا احتيال ونصب واضح')
+            Report.objects.create(reporter=self.user, report_type='other', title='بلاغ', description='المنتج جيد لكن الوصف ناقص')
+
+        self.assertEqual(ModerationVerdict.objects.filter(status='pending').count(), 2)
+        with mock.patch.object(AIService, 'moderate_batch', wraps=AIService.moderate_batch) as moderate_batch:
+            self.assertEqual(ModerationQueue.drain(batch_size=1), 2)
+        self.assertEqual(moderate_batch.call_count, 2)
+
+        self.assertEqual(
+            sorted(ModerationVerdict.objects.values_list('status', flat=True)),
+            ['approved', 'flagged'],
+        )
+        self.assertFalse(ModerationQueue.enqueue(Report.objects.get(report_type='fraud')))
+
+    def test_message_saves_queue_only_changed_text(self):
+        """اختبار تجاهل الحفظ بدون تغيير النص والرسائل المحذوفة، واستعلام upsert واحد لكل تغيير"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from chat.models import Conversation, Message
+
+        conversation = Conversation.objects.create()
+        with mock.patch.object(ModerationQueue, 'schedule_drain'), self.captureOnCommitCallbacks(execute=True):
+            message = Message.objects.create(conversation=conversation, sender=self.user, content='مرحبا')
+        first_hash = ModerationVerdict.objects.get().content_hash
+
+        message = Message.objects.get(pk=message.pk)
+        with mock.patch.object(ModerationQueue, '_queue') as queue, self.captureOnCommitCallbacks(execute=True):
+            message.save()
+            message.is_edited = True
+            message.save()
+        queue.assert_not_called()
+
+        message.content = 'تم التعديل'
+        with mock.patch.object(ModerationQueue, 'schedule_drain'), CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                message.save()
+        verdict_queries = [query for query in queries if 'ai_services_moderationverdict' in query['sql']]
+        self.assertEqual(len(verdict_queries), 1)
+        self.assertNotEqual(ModerationVerdict.objects.get().content_hash, first_hash)
+
+        message.is_deleted = True
+        message.content = 'تم حذف هذه الرسالة'
+        with mock.patch.object(ModerationQueue, '_queue') as queue, self.captureOnCommitCallbacks(execute=True):
+            message.save()
+        queue.assert_not_called()
+
+        # الحقول المؤجلة لا تُحمّل لحفظ النص
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(Message.objects.only('id'))), 1)
+
+    def test_queue_failures_do_not_fail_the_write(self):
+        """اختبار أن تعطل قاعدة البيانات أو الوسيط عند الإضافة للطابور لا يُفشل حفظ المحتوى"""
+        from django.db import DatabaseError
+        from reports.models import Report
+
+        with mock.patch.object(ModerationVerdict.objects, 'bulk_create', side_effect=DatabaseError('down')):
+            with self.assertLogs('ai_services.moderation', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                Report.objects.create(reporter=self.user, report_type='other', title='بلاغ', description='نص أول')
+        self.assertFalse(ModerationVerdict.objects.exists())
+
+        cache.clear()
+        with mock.patch('ai_services.tasks.drain_moderation_queue.apply_async', side_effect=OSError('broker down')):
+            with self.assertLogs('ai_services.moderation', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                Report.objects.create(reporter=self.user, report_type='other', title='بلاغ', description='نص ثانٍ')
+        self.assertEqual(ModerationVerdict.objects.filter(status='pending').count(), 1)
+
+        with mock.patch('ai_services.moderation.cache.add', side_effect=OSError('cache down')):
+            with self.assertLogs('ai_services.moderation', 'WARNING'):
+                ModerationQueue.schedule_drain()
+
+    def queue_report(self, description='المنتج جيد لكن الوصف ناقص'):
+        from reports.models import Report
+
+        with mock.patch.object(ModerationQueue, 'schedule_drain'), self.captureOnCommitCallbacks(execute=True):
+            return Report.objects.create(reporter=self.user, report_type='other', title='بلاغ', description=description)
+
+    def test_batch_claimed_while_model_runs(self):
+        """اختبار حجز الدفعة أثناء المراجعة وعدم كتابة نتيجة قديمة على نص تغير أثناءها"""
+        report = self.queue_report()
+
+        def moderate_batch(texts):
+            self.assertEqual(ModerationVerdict.objects.get().status, 'processing')
+            self.assertEqual(ModerationQueue.claim(10)[1], [])
+            report.description = 'هذا احتيال ونصب واضح'
+            report.save(update_fields=['description'])
+            with mock.patch.object(ModerationQueue, 'schedule_drain'):
+                ModerationQueue.enqueue(report)
+            return 'rules', [{'is_appropriate': True}]
+
+        with mock.patch.object(AIService, 'moderate_batch', side_effect=moderate_batch):
+            self.assertEqual(ModerationQueue.drain_batch(), 1)
+        verdict = ModerationVerdict.objects.get()
+        self.assertEqual((verdict.status, verdict.claimed_at), ('pending', None))
+
+        ModerationQueue.drain()
+        self.assertEqual(ModerationVerdict.objects.get().status, 'flagged')
+
+    def test_failed_batch_released_and_stale_claims_retried(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.queue_report()
+        with mock.patch.object(AIService, 'moderate_batch', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                ModerationQueue.drain_batch()
+        self.assertEqual(ModerationVerdict.objects.get().status, 'pending')
+
+        # عامل توقف بعد الحجز: السجل يُحجز من جديد بعد انتهاء المهلة فقط
+        ModerationVerdict.objects.update(status='processing', claimed_at=timezone.now())
+        self.assertEqual(ModerationQueue.drain(), 0)
+        ModerationVerdict.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(ModerationQueue.drain(), 1)
+        self.assertEqual(ModerationVerdict.objects.get().status, 'approved')
+
+
+class KeywordMatcherTestCase(TestCase):
+    def test_overlapping_keywords_in_one_pass(self):
+        """اختبار إيجاد الكلمات المتداخلة وعدّ الكلمات التي تحتويها"""
+        matcher = KeywordMatcher({'demo': {'a': ['كرت', 'كرتون'], 'b': ['تون']}})
+        matches = matcher.match('صندوق كرتون وكرتونة')
+        self.assertEqual(matches.keywords('demo', 'a'), ['كرت', 'كرتون'])
+        self.assertEqual(matches.word_count_for('demo', 'a'), 2)
+        self.assertEqual(matches.labels('demo'), ['a', 'b'])
+
+    def test_arabic_normalization(self):
+        """اختبار المطابقة بعد توحيد أشكال الألف وإزالة التشكيل"""
+        matches = TEXT_MATCHER.match('اهلاً، هذا المنتج مزيَّف')
+        self.assertEqual(matches.keywords('intent', 'تحية'), ['أهلا'])
+        self.assertEqual(matches.keywords('moderation', 'inappropriate'), ['مزيف'])
+        self.assertFalse(AIService._simulate_content_moderation('هذا المنتج مزيَّف')['is_appropriate'])
+
+
+def write_rag_store(directory, contents):
+    """كتابة فهرس ومخزن مستندات صغيرين؛ متجه المستند i هو (i, 0)"""
+    os.makedirs(directory, exist_ok=True)
+    index = faiss.IndexFlatL2(2)
+    index.add(np.array([[i, 0] for i in range(len(contents))], dtype='float32'))
+    faiss.write_index(index, os.path.join(directory, my_rag.INDEX_NAME))
+    with open(os.path.join(directory, my_rag.DOCS_NAME), 'w', encoding='utf-8') as f:
+        for content in contents:
+            f.write(json.dumps({'content': content}, ensure_ascii=False) + '\n')
+
+
+def publish_rag_version(store_dir, version, contents=None):
+    """كتابة نسخة (إن أعطيت مستنداتها) وتبديل المؤشر إليها"""
+    if contents is not None:
+        write_rag_store(os.path.join(store_dir, version), contents)
+    with open(os.path.join(store_dir, my_rag.CURRENT_FILE), 'w', encoding='utf-8') as f:
+        f.write(version)
+
+
+class RAGRetrieverTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.store_dir = os.path.join(self.directory, 'rag_store')
+        self.legacy_dir = os.path.join(self.directory, 'legacy')
+        os.makedirs(self.legacy_dir)
+        publish_rag_version(self.store_dir, 'v1', ['قديم', 'ثاني'])
+
+        self.query_cache = QueryCache(max_size=16)
+        patches = [
+            mock.patch('ai_services.my_rag.get_query_cache', return_value=self.query_cache),
+            mock.patch('ai_services.my_rag.encode', return_value=np.zeros((1, 2), dtype='float32')),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def retriever(self, check_interval=0):
+        return RAGRetriever(self.store_dir, check_interval=check_interval, legacy_dir=self.legacy_dir)
+
+    def swap_store(self, contents, version='v2'):
+        publish_rag_version(self.store_dir, version, contents)
+
+    def test_reload_after_files_swapped(self):
+        """اختبار إعادة التحميل بعد استبدال الملفات وعدم تقديم نتائج النسخة القديمة"""
+        retriever = self.retriever()
+        self.assertEqual(retriever.search('سؤال', top_k=1), [{'content': 'قديم'}])
+        old_snapshot = retriever.snapshot()
+
+        self.swap_store(['جديد', 'ثاني', 'ثالث'])
+        self.assertEqual(retriever.search('سؤال', top_k=1), [{'content': 'جديد'}])
+        self.assertIsNot(retriever.snapshot(), old_snapshot)
+        self.assertEqual(retriever.snapshot().index.ntotal, 3)
+
+    def test_signature_checks_are_throttled(self):
+        """اختبار عدم فحص الملفات قبل انقضاء الفترة الدنيا بين فحصين"""
+        retriever = self.retriever(check_interval=60)
+        with mock.patch('ai_services.my_rag.time.monotonic', return_value=1000.0):
+            snapshot = retriever.snapshot()
+            self.swap_store(['جديد'])
+            with mock.patch.object(retriever, '_signature', wraps=retriever._signature) as signature:
+                self.assertIs(retriever.snapshot(), snapshot)
+                self.assertEqual(retriever.search('سؤال', top_k=1), [{'content': 'قديم'}])
+            signature.assert_not_called()
+
+        with mock.patch('ai_services.my_rag.time.monotonic', return_value=1061.0):
+            self.assertEqual(retriever.search('سؤال', top_k=1), [{'content': 'جديد'}])
+
+    def test_inconsistent_store_keeps_previous_snapshot(self):
+        """اختبار الاستمرار بالنسخة السابقة إذا كان عدد المتجهات لا يطابق المستندات"""
+        retriever = self.retriever()
+        snapshot = retriever.snapshot()
+        self.swap_store(['واحد', 'اثنان', 'ثلاثة'])
+        with open(os.path.join(self.store_dir, 'v2', my_rag.DOCS_NAME), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'content': 'زائد'}, ensure_ascii=False) + '\n')
+
+        self.assertIs(retriever.snapshot(), snapshot)
+        self.assertEqual(retriever.search('سؤال', top_k=1), [{'content': 'قديم'}])
+
+    def test_results_cached_per_index_version(self):
+        """اختبار أن مفتاح كاش النتائج يتضمن نسخة الفهرس وعدد النتائج"""
+        retriever = self.retriever()
+        with mock.patch.object(retriever, 'embed_query', wraps=retriever.embed_query) as embed_query:
+            retriever.search('سؤال', top_k=1)
+            retriever.search('سُؤال', top_k=1)
+            self.assertEqual(embed_query.call_count, 1)
+            self.assertEqual(retriever.search('سؤال', top_k=2), [{'content': 'قديم'}, {'content': 'ثاني'}])
+            self.assertEqual(embed_query.call_count, 2)
+
+            self.swap_store(['جديد', 'ثاني'])
+            retriever.search('سؤال', top_k=1)
+            self.assertEqual(embed_query.call_count, 3)
+
+    def test_query_embedded_from_original_text(self):
+        """اختبار أن التوحيد يخص مفتاح الكاش فقط وأن التضمين من نص الاستعلام كما هو"""
+        retriever = self.retriever()
+        with mock.patch('ai_services.my_rag.encode', return_value=np.zeros((1, 2), dtype='float32')) as encode:
+            retriever.embed_query('أَسْعار')
+            retriever.embed_query('اسعار')
+        encode.assert_called_once_with(['أَسْعار'])
+
+    def test_legacy_files_served_until_first_versioned_build(self):
+        """اختبار قراءة الملفات بالصيغة القديمة إذا لم توجد نسخة معتمدة"""
+        shutil.rmtree(self.store_dir)
+        write_rag_store(self.legacy_dir, ['قبل الترحيل'])
+        retriever = self.retriever()
+        self.assertEqual(retriever.search('سؤال'), [{'content': 'قبل الترحيل'}])
+        self.assertEqual(retriever.snapshot().signature[0], 'legacy')
+
+        publish_rag_version(self.store_dir, 'v1', ['بعد الترحيل'])
+        self.assertEqual(retriever.search('سؤال'), [{'content': 'بعد الترحيل'}])
+
+    def test_get_retriever_is_shared(self):
+        """اختبار أن المسترجع يُنشأ مرة واحدة لكل عملية"""
+        with mock.patch.object(my_rag, '_retriever', None):
+            retriever = my_rag.get_retriever()
+            self.assertIs(my_rag.get_retriever(), retriever)
+            self.assertEqual(retriever.store_dir, my_rag.STORE_DIR)
+
+
+class BatchingEmbedderTestCase(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.addCleanup(self.release.set)
+
+    def encode_fn(self, texts):
+        self.calls.append(list(texts))
+        self.release.wait(5)
+        return np.array([[len(text), 0] for text in texts], dtype='float32')
+
+    def test_concurrent_requests_coalesced(self):
+        """اختبار دمج الطلبات التي تصل أثناء دفعة جارية في استدعاء واحد وتوزيع النتائج"""
+        embedder = BatchingEmbedder(self.encode_fn, max_batch_size=8, max_latency=0.2)
+        self.release.clear()
+        results = {}
+
+        def request(texts):
+            results[texts[0]] = embedder.encode(texts, timeout=5)
+
+        threads = [threading.Thread(target=request, args=(['أ'],))]
+        threads[0].start()
+        while not self.calls:
+            time.sleep(0.005)
+        threads += [
+            threading.Thread(target=request, args=(['بب', 'ججج'],)),
+            threading.Thread(target=request, args=(['دددد'],)),
+        ]
+        for thread in threads[1:]:
+            thread.start()
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(sorted(self.calls[1]), sorted(['بب', 'ججج', 'دددد']))
+        self.assertEqual(results['أ'].tolist(), [[1, 0]])
+        self.assertEqual(results['بب'].tolist(), [[2, 0], [3, 0]])
+        self.assertEqual(results['دددد'].tolist(), [[4, 0]])
+
+    def test_batch_size_limit(self):
+        """اختبار تقسيم الطلبات المتراكمة حسب أقصى حجم للدفعة"""
+        embedder = BatchingEmbedder(self.encode_fn, max_batch_size=2, max_latency=0.05)
+        embedder.encode(['أ'])
+        self.release.clear()
+        threads = [threading.Thread(target=embedder.encode, args=([text],)) for text in 'بجده']
+        for thread in threads:
+            thread.start()
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertTrue(all(len(batch) <= 2 for batch in self.calls))
+        self.assertEqual(sum(len(batch) for batch in self.calls), 5)
+
+    def test_timeout(self):
+        """اختبار انتهاء مهلة الانتظار إذا تأخر النموذج"""
+        embedder = BatchingEmbedder(self.encode_fn, max_latency=0)
+        self.release.clear()
+        with self.assertRaises(FutureTimeoutError):
+            embedder.encode(['بطيء'], timeout=0.05)
+
+    def test_errors_propagate_to_every_request(self):
+        """اختبار وصول خطأ النموذج لكل الطلبات في الدفعة واستمرار العامل بعده"""
+        failures = iter([RuntimeError('model down')])
+
+        def encode_fn(texts):
+            error = next(failures, None)
+            if error:
+                raise error
+            return np.ones((len(texts), 2), dtype='float32')
+
+        embedder = BatchingEmbedder(encode_fn, max_latency=0)
+        with self.assertRaisesMessage(RuntimeError, 'model down'):
+            embedder.encode(['أ'], timeout=5)
+        self.assertEqual(embedder.encode(['أ', 'ب'], timeout=5).shape, (2, 2))
+
+    def test_empty_request_skips_model(self):
+        embedder = BatchingEmbedder(self.encode_fn)
+        self.assertEqual(embedder.encode([]).shape, (0, 0))
+        self.assertEqual(self.calls, [])
+
+
+class EmbeddingBackendTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(embeddings, '_batcher', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(RAG_EMBEDDING_BACKEND='local')
+    def test_local_backend_encodes_directly(self):
+        with mock.patch.object(embeddings, 'encode_local', return_value='local') as encode_local, \
+                mock.patch.object(embeddings, '_get_batcher') as get_batcher:
+            self.assertEqual(embeddings.encode(['نص']), 'local')
+        encode_local.assert_called_once_with(['نص'])
+        get_batcher.assert_not_called()
+
+    @override_settings(RAG_EMBEDDING_BACKEND='batched', RAG_EMBEDDING_TIMEOUT=3)
+    def test_batched_backend_uses_local_model(self):
+        batcher = embeddings._get_batcher()
+        self.assertIs(batcher.encode_fn, embeddings.encode_local)
+        with mock.patch.object(batcher, 'encode', return_value='batched') as encode:
+            self.assertEqual(embeddings.encode(['نص']), 'batched')
+        encode.assert_called_once_with(['نص'], timeout=3)
+
+    @override_settings(RAG_EMBEDDING_BACKEND='celery')
+    def test_celery_backend_sends_batches_to_worker(self):
+        self.assertIs(embeddings._get_batcher().encode_fn, embeddings.encode_remote)
+        with mock.patch.object(embeddings._get_batcher(), 'encode', return_value='remote') as encode:
+            self.assertEqual(embeddings.encode(['نص']), 'remote')
+        encode.assert_called_once()
+
+    @override_settings(RAG_EMBEDDING_BACKEND='celery')
+    def test_celery_backend_inside_task_encodes_locally(self):
+        """اختبار عدم انتظار مهمة التضمين من داخل مهمة Celery أخرى"""
+        with mock.patch.object(embeddings, 'current_task', mock.Mock()), \
+                mock.patch.object(embeddings, 'encode_local', return_value='local') as encode_local, \
+                mock.patch.object(embeddings, '_get_batcher') as get_batcher:
+            self.assertEqual(embeddings.encode(['نص']), 'local')
+        encode_local.assert_called_once_with(['نص'])
+        get_batcher.assert_not_called()
+
+
+class QueryCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_lru_eviction(self):
+        """اختبار حذف أقدم مفتاح استُخدم عند تجاوز الحد"""
+        query_cache = QueryCache(max_size=2)
+        query_cache.set('a', 1)
+        query_cache.set('b', 2)
+        self.assertEqual(query_cache.get('a'), 1)
+        query_cache.set('c', 3)
+
+        self.assertIsNone(query_cache.get('b'))
+        self.assertEqual(query_cache.get('a'), 1)
+        self.assertEqual(query_cache.get('c'), 3)
+        self.assertEqual(query_cache.stats()['size'], 2)
+
+    def test_shared_cache_fallback(self):
+        """اختبار قراءة ما حفظته عملية أخرى من كاش Django ثم حفظه محلياً"""
+        QueryCache(shared=True).set('key', [1, 2])
+        query_cache = QueryCache(shared=True)
+
+        self.assertEqual(query_cache.get('key'), [1, 2])
+        self.assertEqual(cache.get('rag:key'), [1, 2])
+        cache.delete('rag:key')
+        self.assertEqual(query_cache.get('key'), [1, 2])
+        self.assertEqual((query_cache.shared_hits, query_cache.hits), (1, 1))
+
+        self.assertIsNone(QueryCache(shared=False).get('key'))
+
+    def test_stats_counters(self):
+        query_cache = QueryCache(max_size=4)
+        self.assertEqual(query_cache.stats()['hit_rate'], 0.0)
+        query_cache.get('missing')
+        query_cache.set('key', 'value')
+        query_cache.get('key')
+        query_cache.get('key')
+        query_cache.clear()
+        query_cache.get('key')
+
+        stats = query_cache.stats()
+        self.assertEqual((stats['hits'], stats['shared_hits'], stats['misses'], stats['size']), (2, 0, 2, 0))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_query_key_normalizes_arabic(self):
+        self.assertEqual(query_key('كم سعر البلاستيك؟')[1], query_key('كم  سِعر البلاستيك؟')[1])
+
+
+def stub_encode(texts):
+    """تضمين ثابت بدون نموذج: متجه كل نص مشتق من حروفه"""
+    return np.array(
+        [[len(text), sum(map(ord, text)) % 97, text.count(' '), 1] for text in texts],
+        dtype='float32',
+    )
+
+
+class RAGIndexBuilderTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.store_dir = os.path.join(self.directory, 'rag_store')
+        self.legacy_dir = os.path.join(self.directory, 'legacy')
+        os.makedirs(self.legacy_dir)
+
+        patches = [
+            mock.patch('ai_services.rag_builder.encode', side_effect=stub_encode),
+            mock.patch('ai_services.rag_builder.get_retriever'),
+        ]
+        self.encode, self.get_retriever = [patcher.start() for patcher in patches]
+        for patcher in patches:
+            self.addCleanup(patcher.stop)
+
+    def builder(self, **kwargs):
+        return RAGIndexBuilder(self.store_dir, self.legacy_dir, **kwargs)
+
+    def build(self, contents, **options):
+        return self.builder(**options).build([{'source': 'test', 'content': content} for content in contents])
+
+    def encoded(self):
+        return [text for call in self.encode.call_args_list for text in call.args[0]]
+
+    def current(self):
+        version = my_rag.current_version(self.store_dir)
+        index = faiss.read_index(os.path.join(self.store_dir, version, my_rag.INDEX_NAME))
+        docs = my_rag._read_docs(os.path.join(self.store_dir, version, my_rag.DOCS_NAME))
+        return version, index, docs
+
+    def versions(self):
+        return sorted(name for name in os.listdir(self.store_dir) if name != my_rag.CURRENT_FILE)
+
+    def test_unchanged_chunks_reuse_vectors(self):
+        """اختبار عدم إعادة تضمين المقاطع التي لم تتغير بصمتها"""
+        first = self.build(['البلاستيك', 'الكرتون'])
+        self.assertEqual(self.encoded(), ['البلاستيك', 'الكرتون'])
+
+        self.encode.reset_mock()
+        stats = self.build(['البلاستيك', 'الكرتون', 'الزجاج'])
+        self.assertEqual(self.encoded(), ['الزجاج'])
+        self.assertEqual((stats['added'], stats['unchanged'], stats['removed']), (1, 2, 0))
+
+        version, index, docs = self.current()
+        self.assertNotEqual(version, first['version'])
+        self.assertEqual(docs, ['البلاستيك', 'الكرتون', 'الزجاج'])
+        self.assertEqual(index.ntotal, 3)
+        self.get_retriever.return_value.invalidate.assert_called()
+
+    def test_no_changes_keeps_current_version(self):
+        first = self.build(['البلاستيك'])
+        self.encode.reset_mock()
+        self.get_retriever.reset_mock()
+
+        self.assertEqual(self.build(['البلاستيك'])['version'], first['version'])
+        self.encode.assert_not_called()
+        self.get_retriever.return_value.invalidate.assert_not_called()
+        self.assertEqual(self.versions(), [first['version']])
+
+    def test_removed_chunks_pruned(self):
+        self.build(['البلاستيك', 'الكرتون'])
+        stats = self.build(['الكرتون'])
+        self.assertEqual(stats['removed'], 1)
+        self.assertEqual(self.current()[2], ['الكرتون'])
+        self.assertEqual(self.current()[1].ntotal, 1)
+
+    def test_append_vs_rebuild_on_index_type_change(self):
+        """اختبار الإلحاق بالفهرس إذا لم يتغير نوعه وإعادة بنائه من المتجهات المحفوظة إذا تغير"""
+        self.build(['البلاستيك', 'الكرتون'], index_type='flat')
+        with mock.patch.object(RAGIndexBuilder, '_new_index', wraps=self.builder()._new_index) as new_index:
+            self.build(['البلاستيك', 'الكرتون', 'الزجاج'], index_type='flat')
+            new_index.assert_not_called()
+
+            self.encode.reset_mock()
+            stats = self.build(['البلاستيك', 'الكرتون', 'الزجاج'], index_type='hnsw')
+            new_index.assert_called_once()
+        self.encode.assert_not_called()
+        self.assertEqual(stats['index_type'], 'hnsw')
+        self.assertIsInstance(self.current()[1], faiss.IndexHNSWFlat)
+        self.assertEqual(self.current()[1].ntotal, 3)
+
+    def test_legacy_npy_store_migrated(self):
+        """اختبار ترحيل المخزن القديم (فهرس دقيق و rag_docs.npy) دون استدعاء النموذج"""
+        contents = ['البلاستيك', 'الكرتون']
+        vectors = stub_encode(contents)
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        faiss.write_index(index, os.path.join(self.legacy_dir, my_rag.INDEX_NAME))
+        np.save(os.path.join(self.legacy_dir, my_rag.LEGACY_DOCS_NAME), np.array(contents))
+
+        stats = self.build(contents)
+        self.encode.assert_not_called()
+        self.assertEqual((stats['added'], stats['unchanged']), (0, 2))
+
+        version, index, docs = self.current()
+        self.assertEqual(docs, contents)
+        stored = np.load(os.path.join(self.store_dir, version, my_rag.VECTORS_NAME))
+        np.testing.assert_array_equal(stored, vectors)
+
+    def test_old_versions_pruned(self):
+        for count in range(1, 5):
+            stats = self.build([f'مستند {i}' for i in range(count)], keep_versions=2)
+        self.assertEqual(len(self.versions()), 2)
+        self.assertEqual(self.versions()[-1], stats['version'])
+
+    def test_failed_write_keeps_current_version(self):
+        """اختبار أن فشل الكتابة لا يغير النسخة المعتمدة ولا يترك ملفات مؤقتة"""
+        first = self.build(['البلاستيك'])
+        with mock.patch('ai_services.rag_builder.faiss.write_index', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                self.build(['البلاستيك', 'الكرتون'])
+        self.assertEqual(my_rag.current_version(self.store_dir), first['version'])
+        self.assertEqual(self.versions(), [first['version']])
+
+
+class ChatBotConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='stream@example.com', password='testpass123', full_name='Stream User')
+        self.session = ChatBot.objects.create(user=self.user, session_id='stream-1')
+
+    def communicator(self, user, session_id='stream-1'):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chatbot/{session_id}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def stream(self, *tokens, error=None):
+        async def stream_chatbot_message(session, message):
+            for token in tokens:
+                yield token
+            if error:
+                raise error
+        return mock.patch.object(AIService, 'stream_chatbot_message', side_effect=stream_chatbot_message)
+
+    def chat(self, content):
+        async def scenario():
+            communicator = self.communicator(self.user)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_to(text_data=json.dumps({'type': 'chat_message', 'content': content}))
+            events = [json.loads(await communicator.receive_from())]
+            while events[-1]['type'] != 'bot_message_end':
+                events.append(json.loads(await communicator.receive_from()))
+            await communicator.disconnect()
+            return events
+
+        return async_to_sync(scenario)()
+
+    def test_tokens_streamed_and_reply_saved(self):
+        """اختبار بث الرد جزءاً بجزء ثم حفظه كرسالة واحدة"""
+        with self.stream('البلاستيك ', '4 جنيه', ' للكيلو'):
+            events = self.chat('كم سعر البلاستيك؟')
+
+        self.assertEqual([event['type'] for event in events],
+                         ['bot_message_start', 'bot_token', 'bot_token', 'bot_token', 'bot_message_end'])
+        self.assertEqual(events[0]['user_message']['content'], 'كم سعر البلاستيك؟')
+        self.assertEqual(''.join(event['token'] for event in events[1:-1]), 'البلاستيك 4 جنيه للكيلو')
+        self.assertEqual(events[-1]['message']['content'], 'البلاستيك 4 جنيه للكيلو')
+        self.assertEqual(
+            list(ChatBotMessage.objects.order_by('id').values_list('message_type', 'content')),
+            [('user', 'كم سعر البلاستيك؟'), ('bot', 'البلاستيك 4 جنيه للكيلو')],
+        )
+
+    def test_provider_error_replaced_with_apology(self):
+        with self.stream('جزء ', error=RuntimeError('provider down')):
+            events = self.chat('سؤال')
+
+        reply = ChatBotMessage.objects.get(message_type='bot')
+        self.assertEqual(events[-1]['message']['id'], reply.id)
+        self.assertIn('عذراً', reply.content)
+        self.assertEqual(reply.metadata['error'], 'provider down')
+
+    def test_foreign_or_anonymous_session_rejected(self):
+        other = User.objects.create_user(email='other@example.com', password='testpass123', full_name='Other')
+
+        async def scenario():
+            for user in (AnonymousUser(), other):
+                connected, _ = await self.communicator(user).connect()
+                self.assertFalse(connected)
+
+        async_to_sync(scenario)()
+
+
+def rate_limit_error(retry_after=None):
+    headers = {'retry-after': retry_after} if retry_after is not None else {}
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    return openai.RateLimitError('rate limited', response=httpx.Response(429, headers=headers, request=request), body=None)
+
+
+class FakeStream:
+    """بديل AsyncStream: يمر على الأجزاء ويُغلق بـ close()"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __aiter__(self):
+        return self.chunks
+
+    async def close(self):
+        self.closed = True
+        await self.chunks.aclose()
+
+
+class FakeCompletions:
+    """بديل عميل OpenAI: ينفذ الأخطاء المجدولة أولاً ثم يرد، ويسجل أقصى عدد طلبات متزامنة"""
+
+    def __init__(self, errors=(), delay=0, chunks=None):
+        self.errors = list(errors)
+        self.delay = delay
+        self.chunks = chunks
+        self.streams = []
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    def _enter(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+
+    async def _stream(self):
+        try:
+            for token in self.chunks:
+                await asyncio.sleep(self.delay)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+        finally:
+            self.active -= 1
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        if self.errors:
+            error = self.errors.pop(0)
+            if isinstance(error, (int, float)):
+                await asyncio.sleep(error)
+            else:
+                raise error
+        self._enter()
+        if stream:
+            self.streams.append(FakeStream(self._stream()))
+            return self.streams[-1]
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f'رد {self.calls}'))])
+
+
+class ModelProviderTestCase(TestCase):
+    def provider(self, completions, **kwargs):
+        provider = ModelProvider(**{'backoff_base': 0, 'max_retries': 2, **kwargs})
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        patcher = mock.patch.object(provider, '_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return provider
+
+    def test_timeout_retried(self):
+        """اختبار إلغاء المحاولة التي تتجاوز المهلة وإعادتها"""
+        completions = FakeCompletions(errors=[1])
+        provider = self.provider(completions, timeout=0.05)
+        self.assertEqual(asyncio.run(provider.chat('gpt', [])), 'رد 2')
+        self.assertEqual(completions.calls, 2)
+
+    def test_retries_exhausted(self):
+        completions = FakeCompletions(errors=[rate_limit_error()] * 3)
+        provider = self.provider(completions, max_retries=2)
+        with self.assertRaises(openai.RateLimitError):
+            asyncio.run(provider.chat('gpt', []))
+        self.assertEqual(completions.calls, 3)
+
+    def test_non_retryable_error_raised_immediately(self):
+        completions = FakeCompletions(errors=[ValueError('bad request')])
+        with self.assertRaises(ValueError):
+            asyncio.run(self.provider(completions).chat('gpt', []))
+        self.assertEqual(completions.calls, 1)
+
+    def test_retry_after_and_backoff(self):
+        """اختبار احترام Retry-After بحد أقصى، والتأخير الأُسّي عند غيابه"""
+        completions = FakeCompletions(errors=[rate_limit_error('2'), rate_limit_error('60')])
+        provider = self.provider(completions, backoff_max=8.0)
+        with mock.patch('ai_services.clients.asyncio.sleep', new_callable=mock.AsyncMock) as sleep:
+            self.assertEqual(asyncio.run(provider.chat('gpt', [])), 'رد 3')
+        self.assertEqual([call.args[0] for call in sleep.await_args_list], [2.0, 8.0])
+
+        provider = ModelProvider(backoff_base=0.5, backoff_max=8.0)
+        with mock.patch('ai_services.clients.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([provider._backoff(attempt, rate_limit_error()) for attempt in range(6)],
+                             [0.5, 1.0, 2.0, 4.0, 8.0, 8.0])
+
+    def test_concurrency_limit_per_model(self):
+        """اختبار أن الطلبات المتزامنة لا تتجاوز حد النموذج"""
+        completions = FakeCompletions(delay=0.01)
+        provider = self.provider(completions, concurrency={'default': 2, 'gpt-big': 1})
+
+        async def scenario(model):
+            return await asyncio.gather(*(provider.chat(model, []) for _ in range(5)))
+
+        self.assertEqual(len(asyncio.run(scenario('gpt'))), 5)
+        self.assertEqual(completions.max_active, 2)
+        completions.max_active = 0
+        asyncio.run(scenario('gpt-big'))
+        self.assertEqual(completions.max_active, 1)
+
+    def test_stream_holds_one_permit_until_finished(self):
+        """اختبار أن البث يحجز مكاناً واحداً طوال مدته فلا يُفتح بث آخر قبل انتهائه"""
+        completions = FakeCompletions(delay=0.01, chunks=['أ', 'ب', 'ج'])
+        provider = self.provider(completions, concurrency={'default': 1})
+
+        async def consume():
+            return ''.join([token async for token in provider.stream_chat('gpt', [])])
+
+        async def scenario():
+            return await asyncio.gather(consume(), consume(), provider.chat('gpt', []))
+
+        streamed_a, streamed_b, _ = asyncio.run(scenario())
+        self.assertEqual((streamed_a, streamed_b), ('أبج', 'أبج'))
+        self.assertEqual(completions.max_active, 1)
+        self.assertTrue(all(stream.closed for stream in completions.streams))
+
+    def test_stalled_stream_releases_permit(self):
+        """اختبار أن البث المتوقف في منتصفه ينتهي بالمهلة ويُغلق ويحرر مكانه"""
+        completions = FakeCompletions(delay=1, chunks=['أ', 'ب'])
+        provider = self.provider(completions, concurrency={'default': 1}, timeout=0.05)
+
+        async def scenario():
+            with self.assertRaises(asyncio.TimeoutError):
+                async for _ in provider.stream_chat('gpt', []):
+                    pass
+            completions.delay = 0
+            return await provider.chat('gpt', [])
+
+        self.assertEqual(asyncio.run(scenario()), 'رد 2')
+        self.assertTrue(completions.streams[0].closed)
+        self.assertEqual(completions.active, 0)
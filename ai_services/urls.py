@@ -3,7 +3,8 @@ from .views import (
     AIAnalysisListCreateView, AIAnalysisDetailView, ChatBotSessionListCreateView,
     ChatBotSessionDetailView, ChatBotMessageListCreateView, analyze_image,
     analyze_text, suggest_price, moderate_content, ai_stats, ai_models,
-    close_chatbot_session, ai_capabilities, classify_waste_image
+    close_chatbot_session, ai_capabilities, classify_waste_image,
+    rag_cache_stats
 )
 
 urlpatterns = [
@@ -21,4 +22,5 @@ urlpatterns = [
     path('stats/', ai_stats, name='ai-stats'),
     path('models/', ai_models, name='ai-models'),
     path('capabilities/', ai_capabilities, name='ai-capabilities'),
+    path('rag/cache-stats/', rag_cache_stats, name='rag-cache-stats'),
 ]
\ No newline at end of file
@@ -411,4 +411,12 @@ def ai_capabilities(request):
         }
     }
     
-    return Response(capabilities)
\ No newline at end of file
+    return Response(capabilities)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def rag_cache_stats(request):
+    """إحصائيات كاش استعلامات البوت الذكي"""
+    from .rag_cache import get_query_cache
+    return Response(get_query_cache().stats())
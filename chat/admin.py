@@ -1,11 +1,11 @@
 from django.contrib import admin
-from .models import Conversation, Message, MessageRead
+from .models import Conversation, Message
 
 class MessageInline(admin.TabularInline):
     model = Message
     extra = 0
     readonly_fields = ['created_at', 'updated_at']
-    fields = ['sender', 'message_type', 'content', 'is_read', 'is_deleted', 'created_at']
+    fields = ['sender', 'message_type', 'content', 'is_deleted', 'created_at']
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
@@ -34,10 +34,10 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['id', 'conversation', 'sender', 'message_type', 'content_preview', 'is_read', 'created_at']
-    list_filter = ['message_type', 'is_read', 'is_deleted', 'created_at']
+    list_display = ['id', 'conversation', 'sender', 'message_type', 'content_preview', 'created_at']
+    list_filter = ['message_type', 'is_deleted', 'created_at']
     search_fields = ['content', 'sender__full_name', 'conversation__title']
-    readonly_fields = ['created_at', 'updated_at', 'read_at']
+    readonly_fields = ['created_at', 'updated_at']
     
     fieldsets = (
         (None, {
@@ -48,10 +48,10 @@ class MessageAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Status', {
-            'fields': ('is_read', 'is_edited', 'is_deleted', 'reply_to')
+            'fields': ('is_edited', 'is_deleted', 'reply_to')
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'updated_at', 'read_at'),
+            'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         })
     )
@@ -59,9 +59,3 @@ class MessageAdmin(admin.ModelAdmin):
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'محتوى الرسالة'
-
-@admin.register(MessageRead)
-class MessageReadAdmin(admin.ModelAdmin):
-    list_display = ['message', 'user', 'read_at']
-    list_filter = ['read_at']
-    search_fields = ['message__content', 'user__full_name']
\ No newline at end of file
@@ -2,8 +2,8 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from .models import Conversation, Message
-from .serializers import MessageSerializer
+from .presence import get_presence_registry
+from .services import ConversationMembership, MessageService, ReadCursorService
 
 User = get_user_model()
 
@@ -26,26 +26,38 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
-        # إرسال إشعار بالاتصال
-        await self.channel_layer.group_send(
-            self.conversation_group_name,
-            {
-                'type': 'user_status',
-                'user_id': self.user.id,
-                'status': 'online'
-            }
-        )
+        # تسجيل الاتصال في سجل المتصلين وإرسال قائمتهم الحالية للعميل
+        self.presence = get_presence_registry()
+        came_online = await self.presence.join(self.conversation_id, self.user.id, self.channel_name)
+        await self.send_presence()
+        
+        # الإعلان عن الاتصال فقط عند أول اتصال للمستخدم (وليس لكل تبويب)
+        if came_online:
+            await self.channel_layer.group_send(
+                self.conversation_group_name,
+                {
+                    'type': 'user_status',
+                    'user_id': self.user.id,
+                    'status': 'online'
+                }
+            )
 
     async def disconnect(self, close_code):
-        # إرسال إشعار بقطع الاتصال
-        await self.channel_layer.group_send(
-            self.conversation_group_name,
-            {
-                'type': 'user_status',
-                'user_id': self.user.id,
-                'status': 'offline'
-            }
-        )
+        # الاتصال الذي رُفض قبل القبول لا يملك حالة
+        if not hasattr(self, 'presence'):
+            return
+        
+        # إرسال إشعار بقطع الاتصال عند إغلاق آخر اتصال للمستخدم فقط
+        went_offline = await self.presence.leave(self.conversation_id, self.user.id, self.channel_name)
+        if went_offline:
+            await self.channel_layer.group_send(
+                self.conversation_group_name,
+                {
+                    'type': 'user_status',
+                    'user_id': self.user.id,
+                    'status': 'offline'
+                }
+            )
         
         # مغادرة مجموعة المحادثة
         await self.channel_layer.group_discard(
@@ -64,6 +76,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.handle_typing(text_data_json)
             elif message_type == 'mark_read':
                 await self.handle_mark_read(text_data_json)
+            elif message_type == 'heartbeat':
+                await self.presence.heartbeat(self.conversation_id, self.user.id, self.channel_name)
+            elif message_type == 'presence':
+                await self.send_presence()
                 
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
@@ -77,8 +93,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if not content.strip():
             return
         
-        # حفظ الرسالة في قاعدة البيانات
-        message = await self.save_message(content, reply_to_id)
+        # حفظ الرسالة وبناء حمولتها في رحلة واحدة لقاعدة البيانات
+        message = await self.create_message(content, reply_to_id)
         
         if message:
             # إرسال الرسالة لجميع المشاركين
@@ -86,7 +102,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.conversation_group_name,
                 {
                     'type': 'chat_message',
-                    'message': await self.serialize_message(message)
+                    'message': message
                 }
             )
 
@@ -105,26 +121,33 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
     async def handle_mark_read(self, data):
-        message_id = data.get('message_id')
+        # بدون message_id تُعتبر المحادثة كلها مقروءة
+        cursor = await self.advance_read_cursor(data.get('message_id'))
         
-        if message_id:
-            await self.mark_message_read(message_id)
-            
-            # إرسال إشعار القراءة
+        # إرسال إيصال القراءة كحركة للمؤشر، فقط إذا تحرك فعلاً
+        if cursor:
             await self.channel_layer.group_send(
                 self.conversation_group_name,
                 {
-                    'type': 'message_read',
-                    'message_id': message_id,
-                    'user_id': self.user.id
+                    'type': 'read_cursor',
+                    'user_id': self.user.id,
+                    'last_read_message_id': cursor
                 }
             )
 
+    async def send_presence(self):
+        online_users = await self.presence.online_users(self.conversation_id)
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'online_users': sorted(online_users),
+            'heartbeat_interval': self.presence.heartbeat_interval
+        }))
+
     # معالجات الرسائل الواردة من المجموعة
     async def chat_message(self, event):
         await self.send(text_data=json.dumps({
             'type': 'chat_message',
-            'message': event['message']
+            'message': MessageService.permissions_for(event['message'], self.user.id)
         }))
 
     async def typing_status(self, event):
@@ -146,58 +169,31 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'status': event['status']
             }))
 
-    async def message_read(self, event):
+    async def read_cursor(self, event):
         await self.send(text_data=json.dumps({
-            'type': 'message_read',
-            'message_id': event['message_id'],
-            'user_id': event['user_id']
+            'type': 'read_cursor',
+            'user_id': event['user_id'],
+            'last_read_message_id': event['last_read_message_id']
         }))
 
     # دوال مساعدة
     @database_sync_to_async
     def is_participant(self):
-        try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return conversation.participants.filter(id=self.user.id).exists()
-        except Conversation.DoesNotExist:
-            return False
+        return ConversationMembership.is_participant(self.conversation_id, self.user.id)
 
     @database_sync_to_async
-    def save_message(self, content, reply_to_id=None):
+    def create_message(self, content, reply_to_id=None):
         try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            
-            message = Message.objects.create(
-                conversation=conversation,
-                sender=self.user,
-                content=content,
-                reply_to_id=reply_to_id
-            )
-            
-            return message
+            return MessageService.create_text_message(self.conversation_id, self.user, content, reply_to_id)
         except Exception:
             return None
 
     @database_sync_to_async
-    def serialize_message(self, message):
-        from django.http import HttpRequest
-        request = HttpRequest()
-        request.user = self.user
-        
-        serializer = MessageSerializer(message, context={'request': request})
-        return serializer.data
-
-    @database_sync_to_async
-    def mark_message_read(self, message_id):
+    def advance_read_cursor(self, message_id=None):
         try:
-            message = Message.objects.get(
-                id=message_id,
-                conversation_id=self.conversation_id
-            )
-            if message.sender != self.user:
-                message.mark_as_read(self.user)
-        except Message.DoesNotExist:
-            pass
+            return ReadCursorService.advance(self.conversation_id, self.user.id, message_id)
+        except (TypeError, ValueError):
+            return None
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -0,0 +1,200 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:06
+
+from itertools import islice
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+FILL_CHUNK_SIZE = 500
+
+
+def count_of(messages):
+    """عدّ الرسائل كاستعلام فرعي مرتبط بصف المشارك"""
+    counts = messages.order_by().values('conversation_id').annotate(count=models.Count('id')).values('count')
+    return Coalesce(Subquery(counts), 0)
+
+
+def fill_inboxes(apps, schema_editor):
+    """
+    صندوق لكل مشارك بالحالة الحالية. الأعداد ومؤشر القراءة تُحسب باستعلامات فرعية لكل دفعة
+    من المحادثات بدل عدة استعلامات لكل مشارك، والصفوف تُكتب دفعة دفعة.
+    """
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationInbox = apps.get_model('chat', 'ConversationInbox')
+    Message = apps.get_model('chat', 'Message')
+    Participant = Conversation.participants.through
+
+    visible = Message.objects.filter(is_deleted=False)
+    received = visible.filter(conversation_id=OuterRef('conversation_id')).exclude(sender_id=OuterRef('user_id'))
+    unread = received.filter(is_read=False)
+
+    conversation_ids = Conversation.objects.order_by('pk').values_list('pk', flat=True).iterator()
+    while chunk := list(islice(conversation_ids, FILL_CHUNK_SIZE)):
+        conversations = {
+            conversation['pk']: conversation
+            for conversation in Conversation.objects.filter(pk__in=chunk).annotate(
+                latest_id=Subquery(
+                    visible.filter(conversation_id=OuterRef('pk')).order_by('-created_at', '-id').values('id')[:1]
+                ),
+                max_id=Subquery(visible.filter(conversation_id=OuterRef('pk')).order_by('-id').values('id')[:1]),
+            ).values('pk', 'updated_at', 'latest_id', 'max_id')
+        }
+        latest_messages = Message.objects.select_related('sender').in_bulk(
+            [conversation['latest_id'] for conversation in conversations.values() if conversation['latest_id']]
+        )
+        participants = Participant.objects.filter(conversation_id__in=chunk).annotate(
+            received_count=count_of(received),
+            unread_count=count_of(unread),
+            first_unread_id=Subquery(unread.order_by('id').values('id')[:1]),
+        ).annotate(
+            # آخر رسالة قبل أول رسالة غير مقروءة
+            read_before_id=Subquery(
+                visible.filter(conversation_id=OuterRef('conversation_id'), id__lt=OuterRef('first_unread_id'))
+                .order_by('-id').values('id')[:1]
+            ),
+        ).values_list('conversation_id', 'user_id', 'received_count', 'unread_count', 'first_unread_id', 'read_before_id')
+
+        inboxes = []
+        for conversation_id, user_id, received_count, unread_count, first_unread_id, read_before_id in participants:
+            conversation = conversations[conversation_id]
+            latest = latest_messages.get(conversation['latest_id'])
+            content = latest.content if latest else ''
+            inboxes.append(ConversationInbox(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                last_message=latest,
+                last_message_sender_name=latest.sender.full_name if latest else '',
+                last_message_preview=content[:100] + '...' if len(content) > 100 else content,
+                last_message_type=latest.message_type if latest else '',
+                last_message_at=latest.created_at if latest else None,
+                last_activity_at=latest.created_at if latest else conversation['updated_at'],
+                last_read_message_id=conversation['max_id'] if first_unread_id is None else read_before_id,
+                unread_count=unread_count,
+                received_count=received_count,
+            ))
+        ConversationInbox.objects.bulk_create(inboxes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0002_feed_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConversationInbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "last_message_sender_name",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="مرسل آخر رسالة"
+                    ),
+                ),
+                (
+                    "last_message_preview",
+                    models.CharField(
+                        blank=True, max_length=103, verbose_name="معاينة آخر رسالة"
+                    ),
+                ),
+                (
+                    "last_message_type",
+                    models.CharField(
+                        blank=True, max_length=20, verbose_name="نوع آخر رسالة"
+                    ),
+                ),
+                (
+                    "last_message_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="وقت آخر رسالة"
+                    ),
+                ),
+                (
+                    "last_activity_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="آخر نشاط"
+                    ),
+                ),
+                (
+                    "unread_count",
+                    models.PositiveIntegerField(default=0, verbose_name="غير المقروء"),
+                ),
+                (
+                    "received_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="الرسائل المستلمة"
+                    ),
+                ),
+                (
+                    "conversation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="inboxes",
+                        to="chat.conversation",
+                        verbose_name="المحادثة",
+                    ),
+                ),
+                (
+                    "last_message",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="chat.message",
+                        verbose_name="آخر رسالة",
+                    ),
+                ),
+                (
+                    "last_read_message",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="chat.message",
+                        verbose_name="آخر رسالة مقروءة",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="conversation_inboxes",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="المستخدم",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "صندوق محادثة",
+                "verbose_name_plural": "صناديق المحادثات",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-last_activity_at"], name="chat_inbox_user_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("conversation", "user"),
+                        name="chat_inbox_unique_participant",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_inboxes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_last_read_at(apps, schema_editor):
+    ConversationInbox = apps.get_model('chat', 'ConversationInbox')
+    inboxes = list(
+        ConversationInbox.objects.filter(last_read_message__isnull=False)
+        .annotate(read_time=Coalesce('last_read_message__read_at', 'last_read_message__created_at'))
+        .only('id')
+    )
+    for inbox in inboxes:
+        inbox.last_read_at = inbox.read_time
+    ConversationInbox.objects.bulk_update(inboxes, ['last_read_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0003_conversation_inbox"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversationinbox",
+            name="last_read_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="وقت آخر قراءة"
+            ),
+        ),
+        migrations.RunPython(fill_last_read_at, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="messageread",
+            unique_together=None,
+        ),
+        migrations.RemoveField(
+            model_name="messageread",
+            name="message",
+        ),
+        migrations.RemoveField(
+            model_name="messageread",
+            name="user",
+        ),
+        migrations.RemoveField(
+            model_name="message",
+            name="is_read",
+        ),
+        migrations.RemoveField(
+            model_name="message",
+            name="read_at",
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["conversation", "id"], name="chat_message_cursor_idx"
+            ),
+        ),
+        migrations.DeleteModel(
+            name="MessageRead",
+        ),
+    ]
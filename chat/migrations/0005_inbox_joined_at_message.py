@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0004_read_cursors"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversationinbox",
+            name="joined_at_message_id",
+            field=models.BigIntegerField(
+                blank=True, null=True, verbose_name="آخر رسالة عند الانضمام"
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def clear_dangling_cursors(apps, schema_editor):
+    """قبل إعادة المفتاح الأجنبي: المؤشرات التي حُذفت رسائلها ترجع فارغة كما كان SET_NULL يفعل"""
+    ConversationInbox = apps.get_model('chat', 'ConversationInbox')
+    Message = apps.get_model('chat', 'Message')
+    ConversationInbox.objects.filter(last_read_message_id__isnull=False).exclude(
+        last_read_message_id__in=Message.objects.values('id')
+    ).update(last_read_message_id=None)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0005_inbox_joined_at_message"),
+    ]
+
+    # العمود last_read_message_id يبقى بقيمه، ويُحذف القيد والفهرس فقط
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AlterField(
+                    model_name="conversationinbox",
+                    name="last_read_message",
+                    field=models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="chat.message",
+                        verbose_name="آخر رسالة مقروءة",
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveField(
+                    model_name="conversationinbox",
+                    name="last_read_message",
+                ),
+                migrations.AddField(
+                    model_name="conversationinbox",
+                    name="last_read_message_id",
+                    field=models.BigIntegerField(
+                        blank=True, null=True, verbose_name="آخر رسالة مقروءة"
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(migrations.RunPython.noop, clear_dangling_cursors),
+    ]
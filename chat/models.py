@@ -45,8 +45,9 @@ class Conversation(models.Model):
         return self.participants.exclude(id=user.id).first()
 
     def mark_as_read(self, user):
-        """تحديد جميع الرسائل كمقروءة للمستخدم"""
-        self.messages.filter(is_read=False).exclude(sender=user).update(is_read=True)
+        """تحريك مؤشر قراءة المستخدم إلى آخر رسالة"""
+        from .services import ReadCursorService
+        return ReadCursorService.advance(self.pk, user.pk)
 
 class Message(models.Model):
     MESSAGE_TYPES = [
@@ -72,8 +73,7 @@ class Message(models.Model):
     latitude = models.FloatField(_('خط العرض'), null=True, blank=True)
     longitude = models.FloatField(_('خط الطول'), null=True, blank=True)
     
-    # Message status
-    is_read = models.BooleanField(_('مقروء'), default=False)
+    # Message status (حالة القراءة في مؤشر كل مستخدم: ConversationInbox.last_read_message_id)
     is_edited = models.BooleanField(_('معدل'), default=False)
     is_deleted = models.BooleanField(_('محذوف'), default=False)
     
@@ -83,39 +83,70 @@ class Message(models.Model):
     # Timestamps
     created_at = models.DateTimeField(_('تاريخ الإنشاء'), auto_now_add=True)
     updated_at = models.DateTimeField(_('تاريخ التحديث'), auto_now=True)
-    read_at = models.DateTimeField(_('تاريخ القراءة'), null=True, blank=True)
 
     class Meta:
         verbose_name = _('رسالة')
         verbose_name_plural = _('الرسائل')
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at', 'id'], name='chat_message_feed_idx'),
+            # عدّ غير المقروء كنطاق بعد مؤشر القراءة
+            models.Index(fields=['conversation', 'id'], name='chat_message_cursor_idx'),
+        ]
 
     def __str__(self):
         return f'{self.sender.full_name}: {self.content[:50]}...'
 
     def save(self, *args, **kwargs):
+        adding = self._state.adding
         super().save(*args, **kwargs)
-        # Update conversation's last message time
-        self.conversation.last_message_at = self.created_at
-        self.conversation.save()
-
-    def mark_as_read(self, user=None):
-        """تحديد الرسالة كمقروءة"""
-        if not self.is_read and (user is None or self.sender != user):
-            self.is_read = True
-            self.read_at = timezone.now()
-            self.save()
-
-class MessageRead(models.Model):
-    """تتبع قراءة الرسائل لكل مستخدم في المحادثات الجماعية"""
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='read_by', verbose_name=_('الرسالة'))
-    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_('المستخدم'))
-    read_at = models.DateTimeField(_('تاريخ القراءة'), auto_now_add=True)
+        if adding:
+            # تحديث وقت آخر رسالة باستعلام UPDATE شرطي واحد بدل قراءة المحادثة وحفظها كاملة
+            Conversation.objects.filter(pk=self.conversation_id).filter(
+                models.Q(last_message_at__isnull=True) | models.Q(last_message_at__lt=self.created_at)
+            ).update(last_message_at=self.created_at)
+            if Message.conversation.is_cached(self):
+                conversation = self.conversation
+                if conversation.last_message_at is None or conversation.last_message_at < self.created_at:
+                    conversation.last_message_at = self.created_at
+
+    def mark_as_read(self, user):
+        """تحريك مؤشر قراءة المستخدم حتى هذه الرسالة"""
+        from .services import ReadCursorService
+        return ReadCursorService.advance(self.conversation_id, user.pk, self.pk)
+
+class ConversationInbox(models.Model):
+    """صندوق محادثات كل مشارك: لقطة آخر رسالة وعدادات غير المقروء، تُحدّث تدريجياً مع كل رسالة وقراءة"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='inboxes', verbose_name=_('المحادثة'))
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_inboxes', verbose_name=_('المستخدم'))
+    
+    # لقطة آخر رسالة
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name=_('آخر رسالة'))
+    last_message_sender_name = models.CharField(_('مرسل آخر رسالة'), max_length=255, blank=True)
+    last_message_preview = models.CharField(_('معاينة آخر رسالة'), max_length=103, blank=True)
+    last_message_type = models.CharField(_('نوع آخر رسالة'), max_length=20, blank=True)
+    last_message_at = models.DateTimeField(_('وقت آخر رسالة'), null=True, blank=True)
+    # وقت آخر رسالة أو الانضمام، للترتيب بلا قيم فارغة
+    last_activity_at = models.DateTimeField(_('آخر نشاط'), default=timezone.now)
+    
+    # القراءة
+    # معرف فقط بلا مفتاح أجنبي: حذف الرسالة نهائياً لا يعيد المؤشر للبداية
+    last_read_message_id = models.BigIntegerField(_('آخر رسالة مقروءة'), null=True, blank=True)
+    last_read_at = models.DateTimeField(_('وقت آخر قراءة'), null=True, blank=True)
+    unread_count = models.PositiveIntegerField(_('غير المقروء'), default=0)
+    received_count = models.PositiveIntegerField(_('الرسائل المستلمة'), default=0)
+    # آخر رسالة في المحادثة وقت الانضمام: ما قبلها لم يستلمه المشارك (فارغ للمشاركين من البداية)
+    joined_at_message_id = models.BigIntegerField(_('آخر رسالة عند الانضمام'), null=True, blank=True)
 
     class Meta:
-        unique_together = ['message', 'user']
-        verbose_name = _('قراءة الرسالة')
-        verbose_name_plural = _('قراءات الرسائل')
+        verbose_name = _('صندوق محادثة')
+        verbose_name_plural = _('صناديق المحادثات')
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='chat_inbox_unique_participant'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at'], name='chat_inbox_user_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.user.full_name} read message at {self.read_at}'
\ No newline at end of file
+        return f'{self.user} - {self.conversation_id}'
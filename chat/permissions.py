@@ -1,18 +1,27 @@
 from rest_framework import permissions
+from .models import Conversation
+from .services import ConversationMembership
 
 class IsConversationParticipant(permissions.BasePermission):
     """
     صلاحية للتأكد من أن المستخدم مشارك في المحادثة
     """
     
+    def has_permission(self, request, view):
+        # المسارات المتداخلة تحت محادثة (الرسائل) لا تستدعي has_object_permission
+        conversation_id = view.kwargs.get('conversation_id')
+        if conversation_id is None:
+            return True
+        return ConversationMembership.is_participant(conversation_id, request.user.id)
+    
     def has_object_permission(self, request, view, obj):
         # للمحادثات
-        if hasattr(obj, 'participants'):
-            return obj.participants.filter(id=request.user.id).exists()
+        if isinstance(obj, Conversation):
+            return ConversationMembership.is_participant(obj.pk, request.user.id)
         
         # للرسائل
-        if hasattr(obj, 'conversation'):
-            return obj.conversation.participants.filter(id=request.user.id).exists()
+        if hasattr(obj, 'conversation_id'):
+            return ConversationMembership.is_participant(obj.conversation_id, request.user.id)
         
         return False
 
@@ -0,0 +1,128 @@
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PresenceRegistry(ABC):
+    """
+    سجل المتصلين في كل محادثة.
+    كل اتصال WebSocket يُسجل كعضو "user_id:channel_name" بوقت انتهاء، ويجدد نبضُ القلب
+    (heartbeat) الوقت؛ الاتصالات التي توقف عاملها دون قطع نظيف تنتهي تلقائياً بعد TTL.
+    المستخدم متصل إذا كان له اتصال واحد حي على الأقل (عدة تبويبات أو أجهزة).
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+
+    @staticmethod
+    def member(user_id, channel_name):
+        return f'{user_id}:{channel_name}'
+
+    @staticmethod
+    def user_ids(members):
+        return {int(str(member).split(':', 1)[0]) for member in members}
+
+    @abstractmethod
+    async def touch(self, conversation_id, user_id, channel_name):
+        """تسجيل الاتصال أو تجديده"""
+
+    @abstractmethod
+    async def remove(self, conversation_id, user_id, channel_name):
+        """إزالة الاتصال من السجل"""
+
+    @abstractmethod
+    async def members(self, conversation_id):
+        """الاتصالات الحية في المحادثة"""
+
+    async def online_users(self, conversation_id):
+        return self.user_ids(await self.members(conversation_id))
+
+    async def join(self, conversation_id, user_id, channel_name):
+        """تسجيل اتصال جديد؛ ترجع True إذا أصبح المستخدم متصلاً للتو"""
+        was_online = user_id in await self.online_users(conversation_id)
+        await self.touch(conversation_id, user_id, channel_name)
+        return not was_online
+
+    @property
+    def heartbeat_interval(self):
+        """الفترة المقترحة للعميل بين نبضتين؛ ثلاث نبضات فائتة قبل انتهاء الاتصال"""
+        return max(self.ttl // 3, 1)
+
+    async def heartbeat(self, conversation_id, user_id, channel_name):
+        await self.touch(conversation_id, user_id, channel_name)
+
+    async def leave(self, conversation_id, user_id, channel_name):
+        """إزالة اتصال؛ ترجع True إذا لم يبق للمستخدم اتصال آخر"""
+        await self.remove(conversation_id, user_id, channel_name)
+        return user_id not in await self.online_users(conversation_id)
+
+
+class LocalPresenceRegistry(PresenceRegistry):
+    """سجل داخل العملية للتطوير والاختبارات (عامل ASGI واحد)"""
+
+    def __init__(self, ttl=60, **kwargs):
+        super().__init__(ttl)
+        self.conversations = {}
+
+    async def touch(self, conversation_id, user_id, channel_name):
+        members = self.conversations.setdefault(conversation_id, {})
+        members[self.member(user_id, channel_name)] = time.time() + self.ttl
+
+    async def remove(self, conversation_id, user_id, channel_name):
+        members = self.conversations.get(conversation_id, {})
+        members.pop(self.member(user_id, channel_name), None)
+        if not members:
+            self.conversations.pop(conversation_id, None)
+
+    async def members(self, conversation_id):
+        now = time.time()
+        members = self.conversations.get(conversation_id, {})
+        for member in [member for member, expires_at in members.items() if expires_at <= now]:
+            del members[member]
+        return list(members)
+
+
+class RedisPresenceRegistry(PresenceRegistry):
+    """سجل مشترك بين كل العمال: مجموعة مرتبة لكل محادثة، درجة العضو هي وقت انتهائه"""
+
+    key_prefix = 'chat:presence'
+
+    def __init__(self, ttl=60, url=None, client=None, **kwargs):
+        super().__init__(ttl)
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+
+    def key(self, conversation_id):
+        return f'{self.key_prefix}:{conversation_id}'
+
+    async def touch(self, conversation_id, user_id, channel_name):
+        key = self.key(conversation_id)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zadd(key, {self.member(user_id, channel_name): time.time() + self.ttl})
+            # المحادثة التي لا يجددها أحد تُحذف بالكامل
+            pipe.expire(key, self.ttl * 2)
+            await pipe.execute()
+
+    async def remove(self, conversation_id, user_id, channel_name):
+        await self.client.zrem(self.key(conversation_id), self.member(user_id, channel_name))
+
+    async def members(self, conversation_id):
+        key = self.key(conversation_id)
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.zrangebyscore(key, now, '+inf')
+            _, members = await pipe.execute()
+        return members
+
+
+@lru_cache(maxsize=None)
+def get_presence_registry():
+    config = dict(getattr(settings, 'CHAT_PRESENCE', {}))
+    backend = import_string(config.pop('BACKEND', 'chat.presence.LocalPresenceRegistry'))
+    return backend(ttl=config.pop('TTL', 60), url=config.pop('URL', None), **config)
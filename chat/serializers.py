@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Conversation, Message, MessageRead
+from .models import Conversation, ConversationInbox, Message
+from .services import ReadCursorService
 from accounts.serializers import UserPublicSerializer
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -9,6 +10,8 @@ class MessageSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     can_edit = serializers.SerializerMethodField()
     can_delete = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
+    read_at = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
@@ -18,6 +21,23 @@ class MessageSerializer(serializers.ModelSerializer):
                  'can_edit', 'can_delete']
         read_only_fields = ['id', 'sender', 'is_read', 'is_edited', 'created_at', 'updated_at', 'read_at']
 
+    def get_read_state(self, obj):
+        """حالة القراءة من مؤشرات المشاركين؛ تُحمّل مرة واحدة لكل محادثة في الصفحة"""
+        request = self.context.get('request')
+        if not request or not request.user.is_authenticated:
+            return False, None
+        cursors = self.context.setdefault('read_cursors', {})
+        if obj.conversation_id not in cursors:
+            cursors[obj.conversation_id] = ReadCursorService.cursors(obj.conversation_id)
+        return ReadCursorService.read_state(obj.id, obj.sender_id, request.user.id, cursors[obj.conversation_id])
+
+    def get_is_read(self, obj):
+        return self.get_read_state(obj)[0]
+
+    def get_read_at(self, obj):
+        read_at = self.get_read_state(obj)[1]
+        return serializers.DateTimeField().to_representation(read_at) if read_at else None
+
     def get_reply_to(self, obj):
         if obj.reply_to:
             return {
@@ -93,28 +113,36 @@ class ConversationSerializer(serializers.ModelSerializer):
                  'last_message_at', 'last_message', 'unread_count', 'other_participant']
         read_only_fields = ['id', 'created_at', 'updated_at', 'last_message_at']
 
+    def get_inbox(self, obj):
+        """صف صندوق المستخدم الحالي؛ قائمة المحادثات ترفقه مسبقاً في user_inbox"""
+        if not hasattr(obj, 'user_inbox'):
+            request = self.context.get('request')
+            obj.user_inbox = None
+            if request and request.user.is_authenticated:
+                obj.user_inbox = ConversationInbox.objects.filter(conversation=obj, user=request.user).first()
+        return obj.user_inbox
+
     def get_last_message(self, obj):
-        last_message = obj.messages.filter(is_deleted=False).last()
-        if last_message:
+        inbox = self.get_inbox(obj)
+        if inbox and inbox.last_message_id:
             return {
-                'id': last_message.id,
-                'sender_name': last_message.sender.full_name,
-                'content': last_message.content[:100] + '...' if len(last_message.content) > 100 else last_message.content,
-                'message_type': last_message.message_type,
-                'created_at': last_message.created_at
+                'id': inbox.last_message_id,
+                'sender_name': inbox.last_message_sender_name,
+                'content': inbox.last_message_preview,
+                'message_type': inbox.last_message_type,
+                'created_at': inbox.last_message_at
             }
         return None
 
     def get_unread_count(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.messages.filter(is_read=False, is_deleted=False).exclude(sender=request.user).count()
-        return 0
+        inbox = self.get_inbox(obj)
+        return inbox.unread_count if inbox else 0
 
     def get_other_participant(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated and obj.conversation_type == 'direct':
-            other_user = obj.get_other_participant(request.user)
+            # المشاركون محملون مسبقاً في القائمة، فالبحث في الذاكرة
+            other_user = next((user for user in obj.participants.all() if user.id != request.user.id), None)
             if other_user:
                 return UserPublicSerializer(other_user, context=self.context).data
         return None
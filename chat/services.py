@@ -0,0 +1,412 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from rest_framework import serializers
+
+from accounts.serializers import UserPublicSerializer
+
+from .models import Conversation, ConversationInbox, Message
+
+# يمكن تعديل الرسالة خلال 15 دقيقة من إرسالها
+EDIT_WINDOW_SECONDS = 900
+REPLY_PREVIEW_LENGTH = 100
+MEMBERSHIP_CACHE_PREFIX = 'chat:participants'
+
+logger = logging.getLogger(__name__)
+
+
+def preview_text(content):
+    return content[:REPLY_PREVIEW_LENGTH] + '...' if len(content) > REPLY_PREVIEW_LENGTH else content
+
+
+def reply_preview(reply_id, sender_name, content, message_type):
+    return {
+        'id': reply_id,
+        'sender_name': sender_name,
+        'content': preview_text(content),
+        'message_type': message_type,
+    }
+
+
+class MessageService:
+    """
+    المسار السريع لرسائل WebSocket: معاملة واحدة لكل رسالة (إدراج الرسالة وتحديث المحادثة)
+    وبناء الحمولة مما هو متاح في الذاكرة بدل إعادة قراءة الرسالة وتسلسلها بـ MessageSerializer.
+    """
+
+    @staticmethod
+    def create_text_message(conversation_id, sender, content, reply_to_id=None):
+        """حفظ رسالة نصية وإرجاع حمولتها بنفس شكل MessageSerializer، أو None إذا كان الرد غير صالح"""
+        with transaction.atomic():
+            reply = None
+            if reply_to_id:
+                # الرسالة المرد عليها يجب أن تكون في نفس المحادثة
+                reply = Message.objects.filter(
+                    pk=reply_to_id, conversation_id=conversation_id
+                ).values_list('pk', 'sender__full_name', 'content', 'message_type').first()
+                if reply is None:
+                    return None
+
+            message = Message(
+                conversation_id=conversation_id,
+                sender=sender,
+                content=content,
+                reply_to_id=reply[0] if reply else None,
+            )
+            message.save()
+
+        return MessageService.payload(message, sender, reply_preview(*reply) if reply else None)
+
+    @staticmethod
+    def payload(message, sender, reply=None):
+        datetime_field = serializers.DateTimeField()
+        return {
+            'id': message.pk,
+            'sender': UserPublicSerializer(sender).data,
+            'message_type': message.message_type,
+            'content': message.content,
+            'image': None,
+            'image_url': None,
+            'file': None,
+            'file_url': None,
+            'latitude': message.latitude,
+            'longitude': message.longitude,
+            'is_read': False,
+            'is_edited': message.is_edited,
+            'is_deleted': message.is_deleted,
+            'reply_to': reply,
+            'created_at': datetime_field.to_representation(message.created_at),
+            'updated_at': datetime_field.to_representation(message.updated_at),
+            'read_at': None,
+            # صلاحيات التعديل والحذف تخص المرسل وحده، ويضبطها كل مستقبل لنفسه
+            'can_edit': False,
+            'can_delete': False,
+        }
+
+    @staticmethod
+    def permissions_for(payload, user_id):
+        """ضبط can_edit و can_delete للمستقبل الحالي"""
+        is_sender = payload['sender']['id'] == user_id
+        created_at = serializers.DateTimeField().to_internal_value(payload['created_at'])
+        return {
+            **payload,
+            'can_edit': is_sender and (timezone.now() - created_at).total_seconds() < EDIT_WINDOW_SECONDS,
+            'can_delete': is_sender,
+        }
+
+
+class ConversationMembership:
+    """
+    التحقق من عضوية المحادثة من ذاكرة مؤقتة بدل استعلام participants لكل اتصال وطلب.
+    مجموعات معرفات المشاركين تُحفظ في ذاكرة العملية لثوانٍ قليلة وفي الكاش المشترك لمدة أطول،
+    وتُمسح عند تغيير المشاركين (m2m_changed). العمليات الأخرى تلتقط الإزالة بعد انتهاء نسختها المحلية.
+    مفتاح الكاش المشترك يحمل رقم جيل يرفعه المسح، فالقراءة التي سبقت التغيير وكتبت نتيجتها بعده
+    تكتب تحت جيل قديم لا يقرؤه أحد. الطبقة المشتركة تعمل فقط مع كاش تراه كل العمليات
+    (CHAT_MEMBERSHIP_SHARED)، وإلا فالنسخة المحلية قصيرة العمر هي الكاش الوحيد.
+    """
+
+    _local = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def shared():
+        return getattr(settings, 'CHAT_MEMBERSHIP_SHARED', False)
+
+    @staticmethod
+    def generation_key(conversation_id):
+        return f'{MEMBERSHIP_CACHE_PREFIX}:generation:{conversation_id}'
+
+    @staticmethod
+    def cache_key(conversation_id, generation):
+        return f'{MEMBERSHIP_CACHE_PREFIX}:{conversation_id}:{generation}'
+
+    @staticmethod
+    def generation(conversation_id):
+        """الجيل الحالي؛ إذا سقط المفتاح من الكاش يبدأ جيل جديد لا يطابق أي مفتاح قديم"""
+        key = ConversationMembership.generation_key(conversation_id)
+        generation = cache.get(key)
+        if generation is None:
+            cache.add(key, time.time_ns(), None)
+            generation = cache.get(key)
+        return generation
+
+    @staticmethod
+    def _bump_generations(conversation_ids):
+        for conversation_id in conversation_ids:
+            key = ConversationMembership.generation_key(conversation_id)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), None)
+
+    @staticmethod
+    def _get_local(conversation_id):
+        with ConversationMembership._lock:
+            entry = ConversationMembership._local.get(conversation_id)
+            if entry is None:
+                return None
+            participant_ids, expires_at = entry
+            if expires_at <= time.monotonic():
+                del ConversationMembership._local[conversation_id]
+                return None
+            ConversationMembership._local.move_to_end(conversation_id)
+            return participant_ids
+
+    @staticmethod
+    def _set_local(conversation_id, participant_ids):
+        ttl = getattr(settings, 'CHAT_MEMBERSHIP_LOCAL_TTL', 5)
+        max_entries = getattr(settings, 'CHAT_MEMBERSHIP_LOCAL_SIZE', 10000)
+        with ConversationMembership._lock:
+            ConversationMembership._local[conversation_id] = (participant_ids, time.monotonic() + ttl)
+            ConversationMembership._local.move_to_end(conversation_id)
+            while len(ConversationMembership._local) > max_entries:
+                ConversationMembership._local.popitem(last=False)
+
+    @staticmethod
+    def participant_ids(conversation_id):
+        """معرفات مشاركي المحادثة (مجموعة فارغة إذا لم تكن موجودة)"""
+        conversation_id = int(conversation_id)
+        participant_ids = ConversationMembership._get_local(conversation_id)
+        if participant_ids is not None:
+            return participant_ids
+
+        shared = ConversationMembership.shared()
+        if shared:
+            key = ConversationMembership.cache_key(conversation_id, ConversationMembership.generation(conversation_id))
+            cached = cache.get(key)
+        else:
+            cached = None
+        if cached is None:
+            cached = list(
+                Conversation.participants.through.objects.filter(conversation_id=conversation_id)
+                .values_list('user_id', flat=True)
+            )
+            if shared:
+                cache.set(key, cached, getattr(settings, 'CHAT_MEMBERSHIP_TIMEOUT', 3600))
+        participant_ids = frozenset(cached)
+        ConversationMembership._set_local(conversation_id, participant_ids)
+        return participant_ids
+
+    @staticmethod
+    def is_participant(conversation_id, user_id):
+        try:
+            return user_id in ConversationMembership.participant_ids(conversation_id)
+        except (TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _forget(conversation_ids):
+        with ConversationMembership._lock:
+            for conversation_id in conversation_ids:
+                ConversationMembership._local.pop(conversation_id, None)
+        if ConversationMembership.shared():
+            ConversationMembership._bump_generations(conversation_ids)
+
+    @staticmethod
+    def invalidate(*conversation_ids):
+        """
+        رفع الجيل فوراً ثم مرة أخرى بعد نجاح المعاملة: القراءة من عملية أخرى قبل الـ commit
+        ترى المشاركين القدامى وقد تحفظهم تحت الجيل الجديد، فيُتجاوز هذا الجيل أيضاً.
+        """
+        conversation_ids = [int(conversation_id) for conversation_id in conversation_ids]
+        ConversationMembership._forget(conversation_ids)
+        transaction.on_commit(lambda: ConversationMembership._forget(conversation_ids))
+
+
+class InboxService:
+    """
+    صيانة صناديق المحادثات (ConversationInbox) تدريجياً: كل رسالة تحدّث صفوف مشاركي المحادثة
+    باستعلام UPDATE واحد، والقراءة تحرك مؤشر آخر رسالة مقروءة (ReadCursorService)، فتصبح قائمة المحادثات وعداد
+    غير المقروء قراءات مفهرسة بدل المرور على جدول الرسائل.
+    """
+
+    @staticmethod
+    def snapshot(message):
+        if message is None:
+            return {
+                'last_message_id': None,
+                'last_message_sender_name': '',
+                'last_message_preview': '',
+                'last_message_type': '',
+                'last_message_at': None,
+            }
+        return {
+            'last_message_id': message.pk,
+            'last_message_sender_name': message.sender.full_name,
+            'last_message_preview': preview_text(message.content),
+            'last_message_type': message.message_type,
+            'last_message_at': message.created_at,
+        }
+
+    @staticmethod
+    def latest_message(conversation_id):
+        return (
+            Message.objects.filter(conversation_id=conversation_id, is_deleted=False)
+            .select_related('sender').order_by('-created_at', '-id').first()
+        )
+
+    @staticmethod
+    def record_message(message):
+        """رسالة جديدة: لقطة للجميع، وزيادة العدادات لغير المرسل، ومؤشر القراءة للمرسل"""
+        is_sender = Q(user_id=message.sender_id)
+        ConversationInbox.objects.filter(conversation_id=message.conversation_id).update(
+            **InboxService.snapshot(message),
+            last_activity_at=message.created_at,
+            unread_count=Case(When(is_sender, then=Value(0)), default=F('unread_count') + 1),
+            received_count=Case(When(is_sender, then=F('received_count')), default=F('received_count') + 1),
+            last_read_message_id=Case(
+                When(is_sender, then=Value(message.pk)),
+                default=F('last_read_message_id'),
+                output_field=models.BigIntegerField(),
+            ),
+            last_read_at=Case(
+                When(is_sender, then=Value(message.created_at)),
+                default=F('last_read_at'),
+                output_field=models.DateTimeField(),
+            ),
+        )
+
+    @staticmethod
+    def message_edited(message):
+        ConversationInbox.objects.filter(
+            conversation_id=message.conversation_id, last_message_id=message.pk
+        ).update(last_message_preview=preview_text(message.content))
+
+    @staticmethod
+    def message_deleted(message):
+        """الرسالة المحذوفة لا تُحسب، واللقطة ترجع للرسالة السابقة إذا كانت هي الأخيرة"""
+        unread = Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=message.pk)
+        # من انضم بعد الرسالة لم يستلمها أصلاً
+        received = Q(joined_at_message_id__isnull=True) | Q(joined_at_message_id__lt=message.pk)
+        ConversationInbox.objects.filter(received, conversation_id=message.conversation_id).exclude(
+            user_id=message.sender_id
+        ).update(
+            received_count=Greatest(F('received_count') - 1, 0, output_field=models.IntegerField()),
+            unread_count=Case(
+                When(unread, then=Greatest(F('unread_count') - 1, 0)),
+                default=F('unread_count'),
+                output_field=models.IntegerField(),
+            ),
+        )
+        inboxes = ConversationInbox.objects.filter(conversation_id=message.conversation_id, last_message_id=message.pk)
+        if inboxes.exists():
+            inboxes.update(**InboxService.snapshot(InboxService.latest_message(message.conversation_id)))
+
+    @staticmethod
+    def add_participants(conversation_id, user_ids):
+        """المنضم يبدأ من آخر رسالة موجودة دون رسائل غير مقروءة"""
+        latest = InboxService.latest_message(conversation_id)
+        snapshot = InboxService.snapshot(latest)
+        joined_at_message_id = ReadCursorService.latest_message_id(conversation_id)
+        ConversationInbox.objects.bulk_create(
+            [
+                ConversationInbox(
+                    conversation_id=conversation_id,
+                    user_id=user_id,
+                    joined_at_message_id=joined_at_message_id,
+                    last_read_message_id=snapshot['last_message_id'],
+                    last_read_at=timezone.now(),
+                    last_activity_at=latest.created_at if latest else timezone.now(),
+                    **snapshot,
+                )
+                for user_id in user_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def totals(user):
+        """عدد المحادثات وغير المقروء والمستلم للمستخدم من صفوف صندوقه فقط"""
+        return ConversationInbox.objects.filter(user=user).aggregate(
+            total_conversations=Count('id'),
+            active_conversations=Count('id', filter=Q(conversation__is_active=True)),
+            archived_conversations=Count('id', filter=Q(conversation__is_archived=True)),
+            unread_messages=Coalesce(Sum('unread_count'), 0),
+            total_messages_received=Coalesce(Sum('received_count'), 0),
+        )
+
+
+class ReadCursorService:
+    """
+    حالة القراءة كمؤشر واحد لكل (مستخدم، محادثة): آخر رسالة مقروءة في ConversationInbox.
+    تحديد المحادثة كمقروءة تحديث صف واحد بدل كتابة كل رسالة غير مقروءة، والرسالة مقروءة
+    لمستخدم إذا كان معرفها لا يتجاوز مؤشره، وإيصالات القراءة تُبث كحركة للمؤشر.
+    """
+
+    @staticmethod
+    def latest_message_id(conversation_id):
+        return (
+            Message.objects.filter(conversation_id=conversation_id)
+            .order_by('-id').values_list('id', flat=True).first()
+        )
+
+    @staticmethod
+    def advance(conversation_id, user_id, message_id=None):
+        """تحريك المؤشر للأمام فقط حتى رسالة معينة (أو آخر رسالة)؛ ترجع المؤشر الجديد أو None إذا لم يتحرك"""
+        latest_id = ReadCursorService.latest_message_id(conversation_id)
+        if latest_id is None:
+            return None
+        message_id = latest_id if message_id is None else min(int(message_id), latest_id)
+
+        # عدّ نطاقي على الفهرس (conversation, id) داخل UPDATE نفسه، فالرسائل التي وصلت
+        # بعد قراءة آخر رسالة تبقى محسوبة
+        remaining = (
+            Message.objects.filter(conversation_id=conversation_id, id__gt=message_id, is_deleted=False)
+            .exclude(sender_id=user_id).order_by().values('conversation_id')
+            .annotate(count=Count('id')).values('count')
+        )
+        unread_count = Coalesce(models.Subquery(remaining), 0, output_field=models.IntegerField())
+
+        moved = ConversationInbox.objects.filter(
+            Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=message_id),
+            conversation_id=conversation_id,
+            user_id=user_id,
+        ).update(last_read_message_id=message_id, last_read_at=timezone.now(), unread_count=unread_count)
+        return message_id if moved else None
+
+    @staticmethod
+    def cursors(conversation_id):
+        """{معرف المستخدم: (آخر رسالة مقروءة، وقت القراءة)} لكل مشاركي المحادثة"""
+        return {
+            user_id: (last_read_message_id, last_read_at)
+            for user_id, last_read_message_id, last_read_at in ConversationInbox.objects.filter(
+                conversation_id=conversation_id
+            ).values_list('user_id', 'last_read_message_id', 'last_read_at')
+        }
+
+    @staticmethod
+    def read_state(message_id, sender_id, viewer_id, cursors):
+        """(مقروءة، وقت القراءة) كما يراها المستخدم: رسائله مقروءة إذا تجاوزها كل الآخرين"""
+        if sender_id == viewer_id:
+            others = [cursor for user_id, cursor in cursors.items() if user_id != viewer_id]
+            if others and all(last_read and last_read >= message_id for last_read, _ in others):
+                return True, max((read_at for _, read_at in others if read_at), default=None)
+            return False, None
+        last_read, read_at = cursors.get(viewer_id, (None, None))
+        if last_read and last_read >= message_id:
+            return True, read_at
+        return False, None
+
+    @staticmethod
+    def broadcast(conversation_id, user_id, cursor):
+        """إبلاغ المتصلين بالمحادثة بحركة مؤشر القراءة"""
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f'chat_{conversation_id}',
+                {'type': 'read_cursor', 'user_id': user_id, 'last_read_message_id': cursor},
+            )
+        except Exception as e:
+            logger.warning("Could not broadcast read cursor for conversation %s: %s", conversation_id, e)
@@ -1,10 +1,67 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
 from django.dispatch import receiver
-from .models import Message
+from .models import Conversation, ConversationInbox, Message
+from .services import ConversationMembership, InboxService
 from notifications.services import NotificationService
+from ai_services.moderation import ModerationQueue
 
 @receiver(post_save, sender=Message)
 def new_message_notification(sender, instance, created, **kwargs):
     """إرسال إشعار عند وصول رسالة جديدة"""
     if created and instance.message_type == 'user':
-        NotificationService.create_message_notification(instance)
\ No newline at end of file
+        NotificationService.create_message_notification(instance)
+
+@receiver(post_save, sender=Message)
+def update_conversation_inboxes(sender, instance, created, **kwargs):
+    """تحديث صناديق المشاركين مع كل رسالة جديدة"""
+    if created:
+        InboxService.record_message(instance)
+
+@receiver(post_init, sender=Message)
+def remember_message_text(sender, instance, **kwargs):
+    ModerationQueue.remember(instance)
+
+@receiver(post_save, sender=Message)
+def queue_message_moderation(sender, instance, created, update_fields=None, **kwargs):
+    """إضافة الرسائل النصية لطابور المراجعة عند تغير نصها، عدا الرسائل المحذوفة"""
+    if instance.is_deleted or (update_fields and 'content' not in update_fields):
+        return
+    ModerationQueue.enqueue_on_commit(instance, created)
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_conversation_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """مسح عضوية المحادثات عند إضافة المشاركين أو إزالتهم من أي طرف"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            ConversationMembership.invalidate(instance.pk)
+        return
+
+    # التغيير من طرف المستخدم: pk_set معرفات المحادثات، و clear لا يمررها فتُجمع قبل المسح
+    if action == 'pre_clear':
+        instance._cleared_conversation_ids = list(instance.conversations.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        ConversationMembership.invalidate(*getattr(instance, '_cleared_conversation_ids', []))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        ConversationMembership.invalidate(*pk_set)
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def forget_conversation_membership(sender, instance, created=True, **kwargs):
+    """المعرفات قد يُعاد استخدامها بعد الحذف، فلا تبقى عضوية قديمة لمحادثة جديدة"""
+    if created:
+        ConversationMembership.invalidate(instance.pk)
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def sync_conversation_inboxes(sender, instance, action, reverse, pk_set, **kwargs):
+    """صف صندوق لكل مشارك: يُنشأ عند الإضافة ويُحذف عند الإزالة"""
+    if action == 'post_add' and pk_set:
+        if reverse:
+            for conversation_id in pk_set:
+                InboxService.add_participants(conversation_id, [instance.pk])
+        else:
+            InboxService.add_participants(instance.pk, pk_set)
+    elif action == 'post_remove' and pk_set:
+        lookup = {'user_id': instance.pk, 'conversation_id__in': pk_set} if reverse else {'conversation_id': instance.pk, 'user_id__in': pk_set}
+        ConversationInbox.objects.filter(**lookup).delete()
+    elif action == 'post_clear':
+        ConversationInbox.objects.filter(**{'user_id' if reverse else 'conversation_id': instance.pk}).delete()
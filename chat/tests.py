@@ -0,0 +1,438 @@
+import json
+from unittest import mock
+import fakeredis
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from .models import Conversation, ConversationInbox, Message
+from .presence import LocalPresenceRegistry, RedisPresenceRegistry
+from .routing import websocket_urlpatterns
+from .serializers import MessageSerializer
+from .services import ConversationMembership, InboxService, MessageService, ReadCursorService
+
+User = get_user_model()
+
+
+class PresenceRegistryTestCase(SimpleTestCase):
+    def make_registry(self):
+        return LocalPresenceRegistry(ttl=60)
+
+    def test_user_online_until_last_connection_leaves(self):
+        registry = self.make_registry()
+        join = async_to_sync(registry.join)
+        leave = async_to_sync(registry.leave)
+
+        self.assertTrue(join(1, 7, 'tab-1'))
+        # التبويب الثاني لا يعلن اتصالاً جديداً
+        self.assertFalse(join(1, 7, 'tab-2'))
+        self.assertEqual(async_to_sync(registry.online_users)(1), {7})
+
+        self.assertFalse(leave(1, 7, 'tab-1'))
+        self.assertTrue(leave(1, 7, 'tab-2'))
+        self.assertEqual(async_to_sync(registry.online_users)(1), set())
+
+    def test_connections_expire_without_heartbeat(self):
+        registry = self.make_registry()
+        with mock.patch('chat.presence.time.time', return_value=1000):
+            async_to_sync(registry.join)(1, 7, 'dead')
+            async_to_sync(registry.join)(1, 8, 'alive')
+        with mock.patch('chat.presence.time.time', return_value=1050):
+            async_to_sync(registry.heartbeat)(1, 8, 'alive')
+        with mock.patch('chat.presence.time.time', return_value=1070):
+            self.assertEqual(async_to_sync(registry.online_users)(1), {8})
+            # المستخدم الذي انتهى اتصاله يُعلن متصلاً من جديد عند عودته
+            self.assertTrue(async_to_sync(registry.join)(1, 7, 'new'))
+
+
+class RedisPresenceRegistryTestCase(PresenceRegistryTestCase):
+    def make_registry(self):
+        return RedisPresenceRegistry(ttl=60, client=fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+class ChatConsumerPresenceTestCase(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(email='alice@example.com', password='testpass123', full_name='Alice')
+        self.bob = User.objects.create_user(email='bob@example.com', password='testpass123', full_name='Bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.registry = LocalPresenceRegistry(ttl=60)
+        for patcher in (
+            mock.patch('chat.consumers.get_presence_registry', return_value=self.registry),
+            # الرسائل الجديدة تدخل طابور الإشراف؛ لا حاجة لوسيط Celery في هذه الاختبارات
+            mock.patch('ai_services.moderation.ModerationQueue.schedule_drain'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.conversation.pk}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_presence_snapshot_and_status_transitions(self):
+        async def scenario():
+            alice = self.communicator(self.alice)
+            connected, _ = await alice.connect()
+            self.assertTrue(connected)
+            snapshot = json.loads(await alice.receive_from())
+            self.assertEqual(snapshot['type'], 'presence')
+            self.assertEqual(snapshot['online_users'], [self.alice.pk])
+
+            bob = self.communicator(self.bob)
+            await bob.connect()
+            snapshot = json.loads(await bob.receive_from())
+            self.assertEqual(snapshot['online_users'], sorted([self.alice.pk, self.bob.pk]))
+            status = json.loads(await alice.receive_from())
+            self.assertEqual((status['user_id'], status['status']), (self.bob.pk, 'online'))
+
+            # تبويب ثانٍ لبوب لا يكرر إشعار الاتصال، وإغلاقه لا يعني قطع الاتصال
+            bob_tab = self.communicator(self.bob)
+            await bob_tab.connect()
+            await bob_tab.receive_from()
+            await bob_tab.disconnect()
+            self.assertTrue(await alice.receive_nothing())
+
+            await bob.disconnect()
+            status = json.loads(await alice.receive_from())
+            self.assertEqual((status['user_id'], status['status']), (self.bob.pk, 'offline'))
+            await alice.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_chat_message_fan_out(self):
+        async def scenario():
+            alice = self.communicator(self.alice)
+            bob = self.communicator(self.bob)
+            await alice.connect()
+            await alice.receive_from()
+            await bob.connect()
+            await bob.receive_from()
+            await alice.receive_from()
+
+            await alice.send_to(text_data=json.dumps({'type': 'chat_message', 'content': 'مرحبا'}))
+            own = json.loads(await alice.receive_from())
+            other = json.loads(await bob.receive_from())
+            self.assertEqual(own['message']['content'], 'مرحبا')
+            self.assertEqual(own['message']['id'], other['message']['id'])
+            # صلاحيات التعديل تخص المرسل فقط
+            self.assertTrue(own['message']['can_edit'])
+            self.assertFalse(other['message']['can_edit'])
+
+            # إيصال القراءة حركة لمؤشر بوب
+            await bob.send_to(text_data=json.dumps({'type': 'mark_read', 'message_id': other['message']['id']}))
+            receipt = json.loads(await alice.receive_from())
+            self.assertEqual(receipt, {
+                'type': 'read_cursor', 'user_id': self.bob.pk, 'last_read_message_id': other['message']['id']
+            })
+            await bob.receive_from()
+            # المؤشر لم يتحرك فلا إيصال جديد
+            await bob.send_to(text_data=json.dumps({'type': 'mark_read', 'message_id': other['message']['id']}))
+            self.assertTrue(await alice.receive_nothing())
+
+            await bob.disconnect()
+            await alice.disconnect()
+
+        async_to_sync(scenario)()
+        self.conversation.refresh_from_db()
+        self.assertIsNotNone(self.conversation.last_message_at)
+
+    def test_non_participant_is_rejected(self):
+        outsider = User.objects.create_user(email='eve@example.com', password='testpass123', full_name='Eve')
+
+        async def scenario():
+            connected, _ = await self.communicator(outsider).connect()
+            self.assertFalse(connected)
+
+        async_to_sync(scenario)()
+        self.assertEqual(self.registry.conversations, {})
+
+
+class MessageServiceTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(email='alice@example.com', password='testpass123', full_name='Alice')
+        self.bob = User.objects.create_user(email='bob@example.com', password='testpass123', full_name='Bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+
+    def test_message_is_saved_in_one_transaction(self):
+        # SAVEPOINT + INSERT + UPDATE الصناديق + UPDATE المحادثة + RELEASE
+        with self.assertNumQueries(5):
+            payload = MessageService.create_text_message(self.conversation.pk, self.alice, 'مرحبا')
+
+        message = Message.objects.get(pk=payload['id'])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_at, message.created_at)
+        self.assertEqual(set(payload), set(MessageSerializer.Meta.fields))
+        self.assertEqual(payload['sender']['id'], self.alice.pk)
+
+    def test_reply_preview_and_permissions(self):
+        original = MessageService.create_text_message(self.conversation.pk, self.bob, 'س' * 150)
+        payload = MessageService.create_text_message(self.conversation.pk, self.alice, 'رد', original['id'])
+
+        self.assertEqual(payload['reply_to']['sender_name'], 'Bob')
+        self.assertEqual(len(payload['reply_to']['content']), 103)
+        self.assertTrue(MessageService.permissions_for(payload, self.alice.pk)['can_edit'])
+        self.assertFalse(MessageService.permissions_for(payload, self.bob.pk)['can_delete'])
+
+    def test_reply_from_other_conversation_is_rejected(self):
+        other = Conversation.objects.create()
+        foreign = MessageService.create_text_message(other.pk, self.alice, 'خارجية')
+
+        self.assertIsNone(MessageService.create_text_message(self.conversation.pk, self.alice, 'رد', foreign['id']))
+        self.assertFalse(Message.objects.filter(conversation=self.conversation).exists())
+
+    def test_editing_message_does_not_touch_conversation(self):
+        payload = MessageService.create_text_message(self.conversation.pk, self.alice, 'مرحبا')
+        message = Message.objects.get(pk=payload['id'])
+        self.conversation.refresh_from_db()
+        last_message_at = self.conversation.last_message_at
+
+        message.content = 'معدلة'
+        with self.assertNumQueries(1):
+            message.save()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_at, last_message_at)
+
+
+@override_settings(CHAT_MEMBERSHIP_SHARED=True)
+class ConversationMembershipTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(email='alice@example.com', password='testpass123', full_name='Alice')
+        self.bob = User.objects.create_user(email='bob@example.com', password='testpass123', full_name='Bob')
+        self.eve = User.objects.create_user(email='eve@example.com', password='testpass123', full_name='Eve')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+
+    def test_membership_is_cached(self):
+        self.assertTrue(ConversationMembership.is_participant(self.conversation.pk, self.alice.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(ConversationMembership.is_participant(str(self.conversation.pk), self.bob.pk))
+            self.assertFalse(ConversationMembership.is_participant(self.conversation.pk, self.eve.pk))
+
+        # بعد انتهاء النسخة المحلية تُقرأ العضوية من الكاش المشترك
+        ConversationMembership._local.clear()
+        with self.assertNumQueries(0):
+            self.assertTrue(ConversationMembership.is_participant(self.conversation.pk, self.alice.pk))
+
+    def test_participant_changes_invalidate_membership(self):
+        self.assertFalse(ConversationMembership.is_participant(self.conversation.pk, self.eve.pk))
+        self.conversation.participants.add(self.eve)
+        self.assertTrue(ConversationMembership.is_participant(self.conversation.pk, self.eve.pk))
+
+        self.conversation.participants.remove(self.bob)
+        self.assertFalse(ConversationMembership.is_participant(self.conversation.pk, self.bob.pk))
+
+        # التغيير من طرف المستخدم
+        self.alice.conversations.clear()
+        self.assertFalse(ConversationMembership.is_participant(self.conversation.pk, self.alice.pk))
+        self.bob.conversations.add(self.conversation)
+        self.assertTrue(ConversationMembership.is_participant(self.conversation.pk, self.bob.pk))
+
+    def test_invalidation_during_load_is_not_cached(self):
+        """تغيير المشاركين بين قراءة قاعدة البيانات وكتابة الكاش لا يترك عضوية قديمة"""
+        original_set = cache.set
+        raced = []
+
+        def racing_set(key, value, *args, **kwargs):
+            if not raced:
+                raced.append(key)
+                self.conversation.participants.add(self.eve)
+            return original_set(key, value, *args, **kwargs)
+
+        with mock.patch.object(cache, 'set', side_effect=racing_set):
+            self.assertFalse(ConversationMembership.is_participant(self.conversation.pk, self.eve.pk))
+        self.assertTrue(raced)
+
+        # عملية أخرى بلا نسخة محلية تقرأ من الكاش المشترك
+        ConversationMembership._local.clear()
+        self.assertTrue(ConversationMembership.is_participant(self.conversation.pk, self.eve.pk))
+
+    def test_invalidation_is_repeated_after_commit(self):
+        generation = ConversationMembership.generation(self.conversation.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.add(self.eve)
+            self.assertEqual(ConversationMembership.generation(self.conversation.pk), generation + 1)
+        self.assertEqual(ConversationMembership.generation(self.conversation.pk), generation + 2)
+
+    @override_settings(CHAT_MEMBERSHIP_SHARED=False)
+    def test_process_local_cache_is_not_shared(self):
+        """بدون كاش مشترك لا تُكتب العضوية فيه، وتُقرأ من قاعدة البيانات بعد انتهاء النسخة المحلية"""
+        cache.clear()
+        ConversationMembership._local.clear()
+        self.assertTrue(ConversationMembership.is_participant(self.conversation.pk, self.bob.pk))
+        self.assertIsNone(cache.get(ConversationMembership.generation_key(self.conversation.pk)))
+
+        # الإزالة من عملية أخرى لا تصل لهذه العملية إلا بانتهاء النسخة المحلية
+        Conversation.participants.through.objects.filter(user=self.bob).delete()
+        self.assertTrue(ConversationMembership.is_participant(self.conversation.pk, self.bob.pk))
+        ConversationMembership._local.clear()
+        with self.assertNumQueries(1):
+            self.assertFalse(ConversationMembership.is_participant(self.conversation.pk, self.bob.pk))
+
+    def test_messages_endpoint_requires_membership(self):
+        client = APIClient()
+        client.force_authenticate(self.eve)
+        url = f'/api/chat/conversations/{self.conversation.pk}/messages/'
+
+        self.assertEqual(client.get(url).status_code, 403)
+        self.assertEqual(client.post(url, {'content': 'مرحبا'}).status_code, 403)
+
+        client.force_authenticate(self.alice)
+        response = client.post(url, {'content': 'مرحبا'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(client.get(url).status_code, 200)
+
+
+class ConversationInboxTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(email='alice@example.com', password='testpass123', full_name='Alice')
+        self.bob = User.objects.create_user(email='bob@example.com', password='testpass123', full_name='Bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def inbox(self, user):
+        return ConversationInbox.objects.get(conversation=self.conversation, user=user)
+
+    def send(self, sender, content):
+        return Message.objects.get(pk=MessageService.create_text_message(self.conversation.pk, sender, content)['id'])
+
+    def test_inbox_rows_follow_participants(self):
+        carol = User.objects.create_user(email='carol@example.com', password='testpass123', full_name='Carol')
+        self.send(self.alice, 'قبل الانضمام')
+        self.conversation.participants.add(carol)
+        self.assertEqual(self.inbox(carol).unread_count, 0)
+        self.assertEqual(self.inbox(carol).last_message_preview, 'قبل الانضمام')
+
+        carol.conversations.remove(self.conversation)
+        self.assertFalse(ConversationInbox.objects.filter(user=carol).exists())
+
+    def test_counters_follow_sends_reads_and_deletes(self):
+        first = self.send(self.alice, 'الأولى')
+        second = self.send(self.alice, 'الثانية')
+        third = self.send(self.alice, 'الثالثة')
+        self.assertEqual((self.inbox(self.bob).unread_count, self.inbox(self.bob).received_count), (3, 3))
+        self.assertEqual(self.inbox(self.alice).unread_count, 0)
+
+        ReadCursorService.advance(self.conversation.pk, self.bob.pk, first.pk)
+        self.assertEqual(self.inbox(self.bob).unread_count, 2)
+        # المؤشر لا يرجع للخلف
+        ReadCursorService.advance(self.conversation.pk, self.bob.pk, first.pk - 1)
+        self.assertEqual(self.inbox(self.bob).last_read_message_id, first.pk)
+
+        third.is_deleted = True
+        third.save()
+        InboxService.message_deleted(third)
+        bob_inbox = self.inbox(self.bob)
+        self.assertEqual((bob_inbox.unread_count, bob_inbox.received_count), (1, 2))
+        self.assertEqual(bob_inbox.last_message_id, second.pk)
+
+        # الرد يعني أن المرسل قرأ كل ما قبله
+        self.send(self.bob, 'رد')
+        self.assertEqual(self.inbox(self.bob).unread_count, 0)
+
+    def test_deleting_older_message_keeps_late_joiner_counts(self):
+        """حذف رسالة سابقة للانضمام لا ينقص عدادات من انضم بعدها"""
+        earlier = self.send(self.alice, 'قبل الانضمام')
+        carol = User.objects.create_user(email='carol@example.com', password='testpass123', full_name='Carol')
+        self.conversation.participants.add(carol)
+        self.send(self.alice, 'بعد الانضمام')
+        self.assertEqual(self.inbox(carol).joined_at_message_id, earlier.pk)
+        self.assertEqual((self.inbox(carol).unread_count, self.inbox(carol).received_count), (1, 1))
+
+        earlier.is_deleted = True
+        earlier.save()
+        InboxService.message_deleted(earlier)
+        self.assertEqual((self.inbox(carol).unread_count, self.inbox(carol).received_count), (1, 1))
+        self.assertEqual(self.inbox(self.bob).received_count, 1)
+
+    def test_inbox_endpoints(self):
+        other = Conversation.objects.create()
+        other.participants.add(self.alice, self.bob)
+        self.send(self.alice, 'مرحبا')
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/chat/conversations/')
+        results = response.data['results']
+        self.assertEqual([row['id'] for row in results], [self.conversation.pk, other.pk])
+        self.assertEqual(results[0]['unread_count'], 1)
+        self.assertEqual(results[0]['last_message']['content'], 'مرحبا')
+        self.assertEqual(results[0]['other_participant']['id'], self.alice.pk)
+
+        self.assertEqual(self.client.get('/api/chat/unread-count/').data['unread_count'], 1)
+        self.client.post(f'/api/chat/conversations/{self.conversation.pk}/mark-read/')
+        self.assertEqual(self.client.get('/api/chat/unread-count/').data['unread_count'], 0)
+
+
+class ReadCursorTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(email='alice@example.com', password='testpass123', full_name='Alice')
+        self.bob = User.objects.create_user(email='bob@example.com', password='testpass123', full_name='Bob')
+        self.carol = User.objects.create_user(email='carol@example.com', password='testpass123', full_name='Carol')
+        self.conversation = Conversation.objects.create(conversation_type='support')
+        self.conversation.participants.add(self.alice, self.bob, self.carol)
+        self.messages = [
+            MessageService.create_text_message(self.conversation.pk, self.alice, f'رسالة {index}')['id']
+            for index in range(3)
+        ]
+        self.client = APIClient()
+
+    def read_states(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(f'/api/chat/conversations/{self.conversation.pk}/messages/')
+        return {row['id']: row['is_read'] for row in response.data['results']}
+
+    def test_mark_conversation_read_moves_one_cursor(self):
+        self.client.force_authenticate(self.bob)
+        ConversationMembership.is_participant(self.conversation.pk, self.bob.pk)
+        # عدد غير المقروء + آخر رسالة + تحديث المؤشر، بلا كتابة على الرسائل
+        with self.assertNumQueries(3):
+            response = self.client.post(f'/api/chat/conversations/{self.conversation.pk}/mark-read/')
+        self.assertEqual(response.data['marked_count'], 3)
+
+        inbox = ConversationInbox.objects.get(conversation=self.conversation, user=self.bob)
+        self.assertEqual((inbox.last_read_message_id, inbox.unread_count), (self.messages[-1], 0))
+        self.assertIsNotNone(inbox.last_read_at)
+
+    def test_message_arriving_during_mark_read_stays_unread(self):
+        """رسالة تصل بين قراءة آخر رسالة والتحديث تبقى في عداد غير المقروء"""
+        newer = Message.objects.create(conversation=self.conversation, sender=self.alice, content='جديدة')
+        with mock.patch.object(ReadCursorService, 'latest_message_id', return_value=self.messages[-1]):
+            ReadCursorService.advance(self.conversation.pk, self.bob.pk)
+        inbox = ConversationInbox.objects.get(conversation=self.conversation, user=self.bob)
+        self.assertEqual((inbox.last_read_message_id, inbox.unread_count), (self.messages[-1], 1))
+        self.assertLess(self.messages[-1], newer.pk)
+
+    def test_hard_delete_keeps_read_cursor(self):
+        ReadCursorService.advance(self.conversation.pk, self.bob.pk)
+        Message.objects.filter(pk=self.messages[-1]).delete()
+        inbox = ConversationInbox.objects.get(conversation=self.conversation, user=self.bob)
+        self.assertEqual(inbox.last_read_message_id, self.messages[-1])
+
+    def test_read_state_is_per_user(self):
+        Message.objects.get(pk=self.messages[0]).mark_as_read(self.bob)
+
+        self.assertEqual(self.read_states(self.bob), {self.messages[0]: True, self.messages[1]: False, self.messages[2]: False})
+        self.assertEqual(set(self.read_states(self.carol).values()), {False})
+        # رسائل المرسل مقروءة فقط عندما يقرؤها كل المشاركين الآخرين
+        self.assertEqual(set(self.read_states(self.alice).values()), {False})
+        ReadCursorService.advance(self.conversation.pk, self.carol.pk, self.messages[0])
+        self.assertTrue(self.read_states(self.alice)[self.messages[0]])
+
+    def test_message_list_loads_cursors_once(self):
+        self.client.force_authenticate(self.bob)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/chat/conversations/{self.conversation.pk}/messages/')
+        self.assertEqual(len(response.data['results']), 3)
+        cursor_queries = [query for query in queries.captured_queries if 'chat_conversationinbox' in query['sql']]
+        self.assertEqual(len(cursor_queries), 1)
@@ -2,13 +2,17 @@ from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Max
-from .models import Conversation, Message, MessageRead
+from django.db.models import prefetch_related_objects
+from django.db.models import Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
+from .models import Conversation, ConversationInbox, Message
 from .serializers import (
     ConversationSerializer, ConversationCreateSerializer,
     MessageSerializer, MessageCreateSerializer
 )
 from .permissions import IsConversationParticipant
+from .services import ConversationMembership, InboxService, ReadCursorService
+from core.pagination import MessageKeysetPagination
 
 class ConversationListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -30,12 +34,23 @@ class ConversationListCreateView(generics.ListCreateAPIView):
     def get_queryset(self):
         user = self.request.user
         print("line 22, user:", user)
-        return Conversation.objects.filter(
-            participants=user,
-            is_active=True
-        ).annotate(
-            last_message_time=Max('messages__created_at')
-        ).order_by('-last_message_time', '-updated_at')
+        # صندوق المستخدم مرتب بآخر نشاط عبر الفهرس (user, -last_activity_at)
+        return ConversationInbox.objects.filter(
+            user=user,
+            conversation__is_active=True
+        ).select_related('conversation').order_by('-last_activity_at', '-id')
+
+    def list(self, request, *args, **kwargs):
+        inboxes = self.paginate_queryset(self.get_queryset())
+        conversations = []
+        for inbox in inboxes:
+            conversation = inbox.conversation
+            conversation.user_inbox = inbox
+            conversations.append(conversation)
+        prefetch_related_objects(conversations, 'participants')
+
+        serializer = self.get_serializer(conversations, many=True)
+        return self.get_paginated_response(serializer.data)
 
 class ConversationDetailView(generics.RetrieveUpdateAPIView):
     serializer_class = ConversationSerializer
@@ -47,6 +62,7 @@ class ConversationDetailView(generics.RetrieveUpdateAPIView):
 
 class ConversationMessagesView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated, IsConversationParticipant]
+    pagination_class = MessageKeysetPagination
 
     def get_serializer_class(self):
         print("line 42, method:", self.request.method)
@@ -65,21 +81,17 @@ class ConversationMessagesView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         print("line 56, raw data:", self.request.data)
         conversation_id = self.kwargs.get('conversation_id')
-        conversation = get_object_or_404(Conversation, id=conversation_id)
-        print("line 59, conversation:", conversation)
 
-        if not conversation.participants.filter(id=self.request.user.id).exists():
+        # العضوية من الكاش تكفي، فلا حاجة لتحميل المحادثة نفسها
+        if not ConversationMembership.is_participant(conversation_id, self.request.user.id):
             raise permissions.PermissionDenied('ليس لديك صلاحية للكتابة في هذه المحادثة')
 
         message = serializer.save(
-            conversation=conversation,
+            conversation_id=conversation_id,
             sender=self.request.user
         )
         print("line 67, saved message:", message)
 
-        conversation.last_message_at = message.created_at
-        conversation.save()
-        print("line 71, updated conversation:", conversation)
 
 class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = MessageSerializer
@@ -103,7 +115,8 @@ class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
         if (timezone.now() - message.created_at).total_seconds() > 900:
             raise permissions.PermissionDenied('لا يمكن تعديل الرسالة بعد 15 دقيقة من إرسالها')
 
-        serializer.save(is_edited=True)
+        message = serializer.save(is_edited=True)
+        InboxService.message_edited(message)
         print("line 94, message updated")
 
     def perform_destroy(self, instance):
@@ -114,26 +127,27 @@ class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance.is_deleted = True
         instance.content = 'تم حذف هذه الرسالة'
         instance.save()
+        InboxService.message_deleted(instance)
         print("line 103, message logically deleted")
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def mark_conversation_as_read(request, conversation_id):
     print("line 108, mark_conversation_as_read data:", request.data)
-    conversation = get_object_or_404(Conversation, id=conversation_id)
 
-    if not conversation.participants.filter(id=request.user.id).exists():
+    if not ConversationMembership.is_participant(conversation_id, request.user.id):
         return Response({'error': 'ليس لديك صلاحية للوصول لهذه المحادثة'}, 
                        status=status.HTTP_403_FORBIDDEN)
 
-    unread_messages = conversation.messages.filter(
-        is_read=False,
-        is_deleted=False
-    ).exclude(sender=request.user)
-
-    unread_count = unread_messages.count()
+    # تحريك مؤشر القراءة إلى آخر رسالة بدل تحديث كل رسالة غير مقروءة
+    unread_count = ConversationInbox.objects.filter(
+        conversation_id=conversation_id,
+        user=request.user
+    ).values_list('unread_count', flat=True).first() or 0
     print("line 118, unread_count:", unread_count)
-    unread_messages.update(is_read=True, read_at=timezone.now())
+    cursor = ReadCursorService.advance(conversation_id, request.user.id)
+    if cursor:
+        ReadCursorService.broadcast(conversation_id, request.user.id, cursor)
 
     return Response({
         'message': 'تم تحديد الرسائل كمقروءة',
@@ -146,14 +160,16 @@ def mark_message_as_read(request, message_id):
     print("line 129, mark_message_as_read data:", request.data)
     message = get_object_or_404(Message, id=message_id)
 
-    if not message.conversation.participants.filter(id=request.user.id).exists():
+    if not ConversationMembership.is_participant(message.conversation_id, request.user.id):
         return Response({'error': 'ليس لديك صلاحية للوصول لهذه الرسالة'}, 
                        status=status.HTTP_403_FORBIDDEN)
 
-    if not message.is_read and message.sender != request.user:
-        message.mark_as_read(request.user)
-        print("line 137, message marked as read")
-        return Response({'message': 'تم تحديد الرسالة كمقروءة'})
+    if message.sender_id != request.user.id:
+        cursor = message.mark_as_read(request.user)
+        if cursor:
+            ReadCursorService.broadcast(message.conversation_id, request.user.id, cursor)
+            print("line 137, message marked as read")
+            return Response({'message': 'تم تحديد الرسالة كمقروءة'})
 
     return Response({'message': 'الرسالة مقروءة بالفعل'})
 
@@ -174,7 +190,12 @@ def conversation_search(request):
         Q(title__icontains=query) |
         Q(messages__content__icontains=query) |
         Q(participants__full_name__icontains=query)
-    ).distinct()
+    ).distinct().prefetch_related(
+        'participants',
+        Prefetch('inboxes', queryset=ConversationInbox.objects.filter(user=user), to_attr='user_inboxes')
+    )
+    for conversation in conversations:
+        conversation.user_inbox = next(iter(conversation.user_inboxes), None)
 
     serializer = ConversationSerializer(conversations, many=True, context={'request': request})
     print("line 160, search results:", serializer.data)
@@ -186,11 +207,9 @@ def unread_messages_count(request):
     user = request.user
     print("line 167, user:", user)
 
-    unread_count = Message.objects.filter(
-        conversation__participants=user,
-        is_read=False,
-        is_deleted=False
-    ).exclude(sender=user).count()
+    unread_count = ConversationInbox.objects.filter(user=user).aggregate(
+        unread_count=Coalesce(Sum('unread_count'), 0)
+    )['unread_count']
     print("line 173, unread messages count:", unread_count)
 
     return Response({'unread_count': unread_count})
@@ -201,7 +220,7 @@ def archive_conversation(request, conversation_id):
     print("line 179, archive_conversation data:", request.data)
     conversation = get_object_or_404(Conversation, id=conversation_id)
 
-    if not conversation.participants.filter(id=request.user.id).exists():
+    if not ConversationMembership.is_participant(conversation.pk, request.user.id):
         return Response({'error': 'ليس لديك صلاحية للوصول لهذه المحادثة'}, 
                        status=status.HTTP_403_FORBIDDEN)
 
@@ -217,21 +236,14 @@ def chat_stats(request):
     user = request.user
     print("line 194, user:", user)
 
-    total_conversations = Conversation.objects.filter(participants=user).count()
-    active_conversations = Conversation.objects.filter(participants=user, is_active=True).count()
-    archived_conversations = Conversation.objects.filter(participants=user, is_archived=True).count()
+    totals = InboxService.totals(user)
+    total_conversations = totals['total_conversations']
+    active_conversations = totals['active_conversations']
+    archived_conversations = totals['archived_conversations']
 
     total_messages_sent = Message.objects.filter(sender=user, is_deleted=False).count()
-    total_messages_received = Message.objects.filter(
-        conversation__participants=user,
-        is_deleted=False
-    ).exclude(sender=user).count()
-
-    unread_messages = Message.objects.filter(
-        conversation__participants=user,
-        is_read=False,
-        is_deleted=False
-    ).exclude(sender=user).count()
+    total_messages_received = totals['total_messages_received']
+    unread_messages = totals['unread_messages']
 
     print("line 209, stats:", {
         'total_conversations': total_conversations,
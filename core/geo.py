@@ -0,0 +1,139 @@
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+# أبعاد خلية geohash عند خط الاستواء (ارتفاع، عرض) بالكيلومتر لكل دقة
+GEOHASH_CELL_KM = {
+    1: (5000.0, 5000.0),
+    2: (625.0, 1250.0),
+    3: (156.0, 156.0),
+    4: (19.5, 39.1),
+    5: (4.89, 4.89),
+    6: (0.61, 1.22),
+    7: (0.153, 0.153),
+}
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """ترميز الإحداثيات إلى geohash؛ البادئات المشتركة تعني خلايا متجاورة"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            bounds[0] = middle
+        else:
+            bits = bits * 2
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """(أدنى عرض، أعلى عرض، أدنى طول، أعلى طول) للخلية"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lng_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if bits >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def cell_precision(latitude, radius_km):
+    """أدق دقة تكون فيها الخلية أكبر من نصف القطر، فتغطي الخلية وجيرانها الثمانية الدائرة كلها"""
+    shrink = max(math.cos(math.radians(latitude)), 0.01)
+    precision = 1
+    for candidate, (height, width) in sorted(GEOHASH_CELL_KM.items()):
+        if min(height, width * shrink) >= radius_km:
+            precision = candidate
+    return precision
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """بادئات geohash للخلية التي تحتوي النقطة وجيرانها"""
+    precision = cell_precision(latitude, radius_km)
+    center = geohash_encode(latitude, longitude, precision)
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(center)
+    lat_step = lat_max - lat_min
+    lng_step = lng_max - lng_min
+    center_lat = (lat_min + lat_max) / 2
+    center_lng = (lng_min + lng_max) / 2
+
+    cells = set()
+    for dlat in (-lat_step, 0, lat_step):
+        cell_lat = center_lat + dlat
+        if not -90 <= cell_lat <= 90:
+            continue
+        for dlng in (-lng_step, 0, lng_step):
+            cell_lng = (center_lng + dlng + 180) % 360 - 180
+            cells.add(geohash_encode(cell_lat, cell_lng, precision))
+    return sorted(cells)
+
+
+def cells_filter(latitude, longitude, radius_km, field='geohash'):
+    """شرط نطاقات على عمود geohash يستخدم فهرس B-tree العادي في أي قاعدة بيانات"""
+    condition = Q()
+    for prefix in covering_cells(latitude, longitude, radius_km):
+        # '~' بعد كل حروف geohash، فالنطاق يشمل كل الخلايا التي تبدأ بالبادئة
+        condition |= Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '~'})
+    return condition
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    أصغر مستطيل (أدنى عرض، أعلى عرض، أدنى طول، أعلى طول) يحتوي الدائرة.
+    قرب القطبين يشمل كل خطوط الطول، وعند خط التاريخ يكون أدنى طول أكبر من أعلاه.
+    """
+    distance = radius_km / EARTH_RADIUS_KM
+    lat = math.radians(latitude)
+    lat_min, lat_max = lat - distance, lat + distance
+    if lat_min <= -math.pi / 2 or lat_max >= math.pi / 2:
+        return math.degrees(max(lat_min, -math.pi / 2)), math.degrees(min(lat_max, math.pi / 2)), -180.0, 180.0
+
+    delta = math.degrees(math.asin(math.sin(distance) / math.cos(lat)))
+    lng_min = (longitude - delta + 180) % 360 - 180
+    lng_max = (longitude + delta + 180) % 360 - 180
+    return math.degrees(lat_min), math.degrees(lat_max), lng_min, lng_max
+
+
+def bounding_box_filter(latitude, longitude, radius_km, lat_field='latitude', lng_field='longitude'):
+    """شرط المستطيل المحيط بالدائرة؛ يستبعد أطراف خلايا geohash البعيدة قبل حساب المسافة"""
+    lat_min, lat_max, lng_min, lng_max = bounding_box(latitude, longitude, radius_km)
+    condition = Q(**{f'{lat_field}__gte': lat_min, f'{lat_field}__lte': lat_max})
+    if lng_min <= lng_max:
+        return condition & Q(**{f'{lng_field}__gte': lng_min, f'{lng_field}__lte': lng_max})
+    # المستطيل يعبر خط التاريخ
+    return condition & (Q(**{f'{lng_field}__gte': lng_min}) | Q(**{f'{lng_field}__lte': lng_max}))
+
+
+def haversine_km(latitude, longitude, lat_field='latitude', lng_field='longitude'):
+    """تعبير SQL لمسافة haversine بالكيلومتر، يُحسب على كل المرشحين داخل قاعدة البيانات"""
+    lat = Value(math.radians(latitude), output_field=FloatField())
+    lng = Value(math.radians(longitude), output_field=FloatField())
+    dlat = Radians(F(lat_field)) - lat
+    dlng = Radians(F(lng_field)) - lng
+    a = Power(Sin(dlat / 2), 2) + Cos(lat) * Cos(Radians(F(lat_field))) * Power(Sin(dlng / 2), 2)
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from items.search import ItemSearch
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء مستندات البحث النصي لكل المنتجات'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='عدد المنتجات في كل دفعة')
+
+    def handle(self, *args, **options):
+        indexed = ItemSearch.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'تمت فهرسة {indexed} منتج'))
@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Abs, Cast, Coalesce, NullIf
+
+from items.models import Item, ItemLike, ItemRating, ItemView
+from orders.models import Order, OrderRating
+from accounts.models import UserRating
+
+User = get_user_model()
+
+# الفرق المسموح به بين المتوسط الجاري والمتوسط المحسوب من جديد
+AVERAGE_TOLERANCE = 1e-6
+
+
+def related_aggregate(model, fk, aggregate, default=0, output_field=None, **filters):
+    """قيمة تجميعية من جدول مرتبط كاستعلام فرعي يمكن استخدامه في UPDATE"""
+    output_field = output_field or IntegerField()
+    subquery = (
+        model.objects.filter(**{fk: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(fk)
+        .annotate(value=aggregate)
+        .values('value')
+    )
+    return Coalesce(Subquery(subquery, output_field=output_field), Value(default, output_field=output_field))
+
+
+def user_rating_count():
+    return (
+        related_aggregate(UserRating, 'rated_user', Count('pk'))
+        + related_aggregate(OrderRating, 'rated_user', Count('pk'))
+    )
+
+
+def user_rating_average():
+    rating_sum = (
+        related_aggregate(UserRating, 'rated_user', Sum('rating'))
+        + related_aggregate(OrderRating, 'rated_user', Sum('rating'))
+    )
+    count = user_rating_count()
+    # NULLIF يمنع القسمة على صفر، و Coalesce يعيد 0 للمستخدمين بلا تقييمات
+    return Coalesce(
+        Cast(rating_sum, FloatField()) / Cast(NullIf(count, Value(0)), FloatField()),
+        Value(0.0, output_field=FloatField()),
+    )
+
+
+def counters():
+    """(النموذج، الحقل، القيمة الصحيحة، هل هو متوسط)"""
+    return [
+        (Item, 'likes_count', related_aggregate(ItemLike, 'item', Count('pk')), False),
+        (Item, 'views_count', related_aggregate(ItemView, 'item', Count('pk')), False),
+        (Item, 'rating_count', related_aggregate(ItemRating, 'item', Count('pk')), False),
+        (Item, 'rating_average', related_aggregate(
+            ItemRating, 'item', Cast(Sum('rating'), FloatField()) / Cast(Count('pk'), FloatField()),
+            default=0.0, output_field=FloatField(),
+        ), True),
+        (User, 'total_items_posted', related_aggregate(Item, 'owner', Count('pk')), False),
+        (User, 'total_orders_made', related_aggregate(Order, 'buyer', Count('pk'), status='completed'), False),
+        (User, 'rating_count', user_rating_count(), False),
+        (User, 'rating_average', user_rating_average(), True),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'إصلاح انحراف العدادات المحسوبة مسبقاً (الإعجابات، المشاهدات، التقييمات، إحصائيات المستخدمين)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='عرض عدد السجلات المنحرفة دون تعديلها')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        total = 0
+
+        for model, field, actual, is_average in counters():
+            queryset = model.objects.annotate(actual_value=actual)
+            if is_average:
+                drifted = queryset.annotate(drift=Abs(F(field) - F('actual_value'))).filter(drift__gt=AVERAGE_TOLERANCE)
+            else:
+                drifted = queryset.exclude(**{field: F('actual_value')})
+
+            drifted_ids = list(drifted.values_list('pk', flat=True))
+            total += len(drifted_ids)
+            if drifted_ids and not dry_run:
+                model.objects.filter(pk__in=drifted_ids).update(**{field: actual})
+
+            self.stdout.write(f'{model._meta.label}.{field}: {len(drifted_ids)} سجل منحرف')
+
+        action = 'تم العثور على' if dry_run else 'تم إصلاح'
+        self.stdout.write(self.style.SUCCESS(f'{action} {total} قيمة منحرفة'))
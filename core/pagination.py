@@ -1,5 +1,13 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 class StandardResultsSetPagination(PageNumberPagination):
     """تصفح قياسي للنتائج"""
@@ -32,4 +40,161 @@ class SmallResultsSetPagination(PageNumberPagination):
     """تصفح للنتائج الصغيرة"""
     page_size = 10
     page_size_query_param = 'page_size'
-    max_page_size = 50
\ No newline at end of file
+    max_page_size = 50
+
+
+def estimated_count(queryset):
+    """(عدد تقريبي، هل هو تقدير): تقدير المخطط في PostgreSQL، وعدّ محدود في غيره"""
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), True
+
+    limit = getattr(settings, 'PAGINATION_EXACT_COUNT_LIMIT', 10000)
+    count = queryset[:limit + 1].count()
+    return min(count, limit), count > limit
+
+
+class KeysetPagination(BasePagination):
+    """
+    تصفح بالمؤشر على (created_at, id).
+    المؤشر يحمل قيم آخر صف، والصفحة التالية تُجلب بشرط WHERE على هذه القيم مع فهرس مركب مطابق،
+    فتكلفة الصفحة 500 مثل الصفحة الأولى، ولا تتكرر أو تُفقد صفوف عند الإضافات المتزامنة.
+    لا يُحسب العدد إلا عند طلبه (with_count=true) وبشكل تقديري.
+    الطلبات التي تستخدم page أو ترتيباً آخر (السعر، درجة البحث...) تعود للتصفح بالصفحات.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+    ordering = ('-created_at', '-id')
+    fallback_class = PageNumberPagination
+
+    @staticmethod
+    def _flip(ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_keyset_ordering(self, queryset):
+        """ترتيب المؤشر المطابق لترتيب الاستعلام، أو None إذا كان الترتيب مختلفاً"""
+        current = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        if not current or not isinstance(current[0], str):
+            return None
+        for ordering in (self.ordering, self._flip(self.ordering)):
+            if current[0] == ordering[0]:
+                return ordering
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fallback = None
+        ordering = self.get_keyset_ordering(queryset)
+        if ordering is None or request.query_params.get('page'):
+            self.fallback = self.fallback_class()
+            self.fallback.page_size_query_param = self.page_size_query_param
+            self.fallback.max_page_size = self.max_page_size
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() == 'true':
+            self.count, self.count_is_estimate = estimated_count(queryset)
+
+        self.fields = [queryset.model._meta.get_field(field.lstrip('-')) for field in ordering]
+        position, reverse = self.decode_cursor(request)
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*(self._flip(ordering) if reverse else ordering))
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position, reverse))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, position is not None
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+
+        self.first = rows[0] if rows else None
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def _after(self, ordering, position, reverse):
+        """الصفوف بعد الموضع في اتجاه التصفح: (a > x) أو (a = x و b > y)"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            condition |= Q(**equal, **{f'{name}__{"lt" if descending else "gt"}': value})
+            equal[name] = value
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = [field.to_python(value) for field, value in zip(self.fields, data['p'], strict=True)]
+            return position, bool(data.get('r'))
+        except Exception:
+            raise NotFound('مؤشر التصفح غير صالح')
+
+    def encode_cursor(self, row, reverse):
+        data = {'p': [field.value_to_string(row) for field in self.fields], 'r': reverse}
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.fallback:
+            return self.fallback.get_next_link()
+        return self.encode_cursor(self.last, False) if self.has_next and self.last else None
+
+    def get_previous_link(self):
+        if self.fallback:
+            return self.fallback.get_previous_link()
+        return self.encode_cursor(self.first, True) if self.has_previous and self.first else None
+
+    def get_paginated_response(self, data):
+        if self.fallback:
+            return self.fallback.get_paginated_response(data)
+
+        response = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.count is not None:
+            response.update(count=self.count, count_is_estimate=self.count_is_estimate)
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_is_estimate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+
+class MessageKeysetPagination(KeysetPagination):
+    """تصفح رسائل المحادثة بالترتيب الزمني"""
+    ordering = ('created_at', 'id')
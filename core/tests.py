@@ -1,7 +1,10 @@
+import math
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from .geo import EARTH_RADIUS_KM, bounding_box
 from .models import SystemSettings
-from .utils import FileUploadHandler, ResponseFormatter
+from .utils import FileUploadHandler, ResponseFormatter, normalize_arabic, normalize_arabic_for_search
 
 User = get_user_model()
 
@@ -48,4 +51,42 @@ class ResponseFormatterTestCase(TestCase):
         
         self.assertFalse(response['success'])
         self.assertEqual(response['message'], 'فشل الاختبار')
-        self.assertEqual(response['status_code'], 400)
\ No newline at end of file
+        self.assertEqual(response['status_code'], 400)
+
+
+class NormalizeArabicTestCase(TestCase):
+    def test_folds_diacritics_tatweel_and_alef(self):
+        """اختبار توحيد النص العربي"""
+        self.assertEqual(normalize_arabic('  أَسْعَـــار   إعادة  آلة '), 'اسعار اعادة الة')
+
+    def test_empty_text(self):
+        self.assertEqual(normalize_arabic(None), '')
+
+    def test_search_folds_ya_and_ta_marbuta(self):
+        """اختبار توحيد الألف المقصورة والتاء المربوطة للبحث"""
+        self.assertEqual(normalize_arabic_for_search('مَبنى إعادة'), 'مبني اعاده')
+
+
+class BoundingBoxTestCase(TestCase):
+    @staticmethod
+    def distance(lat1, lng1, lat2, lng2):
+        lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+    def test_box_contains_circle(self):
+        """اختبار أن أبعد نقاط الدائرة شمالاً وشرقاً تقع على حدود المستطيل"""
+        lat_min, lat_max, lng_min, lng_max = bounding_box(30.0, 31.0, 10)
+        self.assertAlmostEqual(self.distance(30.0, 31.0, lat_max, 31.0), 10, places=3)
+        self.assertAlmostEqual(lat_max - 30.0, 30.0 - lat_min, places=6)
+        # أبعد نقطة شرقاً في الدائرة تقع على خط عرض أقرب قليلاً للقطب
+        tangent_lat = math.degrees(math.asin(math.sin(math.radians(30.0)) / math.cos(10 / EARTH_RADIUS_KM)))
+        self.assertAlmostEqual(self.distance(30.0, 31.0, tangent_lat, lng_max), 10, places=3)
+        self.assertAlmostEqual(lng_max - 31.0, 31.0 - lng_min, places=6)
+
+    def test_dateline_and_poles(self):
+        lat_min, lat_max, lng_min, lng_max = bounding_box(0.0, 179.95, 20)
+        self.assertGreater(lng_min, lng_max)
+        self.assertAlmostEqual(lng_max, -179.87, places=2)
+
+        self.assertEqual(bounding_box(89.95, 10.0, 20)[2:], (-180.0, 180.0))
@@ -1,5 +1,7 @@
 import os
+import re
 import uuid
+from django.db.models import F
 from django.utils.text import slugify
 from django.core.files.storage import default_storage
 from PIL import Image
@@ -35,6 +37,33 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
+ARABIC_DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+ARABIC_TATWEEL = '\u0640'
+ALEF_VARIANTS_RE = re.compile('[\u0622\u0623\u0625\u0671]')
+# الألف المقصورة تُكتب ياءً والتاء المربوطة هاءً حتى تتطابق الكتابات الشائعة للكلمة
+SEARCH_LETTER_FOLDING = str.maketrans({'\u0649': '\u064a', '\u0629': '\u0647'})
+WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_arabic(text):
+    """توحيد النص العربي: إزالة التشكيل والتطويل وتوحيد أشكال الألف"""
+    if not text:
+        return ''
+    text = ARABIC_DIACRITICS_RE.sub('', text)
+    text = text.replace(ARABIC_TATWEEL, '')
+    text = ALEF_VARIANTS_RE.sub('\u0627', text)
+    return WHITESPACE_RE.sub(' ', text).strip().lower()
+
+def normalize_arabic_for_search(text):
+    """توحيد أوسع لفهرسة البحث: يضيف توحيد الألف المقصورة والتاء المربوطة"""
+    return normalize_arabic(text).translate(SEARCH_LETTER_FOLDING)
+
+def running_average(value, average_field='rating_average', count_field='rating_count'):
+    """تعبيرات F() لإضافة قيمة إلى متوسط جارٍ في استعلام UPDATE واحد"""
+    return {
+        average_field: (F(average_field) * F(count_field) + value) / (F(count_field) + 1),
+        count_field: F(count_field) + 1,
+    }
+
 def create_slug(text):
     """إنشاء slug من النص العربي"""
     return slugify(text, allow_unicode=True)
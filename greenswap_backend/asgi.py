@@ -8,6 +8,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greenswap_backend.settings')
 
 django_asgi_app = get_asgi_application()
 
+import ai_services.routing
 import chat.routing
 
 application = ProtocolTypeRouter({
@@ -15,7 +16,8 @@ application = ProtocolTypeRouter({
     'websocket': AllowedHostsOriginValidator(
         AuthMiddlewareStack(
             URLRouter(
-                chat.routing.websocket_urlpatterns
+                chat.routing.websocket_urlpatterns +
+                ai_services.routing.websocket_urlpatterns
             )
         )
     ),
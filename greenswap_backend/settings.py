@@ -126,6 +126,20 @@ MEDIA_URL = '/media/'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 ENABLE_RAG = True
+
+# RAG embeddings
+# local: inside the current process, batched: in-process micro-batching,
+# celery: micro-batches sent to a worker consuming the 'embeddings' queue
+RAG_EMBEDDING_MODEL = os.getenv('RAG_EMBEDDING_MODEL', 'intfloat/multilingual-e5-base')
+RAG_EMBEDDING_BACKEND = os.getenv('RAG_EMBEDDING_BACKEND', 'local')
+RAG_EMBEDDING_BATCH_SIZE = int(os.getenv('RAG_EMBEDDING_BATCH_SIZE', '32'))
+RAG_EMBEDDING_MAX_LATENCY_MS = int(os.getenv('RAG_EMBEDDING_MAX_LATENCY_MS', '10'))
+RAG_EMBEDDING_TIMEOUT = int(os.getenv('RAG_EMBEDDING_TIMEOUT', '10'))
+
+# RAG query cache (embeddings and top-k results keyed by normalized query text)
+RAG_QUERY_CACHE_SIZE = int(os.getenv('RAG_QUERY_CACHE_SIZE', '1024'))
+RAG_QUERY_CACHE_SHARED = os.getenv('RAG_QUERY_CACHE_SHARED', 'False').lower() == 'true'
+RAG_QUERY_CACHE_TIMEOUT = int(os.getenv('RAG_QUERY_CACHE_TIMEOUT', '3600'))
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -146,6 +160,9 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Keyset pagination: with_count=true uses the planner estimate on PostgreSQL, a capped count elsewhere
+PAGINATION_EXACT_COUNT_LIMIT = int(os.getenv('PAGINATION_EXACT_COUNT_LIMIT', '10000'))
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=24),
@@ -166,13 +183,43 @@ CORS_ALLOWED_ORIGINS = [
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 
-# Channels
+# Channels: Redis layer shared by all ASGI workers when configured, in-memory for local development
+CHANNEL_LAYER_URL = os.getenv('CHANNEL_LAYER_URL', os.getenv('REDIS_URL'))
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
     },
 }
 
+if CHANNEL_LAYER_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_LAYER_URL],
+                'capacity': int(os.getenv('CHANNEL_LAYER_CAPACITY', '1500')),
+                'expiry': 10,
+            },
+        },
+    }
+
+# Chat presence: online connections per conversation, expired unless renewed by heartbeats
+CHAT_PRESENCE = {
+    'BACKEND': 'chat.presence.RedisPresenceRegistry' if CHANNEL_LAYER_URL else 'chat.presence.LocalPresenceRegistry',
+    'URL': CHANNEL_LAYER_URL,
+    'TTL': int(os.getenv('CHAT_PRESENCE_TTL', '60')),
+}
+
+# Conversation membership cache: shared cache entries are invalidated on participant changes,
+# per-process copies expire after a few seconds so removals reach every worker quickly.
+# The shared layer needs a cache every worker and ASGI process sees (Redis). With the
+# per-process LocMem/Dummy cache an invalidation never reaches other processes, so without
+# REDIS_URL membership is only kept for CHAT_MEMBERSHIP_LOCAL_TTL seconds.
+CHAT_MEMBERSHIP_SHARED = os.getenv('CHAT_MEMBERSHIP_SHARED', str(bool(os.getenv('REDIS_URL')))).lower() == 'true'
+CHAT_MEMBERSHIP_TIMEOUT = int(os.getenv('CHAT_MEMBERSHIP_TIMEOUT', '3600'))
+CHAT_MEMBERSHIP_LOCAL_TTL = int(os.getenv('CHAT_MEMBERSHIP_LOCAL_TTL', '5'))
+CHAT_MEMBERSHIP_LOCAL_SIZE = 10000
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -180,9 +227,64 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ROUTES = {
+    'ai_services.tasks.embed_texts': {'queue': 'embeddings'},
+}
+CELERY_BEAT_SCHEDULE = {
+    'flush-item-views': {
+        'task': 'items.tasks.flush_item_views',
+        'schedule': 60.0,
+    },
+    'materialize-item-feeds': {
+        'task': 'items.tasks.materialize_item_feeds',
+        'schedule': 300.0,
+    },
+    'build-item-similarities': {
+        'task': 'items.tasks.build_item_similarities',
+        'schedule': 24 * 3600.0,
+    },
+    'evict-ai-result-cache': {
+        'task': 'ai_services.tasks.evict_result_cache',
+        'schedule': 3600.0,
+    },
+    # Picks up queued texts whose drain could not be scheduled at save time
+    'drain-moderation-queue': {
+        'task': 'ai_services.tasks.drain_moderation_queue',
+        'schedule': 60.0,
+    },
+}
 
 # OpenAI API
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'your-openai-api-key-here')
+OPENAI_TEXT_MODEL = os.getenv('OPENAI_TEXT_MODEL', 'gpt-4o-mini')
+OPENAI_VISION_MODEL = os.getenv('OPENAI_VISION_MODEL', 'gpt-4o-mini')
+OPENAI_TIMEOUT = int(os.getenv('OPENAI_TIMEOUT', '30'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '3'))
+OPENAI_BACKOFF_BASE = 0.5
+OPENAI_BACKOFF_MAX = 8.0
+# Maximum in-flight requests per model in each process
+OPENAI_MODEL_CONCURRENCY = {
+    'default': int(os.getenv('OPENAI_MAX_CONCURRENCY', '8')),
+}
+
+# Content-addressed cache for model results (image bytes / normalized text)
+AI_RESULT_CACHE_ENABLED = os.getenv('AI_RESULT_CACHE_ENABLED', 'True').lower() == 'true'
+AI_RESULT_CACHE_TTL = int(os.getenv('AI_RESULT_CACHE_TTL', str(7 * 24 * 3600)))
+AI_RESULT_CACHE_MAX_ENTRIES = int(os.getenv('AI_RESULT_CACHE_MAX_ENTRIES', '50000'))
+
+# Batched moderation of item, chat message and report texts
+MODERATION_PIPELINE_ENABLED = os.getenv('MODERATION_PIPELINE_ENABLED', 'True').lower() == 'true'
+MODERATION_BATCH_SIZE = int(os.getenv('MODERATION_BATCH_SIZE', '32'))
+MODERATION_BATCH_WINDOW_MS = int(os.getenv('MODERATION_BATCH_WINDOW_MS', '500'))
+# Seconds before a batch claimed by a worker that died can be claimed again
+MODERATION_CLAIM_TIMEOUT = int(os.getenv('MODERATION_CLAIM_TIMEOUT', '300'))
+
+# Chatbot prompt assembly
+CHATBOT_MODEL = os.getenv('CHATBOT_MODEL', 'gpt-4o-mini')
+CHATBOT_RAG_TOP_K = 4
+CHATBOT_CONTEXT_TOKEN_BUDGET = 1200
+CHATBOT_HISTORY_TOKEN_BUDGET = 800
+CHATBOT_HISTORY_MESSAGES = 10
 
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
@@ -266,5 +368,48 @@ if os.getenv('REDIS_URL'):
         }
     }
 
+# Item view counting: buffer views in the (shared) cache and flush them periodically
+ITEM_VIEW_BUFFER_ENABLED = os.getenv('ITEM_VIEW_BUFFER_ENABLED', str(bool(os.getenv('REDIS_URL')))).lower() == 'true'
+ITEM_VIEW_SLOT_SECONDS = 60
+ITEM_VIEW_BUFFER_TIMEOUT = 24 * 3600
+# Ignore repeat views from the same user/IP within this many seconds (0 disables)
+ITEM_VIEW_DEDUP_WINDOW = int(os.getenv('ITEM_VIEW_DEDUP_WINDOW', '0'))
+
+# Item image derivatives: name -> (width, height, crop to exact size)
+ITEM_IMAGE_SIZES = {
+    'thumbnail': (320, 320, True),
+    'medium': (960, 960, False),
+}
+
+# Materialized homepage feeds (popular/recent/featured id lists)
+ITEM_FEED_SIZE = int(os.getenv('ITEM_FEED_SIZE', '200'))
+ITEM_FEED_TIMEOUT = 3600
+# Debounce window for refreshes triggered by item changes
+ITEM_FEED_REFRESH_DELAY = 30
+# Popularity = (views*w + likes*w + rating_avg*rating_count*w) * 0.5 ** (age_hours / half_life_hours)
+ITEM_FEED_POPULARITY = {
+    'views': float(os.getenv('ITEM_FEED_VIEWS_WEIGHT', '1.0')),
+    'likes': float(os.getenv('ITEM_FEED_LIKES_WEIGHT', '5.0')),
+    'ratings': float(os.getenv('ITEM_FEED_RATINGS_WEIGHT', '2.0')),
+    'half_life_hours': float(os.getenv('ITEM_FEED_HALF_LIFE_HOURS', '72')),
+    'window_days': int(os.getenv('ITEM_FEED_WINDOW_DAYS', '30')),
+}
+
+# Item-item collaborative filtering recommendations
+RECOMMENDATION_WEIGHTS = {'view': 1.0, 'like': 3.0, 'rating': 1.0, 'order': 5.0}
+RECOMMENDATION_WINDOW_DAYS = int(os.getenv('RECOMMENDATION_WINDOW_DAYS', '180'))
+RECOMMENDATION_NEIGHBORS = int(os.getenv('RECOMMENDATION_NEIGHBORS', '30'))
+RECOMMENDATION_MAX_ITEMS_PER_USER = 100
+RECOMMENDATION_SEED_ITEMS = 50
+RECOMMENDATION_SIZE = 50
+RECOMMENDATION_CACHE_TIMEOUT = int(os.getenv('RECOMMENDATION_CACHE_TIMEOUT', '600'))
+
+# Cached category tree with item counts (invalidated on category/item changes)
+CATEGORY_CATALOG_TIMEOUT = int(os.getenv('CATEGORY_CATALOG_TIMEOUT', '300'))
+
+# Nearby items filter (?near=lat,lng&radius=km)
+GEO_DEFAULT_RADIUS_KM = float(os.getenv('GEO_DEFAULT_RADIUS_KM', '25'))
+GEO_MAX_RADIUS_KM = float(os.getenv('GEO_MAX_RADIUS_KM', '200'))
+
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
@@ -1,19 +1,85 @@
 import django_filters
+from django.conf import settings
 from django.db import models
+from rest_framework import filters, serializers
+from core.geo import bounding_box_filter, cells_filter, haversine_km
 from .models import Item, Category
+from .search import ItemSearch
+
+class CoordinatesFilter(django_filters.BaseCSVFilter, django_filters.NumberFilter):
+    """إحداثيات بصيغة lat,lng"""
+
 
 class ItemFilter(django_filters.FilterSet):
     category = django_filters.ModelChoiceFilter(queryset=Category.objects.all())
     min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     condition = django_filters.MultipleChoiceFilter(choices=Item.CONDITION_CHOICES)
-    location = django_filters.CharFilter(field_name='location', lookup_expr='icontains')
+    location = django_filters.CharFilter(method='filter_location')
     is_negotiable = django_filters.BooleanFilter()
     is_urgent = django_filters.BooleanFilter()
     created_after = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_before = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
+    near = CoordinatesFilter(method='filter_near')
+    radius = django_filters.NumberFilter(method='filter_radius', min_value=0)
 
     class Meta:
         model = Item
         fields = ['category', 'min_price', 'max_price', 'condition', 'location', 
-                 'is_negotiable', 'is_urgent', 'created_after', 'created_before']
\ No newline at end of file
+                 'is_negotiable', 'is_urgent', 'created_after', 'created_before', 'near', 'radius']
+
+    def filter_location(self, queryset, name, value):
+        return ItemSearch.filter_location(queryset, value)
+
+    def filter_near(self, queryset, name, value):
+        """
+        المنتجات داخل نصف القطر (كم) مع المسافة: تصفية بخلايا geohash والمستطيل المحيط،
+        ثم حساب haversine للمرشحين فقط
+        """
+        if len(value) != 2 or not (-90 <= value[0] <= 90 and -180 <= value[1] <= 180):
+            raise serializers.ValidationError({'near': 'الصيغة المطلوبة: lat,lng'})
+
+        latitude, longitude = float(value[0]), float(value[1])
+        radius = self.form.cleaned_data.get('radius')
+        radius = float(radius) if radius else getattr(settings, 'GEO_DEFAULT_RADIUS_KM', 25)
+        radius = min(radius, getattr(settings, 'GEO_MAX_RADIUS_KM', 200))
+
+        return (
+            queryset.filter(cells_filter(latitude, longitude, radius))
+            .filter(bounding_box_filter(latitude, longitude, radius))
+            .annotate(distance=haversine_km(latitude, longitude))
+            .filter(distance__lte=radius)
+        )
+
+    def filter_radius(self, queryset, name, value):
+        # يُستخدم داخل filter_near
+        return queryset
+
+
+class ItemOrderingFilter(filters.OrderingFilter):
+    """الترتيب حسب المسافة افتراضياً عند استخدام فلتر near"""
+
+    @staticmethod
+    def has_distance(queryset):
+        return 'distance' in queryset.query.annotations
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        valid = super().remove_invalid_fields(queryset, fields, view, request)
+        if self.has_distance(queryset):
+            return valid
+        return [term for term in valid if term.lstrip('-') != 'distance']
+
+    def filter_queryset(self, request, queryset, view):
+        if self.has_distance(queryset) and not request.query_params.get(self.ordering_param):
+            return queryset.order_by('distance', '-created_at')
+        return super().filter_queryset(request, queryset, view)
+
+
+class ItemSearchFilter(filters.SearchFilter):
+    """بحث عبر فهرس البحث النصي بدل LIKE على الحقول، مع الترتيب حسب التطابق"""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        # الترتيب الصريح من المستخدم له الأولوية على ترتيب التطابق
+        ranked = not request.query_params.get(filters.OrderingFilter.ordering_param)
+        return ItemSearch.search(queryset, query, rank=ranked)
@@ -0,0 +1,109 @@
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import ItemImage
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+class ImageDerivatives:
+    """
+    توليد مقاسات الصور المصغرة والمتوسطة بصيغتي WebP و JPEG بعد تصحيح اتجاه EXIF.
+    الملفات تُحفظ تحت مسار مشتق من بصمة محتوى الأصل، فالصورة نفسها لا تُعالج مرتين
+    ويمكن تخزين الروابط مؤقتاً بلا حدود في المتصفح والـ CDN.
+    """
+
+    @staticmethod
+    def sizes():
+        """المقاسات من settings.ITEM_IMAGE_SIZES: (العرض، الارتفاع، قص لمقاس ثابت أم احتواء)"""
+        return settings.ITEM_IMAGE_SIZES
+
+    @staticmethod
+    def schedule(item_image):
+        """المعالجة في عامل Celery بعد نجاح المعاملة"""
+        from .tasks import generate_image_derivatives
+
+        def enqueue():
+            try:
+                generate_image_derivatives.delay(item_image.pk)
+            except Exception as e:
+                logger.warning("Could not schedule image derivatives for %s: %s", item_image.pk, e)
+
+        transaction.on_commit(enqueue)
+
+    @staticmethod
+    def render(image, width, height, crop, options):
+        if crop:
+            resized = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+        if options['format'] == 'JPEG' and resized.mode != 'RGB':
+            # JPEG لا يدعم الشفافية، فتُدمج الصورة على خلفية بيضاء
+            background = Image.new('RGB', resized.size, (255, 255, 255))
+            background.paste(resized, mask=resized.getchannel('A') if 'A' in resized.getbands() else None)
+            resized = background
+
+        output = io.BytesIO()
+        resized.save(output, **options)
+        return resized.size, output.getvalue()
+
+    @staticmethod
+    def stored_size(path):
+        """أبعاد ملف مشتق محفوظ مسبقاً؛ PIL يقرأ الترويسة فقط دون فك الصورة"""
+        with default_storage.open(path, 'rb') as stored:
+            return Image.open(stored).size
+
+    @staticmethod
+    def decode(data):
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        return image
+
+    @staticmethod
+    def generate(item_image):
+        """إنشاء كل المقاسات للصورة وتسجيلها في ItemImage.derivatives"""
+        with item_image.image.open('rb') as source:
+            data = source.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+        if content_hash == item_image.content_hash and item_image.derivatives:
+            return item_image.derivatives
+
+        # الأصل لا يُفك إلا إذا كان هناك ملف ناقص فعلاً
+        image = None
+        directory = f'items/derivatives/{content_hash[:2]}/{content_hash}'
+        derivatives = {}
+        for name, (width, height, crop) in ImageDerivatives.sizes().items():
+            entry = {}
+            for extension, options in FORMATS.items():
+                path = f'{directory}/{name}.{extension}'
+                if default_storage.exists(path):
+                    size = ImageDerivatives.stored_size(path)
+                else:
+                    if image is None:
+                        image = ImageDerivatives.decode(data)
+                    size, content = ImageDerivatives.render(image, width, height, crop, options)
+                    default_storage.save(path, ContentFile(content))
+                entry[extension] = path
+            entry['width'], entry['height'] = size
+            derivatives[name] = entry
+
+        # تحديث مباشر بدل save() حتى لا يعيد منطق الصورة الرئيسية في ItemImage.save
+        ItemImage.objects.filter(pk=item_image.pk).update(derivatives=derivatives, content_hash=content_hash)
+        item_image.derivatives = derivatives
+        item_image.content_hash = content_hash
+        return derivatives
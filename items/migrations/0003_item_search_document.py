@@ -0,0 +1,145 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:46
+
+import re
+from itertools import islice
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# نسخة ثابتة من items.search و core.utils وقت كتابة الترحيل،
+# حتى لا يتغير سلوك الترحيل إذا تغيرت تلك الوحدات لاحقاً
+DOCUMENT_TABLE = 'items_itemsearchdocument'
+FTS_TABLE = 'items_search_fts'
+
+ARABIC_DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+ARABIC_TATWEEL = '\u0640'
+ALEF_VARIANTS_RE = re.compile('[\u0622\u0623\u0625\u0671]')
+SEARCH_LETTER_FOLDING = str.maketrans({'\u0649': '\u064a', '\u0629': '\u0647'})
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_arabic_for_search(text):
+    if not text:
+        return ''
+    text = ARABIC_DIACRITICS_RE.sub('', text)
+    text = text.replace(ARABIC_TATWEEL, '')
+    text = ALEF_VARIANTS_RE.sub('\u0627', text)
+    return WHITESPACE_RE.sub(' ', text).strip().lower().translate(SEARCH_LETTER_FOLDING)
+
+
+def document_fields(title, description, location, material='', category_names=()):
+    return {
+        'title': normalize_arabic_for_search(title),
+        'body': normalize_arabic_for_search(' '.join([description or '', material or '', *category_names])),
+        'location': normalize_arabic_for_search(location),
+    }
+
+POSTGRESQL_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', title), 'A')
+        || setweight(to_tsvector('simple', body), 'B')
+        || setweight(to_tsvector('simple', location), 'C')
+    ) STORED""",
+    f"CREATE INDEX items_search_vector_gin ON {DOCUMENT_TABLE} USING gin (vector)",
+    f"CREATE INDEX items_search_title_trgm ON {DOCUMENT_TABLE} USING gin (title gin_trgm_ops)",
+    f"CREATE INDEX items_search_location_trgm ON {DOCUMENT_TABLE} USING gin (location gin_trgm_ops)",
+]
+
+SQLITE_SQL = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body, location, content='{DOCUMENT_TABLE}', content_rowid='item_id'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body, location) VALUES (new.item_id, new.title, new.body, new.location);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, location)
+        VALUES ('delete', old.item_id, old.title, old.body, old.location);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, location)
+        VALUES ('delete', old.item_id, old.title, old.body, old.location);
+        INSERT INTO {FTS_TABLE}(rowid, title, body, location) VALUES (new.item_id, new.title, new.body, new.location);
+    END""",
+]
+
+SQLITE_REVERSE_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def create_search_index(apps, schema_editor):
+    """إنشاء فهرس البحث الخاص بقاعدة البيانات المستخدمة"""
+    statements = {'postgresql': POSTGRESQL_SQL, 'sqlite': SQLITE_SQL}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_REVERSE_SQL:
+            schema_editor.execute(statement)
+
+
+def index_existing_items(apps, schema_editor):
+    Item = apps.get_model('items', 'Item')
+    ItemSearchDocument = apps.get_model('items', 'ItemSearchDocument')
+    items = (
+        Item.objects.select_related('category')
+        .only('id', 'title', 'description', 'location', 'material', 'category__name_ar', 'category__name_en')
+        .iterator(chunk_size=1000)
+    )
+    documents = (
+        ItemSearchDocument(
+            item_id=item.pk,
+            **document_fields(
+                item.title, item.description, item.location, item.material,
+                (item.category.name_ar, item.category.name_en),
+            ),
+        )
+        for item in items
+    )
+    # دفعات ثابتة الحجم حتى لا تُحمّل كل المستندات في الذاكرة مرة واحدة
+    while batch := list(islice(documents, 1000)):
+        ItemSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0002_alter_item_image_alter_item_owner"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ItemSearchDocument",
+            fields=[
+                (
+                    "item",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="items.item",
+                    ),
+                ),
+                ("title", models.TextField(blank=True, verbose_name="العنوان")),
+                ("body", models.TextField(blank=True, verbose_name="النص")),
+                ("location", models.TextField(blank=True, verbose_name="الموقع")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="تاريخ التحديث"),
+                ),
+            ],
+            options={
+                "verbose_name": "مستند بحث",
+                "verbose_name_plural": "مستندات البحث",
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(index_existing_items, migrations.RunPython.noop),
+    ]
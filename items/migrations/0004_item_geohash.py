@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:49
+
+from itertools import islice
+
+from django.db import migrations, models
+
+# نسخة ثابتة من core.geo وقت كتابة الترحيل
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            bounds[0] = middle
+        else:
+            bits = bits * 2
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def fill_geohash(apps, schema_editor):
+    Item = apps.get_model('items', 'Item')
+    located = (
+        Item.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .only('latitude', 'longitude')
+        .iterator(chunk_size=1000)
+    )
+    while batch := list(islice(located, 1000)):
+        for item in batch:
+            item.geohash = geohash_encode(item.latitude, item.longitude)
+        Item.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0003_item_search_document"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="item",
+            name="geohash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=12,
+                verbose_name="خلية الموقع",
+            ),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0004_item_geohash"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                fields=["status", "-created_at", "-id"], name="items_status_feed_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0005_feed_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ItemSimilarity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField(verbose_name="درجة التشابه")),
+                (
+                    "computed_at",
+                    models.DateTimeField(auto_now=True, verbose_name="تاريخ الحساب"),
+                ),
+                (
+                    "item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_items",
+                        to="items.item",
+                    ),
+                ),
+                (
+                    "neighbor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="items.item",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "تشابه منتجات",
+                "verbose_name_plural": "تشابه المنتجات",
+                "indexes": [
+                    models.Index(
+                        fields=["item", "-score"], name="items_similarity_top_idx"
+                    )
+                ],
+                "unique_together": {("item", "neighbor")},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0006_item_similarity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itemimage",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, max_length=64, verbose_name="بصمة المحتوى"
+            ),
+        ),
+        migrations.AddField(
+            model_name="itemimage",
+            name="derivatives",
+            field=models.JSONField(
+                blank=True, default=dict, verbose_name="المقاسات المشتقة"
+            ),
+        ),
+    ]
@@ -2,7 +2,10 @@ from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator, MaxValueValidator
+from core.geo import geohash_encode
+from core.utils import running_average
 
 User = get_user_model()
 
@@ -69,6 +72,7 @@ class Item(models.Model):
     location = models.CharField(_('الموقع'), max_length=200)
     latitude = models.FloatField(_('خط العرض'), null=True, blank=True)
     longitude = models.FloatField(_('خط الطول'), null=True, blank=True)
+    geohash = models.CharField(_('خلية الموقع'), max_length=12, blank=True, db_index=True, editable=False)
     
     # Status and Visibility
     status = models.CharField(_('الحالة'), max_length=20, choices=STATUS_CHOICES, default='available')
@@ -100,6 +104,8 @@ class Item(models.Model):
             models.Index(fields=['status', 'category']),
             models.Index(fields=['created_at']),
             models.Index(fields=['price']),
+            # التصفح بالمؤشر على المنتجات المتاحة
+            models.Index(fields=['status', '-created_at', '-id'], name='items_status_feed_idx'),
         ]
 
     def __str__(self):
@@ -109,18 +115,31 @@ class Item(models.Model):
         # Set expiration date if not set
         if not self.expires_at:
             self.expires_at = timezone.now() + timezone.timedelta(days=30)
+
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
         
         super().save(*args, **kwargs)
 
     def is_expired(self):
         return self.expires_at and timezone.now() > self.expires_at
 
+    def add_rating(self, rating):
+        """إضافة تقييم بتحديث ذري للمتوسط الجاري دون إعادة تجميع كل التقييمات"""
+        Item.objects.filter(pk=self.pk).update(**running_average(rating))
+        self.refresh_from_db(fields=['rating_average', 'rating_count'])
+
     def update_rating(self):
-        ratings = self.ratings.all()
-        if ratings.exists():
-            self.rating_average = ratings.aggregate(models.Avg('rating'))['rating__avg'] or 0
-            self.rating_count = ratings.count()
-            self.save()
+        """إعادة حساب التقييم من كل التقييمات (لإصلاح الانحراف)"""
+        stats = self.ratings.aggregate(average=models.Avg('rating'), count=models.Count('id'))
+        self.rating_average = stats['average'] or 0
+        self.rating_count = stats['count']
+        self.save(update_fields=['rating_average', 'rating_count'])
 
 class ItemImage(models.Model):
     # item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='images', verbose_name=_('المنتج'))
@@ -131,6 +150,9 @@ class ItemImage(models.Model):
     is_primary = models.BooleanField(_('الصورة الرئيسية'), default=False)
     sort_order = models.IntegerField(_('ترتيب العرض'), default=0)
     created_at = models.DateTimeField(_('تاريخ الإنشاء'), auto_now_add=True)
+    # المقاسات المشتقة: {'thumbnail': {'webp': path, 'jpeg': path, 'width': ..., 'height': ...}, ...}
+    derivatives = models.JSONField(_('المقاسات المشتقة'), default=dict, blank=True)
+    content_hash = models.CharField(_('بصمة المحتوى'), max_length=64, blank=True)
 
     class Meta:
         verbose_name = _('صورة المنتج')
@@ -146,6 +168,11 @@ class ItemImage(models.Model):
             ItemImage.objects.filter(item=self.item, is_primary=True).update(is_primary=False)
         super().save(*args, **kwargs)
 
+    def derivative_url(self, size='thumbnail', image_format='webp'):
+        """رابط المقاس المشتق، أو None إذا لم تُعالج الصورة بعد"""
+        path = self.derivatives.get(size, {}).get(image_format)
+        return default_storage.url(path) if path else None
+
 class ItemRating(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='ratings', verbose_name=_('المنتج'))
     rater = models.ForeignKey(User, on_delete=models.CASCADE, related_name='item_ratings', verbose_name=_('المقيم'))
@@ -186,4 +213,38 @@ class ItemView(models.Model):
         verbose_name_plural = _('مشاهدات المنتجات')
 
     def __str__(self):
-        return f'View of {self.item.title} at {self.created_at}'
\ No newline at end of file
+        return f'View of {self.item.title} at {self.created_at}'
+
+class ItemSearchDocument(models.Model):
+    """نص البحث الموحد لكل منتج؛ فهرس البحث النصي (FTS5 أو tsvector) مبني على هذا الجدول"""
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.TextField(_('العنوان'), blank=True)
+    body = models.TextField(_('النص'), blank=True)
+    location = models.TextField(_('الموقع'), blank=True)
+    updated_at = models.DateTimeField(_('تاريخ التحديث'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('مستند بحث')
+        verbose_name_plural = _('مستندات البحث')
+
+    def __str__(self):
+        return self.title
+
+
+class ItemSimilarity(models.Model):
+    """أقرب K منتج لكل منتج حسب تفاعلات المستخدمين (تُحسب دورياً)"""
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='similar_items')
+    neighbor = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(_('درجة التشابه'))
+    computed_at = models.DateTimeField(_('تاريخ الحساب'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('تشابه منتجات')
+        verbose_name_plural = _('تشابه المنتجات')
+        unique_together = ['item', 'neighbor']
+        indexes = [
+            models.Index(fields=['item', '-score'], name='items_similarity_top_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.item_id} ~ {self.neighbor_id} ({self.score:.3f})'
@@ -0,0 +1,211 @@
+import logging
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Item, ItemLike, ItemRating, ItemSimilarity, ItemView
+from .services import ItemFeed
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'recommendations'
+
+
+def interaction_weights():
+    return {
+        'view': 1.0,
+        'like': 3.0,
+        'rating': 1.0,
+        'order': 5.0,
+        **getattr(settings, 'RECOMMENDATION_WEIGHTS', {}),
+    }
+
+
+def rating_weight(rating, weights):
+    """التقييمات من 3 نجوم فأعلى فقط تعتبر اهتماماً"""
+    return weights['rating'] * max(rating - 2, 0)
+
+
+def collect_interactions(since=None, user=None, per_source=None):
+    """(مستخدم، منتج، وزن) من المشاهدات والإعجابات والتقييمات والطلبات"""
+    from orders.models import Order
+
+    weights = interaction_weights()
+    sources = [
+        (ItemView.objects.filter(user__isnull=False), 'user_id', None, weights['view']),
+        (ItemLike.objects.all(), 'user_id', None, weights['like']),
+        (ItemRating.objects.all(), 'rater_id', 'rating', None),
+        (Order.objects.exclude(status__in=['rejected', 'cancelled']), 'buyer_id', None, weights['order']),
+    ]
+    for queryset, user_field, value_field, weight in sources:
+        if since is not None:
+            queryset = queryset.filter(created_at__gte=since)
+        if user is not None:
+            queryset = queryset.filter(**{user_field: user.pk})
+        fields = [user_field, 'item_id'] + ([value_field] if value_field else [])
+        rows = queryset.order_by('-created_at').values_list(*fields)
+        rows = rows[:per_source] if per_source else rows.iterator(chunk_size=5000)
+        for row in rows:
+            row_weight = rating_weight(row[2], weights) if value_field else weight
+            if row_weight > 0:
+                yield row[0], row[1], row_weight
+
+
+class ItemSimilarityBuilder:
+    """
+    بناء جدول التشابه بين المنتجات (item-item collaborative filtering) دورياً.
+    التفاعلات تُجمع في مصفوفة متفرقة مستخدم × منتج بأوزان log1p، ويُحسب تشابه جيب التمام
+    بين أعمدة المنتجات من أزواج المنتجات التي تفاعل معها نفس المستخدم، ثم يُحفظ أفضل K جار لكل منتج.
+    """
+
+    @staticmethod
+    def user_vectors(interactions, max_items_per_user):
+        """المستخدم -> {منتج: وزن}، مع الإبقاء على أثقل المنتجات فقط لكل مستخدم"""
+        totals = defaultdict(lambda: defaultdict(float))
+        for user_id, item_id, weight in interactions:
+            totals[user_id][item_id] += weight
+
+        vectors = {}
+        for user_id, items in totals.items():
+            if len(items) < 2:
+                # مستخدم بمنتج واحد لا يضيف أي زوج
+                continue
+            top = sorted(items.items(), key=lambda entry: entry[1], reverse=True)[:max_items_per_user]
+            vectors[user_id] = {item_id: math.log1p(weight) for item_id, weight in top}
+        return vectors
+
+    @staticmethod
+    def similarities(vectors, top_k):
+        """(منتجات، جيران، درجات) لأفضل K جار لكل منتج"""
+        import numpy as np
+
+        item_ids = sorted({item_id for items in vectors.values() for item_id in items})
+        if not item_ids:
+            return [], [], []
+        index = {item_id: position for position, item_id in enumerate(item_ids)}
+        n_items = len(item_ids)
+
+        # تطبيع أعمدة المنتجات حتى يصبح حاصل الضرب الداخلي تشابه جيب التمام
+        norms = np.zeros(n_items)
+        for items in vectors.values():
+            for item_id, weight in items.items():
+                norms[index[item_id]] += weight * weight
+        norms = np.sqrt(norms)
+
+        keys = []
+        values = []
+        chunk_pairs = 0
+        pair_keys = np.empty(0, dtype=np.int64)
+        pair_values = np.empty(0)
+
+        def reduce(pair_keys, pair_values, keys, values):
+            all_keys = np.concatenate([pair_keys, *keys])
+            all_values = np.concatenate([pair_values, *values])
+            unique, inverse = np.unique(all_keys, return_inverse=True)
+            return unique, np.bincount(inverse, weights=all_values)
+
+        for items in vectors.values():
+            positions = np.fromiter((index[item_id] for item_id in items), dtype=np.int64, count=len(items))
+            weights = np.fromiter(items.values(), dtype=float, count=len(items)) / norms[positions]
+            left, right = np.meshgrid(positions, positions, indexing='ij')
+            products = np.outer(weights, weights)
+            mask = left != right
+            keys.append(left[mask] * n_items + right[mask])
+            values.append(products[mask])
+            chunk_pairs += len(keys[-1])
+            if chunk_pairs > 2_000_000:
+                pair_keys, pair_values = reduce(pair_keys, pair_values, keys, values)
+                keys, values, chunk_pairs = [], [], 0
+
+        pair_keys, pair_values = reduce(pair_keys, pair_values, keys, values)
+        sources = pair_keys // n_items
+        neighbors = pair_keys % n_items
+
+        # ترتيب حسب المنتج ثم الدرجة تنازلياً، وأخذ أول K لكل منتج
+        order = np.lexsort((-pair_values, sources))
+        sources, neighbors, scores = sources[order], neighbors[order], pair_values[order]
+        _, starts, counts = np.unique(sources, return_index=True, return_counts=True)
+        rank = np.arange(len(sources)) - np.repeat(starts, counts)
+        keep = rank < top_k
+
+        ids = np.asarray(item_ids)
+        return ids[sources[keep]].tolist(), ids[neighbors[keep]].tolist(), scores[keep].tolist()
+
+    @staticmethod
+    def build():
+        """إعادة بناء جدول ItemSimilarity بالكامل، وإرجاع عدد الصفوف"""
+        window_days = getattr(settings, 'RECOMMENDATION_WINDOW_DAYS', 180)
+        since = timezone.now() - timedelta(days=window_days)
+        vectors = ItemSimilarityBuilder.user_vectors(
+            collect_interactions(since=since),
+            getattr(settings, 'RECOMMENDATION_MAX_ITEMS_PER_USER', 100),
+        )
+        sources, neighbors, scores = ItemSimilarityBuilder.similarities(
+            vectors, getattr(settings, 'RECOMMENDATION_NEIGHBORS', 30)
+        )
+
+        with transaction.atomic():
+            ItemSimilarity.objects.all().delete()
+            ItemSimilarity.objects.bulk_create(
+                [
+                    ItemSimilarity(item_id=item_id, neighbor_id=neighbor_id, score=score)
+                    for item_id, neighbor_id, score in zip(sources, neighbors, scores)
+                ],
+                batch_size=2000,
+            )
+        logger.info("Built %s item similarities from %s users", len(sources), len(vectors))
+        return len(sources)
+
+
+class RecommendationService:
+    """التوصيات الشخصية: دمج جيران المنتجات التي تفاعل معها المستخدم، مع الأكثر شعبية كبديل"""
+
+    @staticmethod
+    def cache_key(user_id):
+        return f'{CACHE_PREFIX}:{user_id}'
+
+    @staticmethod
+    def invalidate(user_id):
+        cache.delete(RecommendationService.cache_key(user_id))
+
+    @staticmethod
+    def recommended_ids(user, limit=20):
+        key = RecommendationService.cache_key(user.pk)
+        ids = cache.get(key)
+        if ids is not None:
+            return ids[:limit]
+
+        seeds = defaultdict(float)
+        for _, item_id, weight in collect_interactions(
+            user=user, per_source=getattr(settings, 'RECOMMENDATION_SEED_ITEMS', 50)
+        ):
+            seeds[item_id] += weight
+
+        scores = defaultdict(float)
+        neighbors = ItemSimilarity.objects.filter(item_id__in=list(seeds)).values_list('item_id', 'neighbor_id', 'score')
+        for item_id, neighbor_id, score in neighbors:
+            if neighbor_id not in seeds:
+                scores[neighbor_id] += math.log1p(seeds[item_id]) * score
+
+        size = getattr(settings, 'RECOMMENDATION_SIZE', 50)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:size * 3]
+        # بداية باردة أو جيران غير كافين: تُكمل القائمة بالأكثر شعبية
+        popular = [item_id for item_id in ItemFeed.ids('popular') if item_id not in seeds][:size * 2]
+        # المنتجات غير المتاحة أو المملوكة للمستخدم تُستبعد باستعلام واحد على المرشحين فقط
+        allowed = set(
+            Item.objects.filter(pk__in={*ranked, *popular}, status='available')
+            .exclude(owner=user).values_list('pk', flat=True)
+        )
+        ids = []
+        for item_id in ranked + popular:
+            if item_id in allowed and item_id not in ids:
+                ids.append(item_id)
+        ids = ids[:size]
+
+        cache.set(key, ids, getattr(settings, 'RECOMMENDATION_CACHE_TIMEOUT', 600))
+        return ids[:limit]
@@ -0,0 +1,151 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from core.utils import normalize_arabic_for_search
+
+from .models import Item, ItemSearchDocument
+
+FTS_TABLE = 'items_search_fts'
+DOCUMENT_TABLE = ItemSearchDocument._meta.db_table
+TERM_RE = re.compile(r'\w+')
+
+# أوزان الأعمدة في الترتيب: العنوان ثم الوصف والفئة ثم الموقع
+FTS_WEIGHTS = '10.0, 3.0, 1.0'
+
+
+def search_terms(query):
+    """كلمات البحث بعد التوحيد؛ بدون رموز حتى لا تُفسر كصيغة استعلام"""
+    return TERM_RE.findall(normalize_arabic_for_search(query))
+
+
+def document_fields(title, description, location, material='', category_names=()):
+    """الحقول الموحدة لمستند البحث"""
+    return {
+        'title': normalize_arabic_for_search(title),
+        'body': normalize_arabic_for_search(' '.join([description or '', material or '', *category_names])),
+        'location': normalize_arabic_for_search(location),
+    }
+
+
+class ItemSearch:
+    """
+    البحث النصي في المنتجات.
+    كل منتج له صف موحد في ItemSearchDocument يُحدّث عند الحفظ، وفوقه فهرس حسب قاعدة البيانات:
+    على PostgreSQL عمود tsvector مولد بفهرس GIN مع بحث trigram للأخطاء الإملائية،
+    وعلى SQLite جدول FTS5 يُحدّث بمشغلات (triggers). الفلترة والترتيب يتمّان داخل الفهرس
+    فلا يزيد زمن البحث مع نمو عدد المنتجات كما يحدث مع LIKE '%q%'.
+    """
+
+    @staticmethod
+    def backend():
+        if connection.vendor == 'postgresql':
+            return 'postgresql'
+        if connection.vendor == 'sqlite':
+            return 'sqlite'
+        return 'basic'
+
+    @staticmethod
+    def build_document(item):
+        category = item.category
+        return ItemSearchDocument(
+            item_id=item.pk,
+            **document_fields(
+                item.title, item.description, item.location, item.material,
+                (category.name_ar, category.name_en) if category else (),
+            ),
+        )
+
+    @staticmethod
+    def index(items):
+        """كتابة مستندات البحث لمجموعة منتجات باستعلام upsert واحد"""
+        documents = [ItemSearch.build_document(item) for item in items]
+        if documents:
+            ItemSearchDocument.objects.bulk_create(
+                documents,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['item'],
+                update_fields=['title', 'body', 'location', 'updated_at'],
+            )
+        return len(documents)
+
+    @staticmethod
+    def rebuild(batch_size=1000):
+        """إعادة بناء كل مستندات البحث"""
+        indexed = 0
+        queryset = Item.objects.select_related('category').order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return indexed
+            indexed += ItemSearch.index(batch)
+            last_pk = batch[-1].pk
+
+    @staticmethod
+    def _matches(terms):
+        """(شرط SQL يرجع معرفات المنتجات المطابقة، تعبير درجة الترتيب، المعاملات)"""
+        item_table = Item._meta.db_table
+        if ItemSearch.backend() == 'postgresql':
+            tsquery = ' & '.join(f'{term}:*' for term in terms)
+            phrase = ' '.join(terms)
+            # %% لأن النص يمر عبر تنسيق المعاملات في psycopg
+            match_sql = (
+                f"SELECT item_id FROM {DOCUMENT_TABLE} "
+                f"WHERE vector @@ to_tsquery('simple', %s) OR %s <%% title"
+            )
+            rank_sql = (
+                f"SELECT ts_rank(vector, to_tsquery('simple', %s)) + word_similarity(%s, title) "
+                f"FROM {DOCUMENT_TABLE} WHERE item_id = {item_table}.id"
+            )
+            return match_sql, (tsquery, phrase), rank_sql, (tsquery, phrase)
+
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        match_sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        # bm25 أصغر للنتيجة الأفضل
+        rank_sql = (
+            f'SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {item_table}.id'
+        )
+        return match_sql, (fts_query,), rank_sql, (fts_query,)
+
+    @staticmethod
+    def search(queryset, query, rank=True):
+        """فلترة المنتجات بنص البحث، وترتيبها حسب درجة التطابق إذا طُلب ذلك"""
+        terms = search_terms(query)
+        if not terms:
+            return queryset
+
+        if ItemSearch.backend() == 'basic':
+            for term in terms:
+                queryset = queryset.filter(
+                    Q(search_document__title__contains=term)
+                    | Q(search_document__body__contains=term)
+                    | Q(search_document__location__contains=term)
+                )
+            return queryset
+
+        match_sql, match_params, rank_sql, rank_params = ItemSearch._matches(terms)
+        queryset = queryset.filter(pk__in=RawSQL(match_sql, match_params))
+        if rank:
+            queryset = queryset.annotate(search_rank=RawSQL(rank_sql, rank_params)).order_by('-search_rank', '-created_at')
+        return queryset
+
+    @staticmethod
+    def filter_location(queryset, value):
+        """فلترة الموقع عبر فهرس البحث بدل icontains على جدول المنتجات"""
+        terms = search_terms(value)
+        if not terms:
+            return queryset
+
+        if ItemSearch.backend() == 'sqlite':
+            fts_query = 'location : (' + ' '.join(f'"{term}"*' for term in terms) + ')'
+            return queryset.filter(
+                pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (fts_query,))
+            )
+
+        # النص موحد (بحروف صغيرة) فيكفي LIKE، وعلى PostgreSQL يستخدم فهرس trigram على عمود الموقع
+        return queryset.filter(search_document__location__contains=' '.join(terms))
@@ -1,6 +1,8 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Category, Item, ItemImage, ItemRating, ItemLike, ItemView
 from accounts.serializers import UserPublicSerializer
+from .services import CategoryCatalog
 
 class CategorySerializer(serializers.ModelSerializer):
     name = serializers.SerializerMethodField()
@@ -22,7 +24,7 @@ class CategorySerializer(serializers.ModelSerializer):
         return obj.get_description(language)
 
     def get_items_count(self, obj):
-        return obj.items.filter(status='available').count()
+        return CategoryCatalog.items_count(obj.pk)
 
 # class ItemImageSerializer(serializers.ModelSerializer):
 #     image_url = serializers.SerializerMethodField()
@@ -39,9 +41,20 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class ItemImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    sizes = serializers.SerializerMethodField()
     class Meta:
         model = ItemImage
-        fields = ['id', 'image', 'item', 'image_url', 'alt_text', 'is_primary', 'sort_order']
+        fields = ['id', 'image', 'item', 'image_url', 'sizes', 'alt_text', 'is_primary', 'sort_order']
+
+    def get_sizes(self, obj):
+        request = self.context.get('request')
+        sizes = {}
+        for name, entry in obj.derivatives.items():
+            sizes[name] = {'width': entry.get('width'), 'height': entry.get('height')}
+            for image_format in ('webp', 'jpeg'):
+                url = obj.derivative_url(name, image_format)
+                sizes[name][image_format] = request.build_absolute_uri(url) if request and url else url
+        return sizes
 
     def get_image_url(self, obj):
         request = self.context.get('request')
@@ -60,6 +73,16 @@ class ItemRatingSerializer(serializers.ModelSerializer):
         fields = ['id', 'rater', 'rating', 'comment', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+class ItemListListSerializer(serializers.ListSerializer):
+    """يحسب إعجابات المستخدم لكل عناصر الصفحة باستعلام واحد قبل تسلسلها"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        if 'liked_item_ids' not in self.context:
+            self.context['liked_item_ids'] = ItemListSerializer.liked_item_ids(items, self.context.get('request'))
+        return super().to_representation(items)
+
+
 class ItemListSerializer(serializers.ModelSerializer):
     owner = UserPublicSerializer(read_only=True)
     category_name = serializers.CharField(source='category.name_ar', read_only=True)
@@ -69,6 +92,7 @@ class ItemListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Item
+        list_serializer_class = ItemListListSerializer
         fields = [
             'id', 'title', 'description', 'price', 'quantity', 'condition', 'location',
             'status', 'is_featured', 'is_urgent', 'owner', 'category_name', 'image',
@@ -76,9 +100,34 @@ class ItemListSerializer(serializers.ModelSerializer):
             'is_liked', 'distance'
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """تحميل المالك والفئة والصورة الرئيسية مع القائمة بعدد ثابت من الاستعلامات"""
+        primary_image = ItemImage.objects.order_by('-is_primary', 'sort_order', 'created_at')[:1]
+        return queryset.select_related('owner', 'category').prefetch_related(
+            Prefetch('images', queryset=primary_image, to_attr='primary_images')
+        )
+
+    @staticmethod
+    def liked_item_ids(items, request):
+        """معرفات المنتجات التي أعجب بها المستخدم من بين العناصر المعروضة"""
+        if not (request and request.user.is_authenticated) or not items:
+            return set()
+        return set(
+            ItemLike.objects.filter(user=request.user, item__in=[item.pk for item in items])
+            .values_list('item_id', flat=True)
+        )
+
     def get_image(self, obj):
         request = self.context.get('request')
-        primary_image = obj.images.filter(is_primary=True).first() or obj.images.first()
+        if hasattr(obj, 'primary_images'):
+            primary_image = obj.primary_images[0] if obj.primary_images else None
+        else:
+            primary_image = obj.images.filter(is_primary=True).first() or obj.images.first()
+        # الصورة المصغرة للقوائم، والأصل فقط إذا لم تُعالج الصورة بعد
+        thumbnail = primary_image.derivative_url('thumbnail') if primary_image else None
+        if thumbnail:
+            return request.build_absolute_uri(thumbnail) if request else thumbnail
         if primary_image and primary_image.image and hasattr(primary_image.image, 'url'):
             if request:
                 return request.build_absolute_uri(primary_image.image.url)
@@ -91,14 +140,18 @@ class ItemListSerializer(serializers.ModelSerializer):
         return None
 
     def get_is_liked(self, obj):
+        liked_item_ids = self.context.get('liked_item_ids')
+        if liked_item_ids is not None:
+            return obj.pk in liked_item_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
         return False
 
     def get_distance(self, obj):
-        # TODO: Implement distance calculation based on user location
-        return None
+        # المسافة بالكيلومتر محسوبة في الاستعلام عند استخدام فلتر near
+        distance = getattr(obj, 'distance', None)
+        return round(distance, 2) if distance is not None else None
 
 
 
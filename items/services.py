@@ -0,0 +1,346 @@
+import heapq
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Category, Item, ItemView
+
+VIEW_KEY_PREFIX = 'item_views'
+CATALOG_KEY_PREFIX = 'category_catalog'
+FEED_KEY_PREFIX = 'item_feed'
+
+logger = logging.getLogger(__name__)
+
+
+class ItemViewService:
+    """
+    تسجيل مشاهدات المنتجات خارج مسار الطلب.
+    كل مشاهدة تُكتب في الكاش داخل شريحة زمنية، ومهمة Celery دورية تنقل الشرائح المغلقة
+    إلى قاعدة البيانات بزيادات F() مجمعة و bulk_create لسجلات ItemView.
+    """
+
+    @staticmethod
+    def buffered():
+        return getattr(settings, 'ITEM_VIEW_BUFFER_ENABLED', False)
+
+    @staticmethod
+    def slot_seconds():
+        return getattr(settings, 'ITEM_VIEW_SLOT_SECONDS', 60)
+
+    @staticmethod
+    def _current_slot():
+        return int(time.time() // ItemViewService.slot_seconds())
+
+    @staticmethod
+    def _is_duplicate(item_id, user_id, ip_address):
+        """مشاهدة مكررة من نفس المستخدم أو العنوان خلال نافذة التكرار"""
+        window = getattr(settings, 'ITEM_VIEW_DEDUP_WINDOW', 0)
+        if not window:
+            return False
+        viewer = f'u{user_id}' if user_id else f'ip{ip_address}'
+        return not cache.add(f'{VIEW_KEY_PREFIX}:seen:{item_id}:{viewer}', True, window)
+
+    @staticmethod
+    def record(item, user=None, ip_address=None, user_agent=''):
+        """تسجيل مشاهدة؛ ترجع False إذا اعتبرت مكررة"""
+        user_id = user.pk if user is not None and user.is_authenticated else None
+        if ItemViewService._is_duplicate(item.pk, user_id, ip_address):
+            return False
+
+        event = {'item_id': item.pk, 'user_id': user_id, 'ip_address': ip_address, 'user_agent': user_agent}
+        if not ItemViewService.buffered():
+            # بدون كاش مشترك بين العمليات تُكتب المشاهدة مباشرة دون حفظ كامل للمنتج
+            ItemViewService.write_views([event])
+            return True
+
+        slot = ItemViewService._current_slot()
+        timeout = getattr(settings, 'ITEM_VIEW_BUFFER_TIMEOUT', 24 * 3600)
+        counter_key = f'{VIEW_KEY_PREFIX}:{slot}:count'
+        cache.add(counter_key, 0, timeout)
+        sequence = cache.incr(counter_key)
+        cache.set(f'{VIEW_KEY_PREFIX}:{slot}:{sequence}', event, timeout)
+        return True
+
+    @staticmethod
+    def write_views(events):
+        """زيادة العدادات وإنشاء سجلات المشاهدة دفعة واحدة"""
+        counts = Counter(event['item_id'] for event in events)
+        # المنتجات التي لها نفس عدد المشاهدات الجديدة تُحدّث باستعلام واحد
+        items_by_count = defaultdict(list)
+        for item_id, count in counts.items():
+            items_by_count[count].append(item_id)
+
+        with transaction.atomic():
+            existing = set(Item.objects.filter(pk__in=counts).values_list('pk', flat=True))
+            for count, item_ids in items_by_count.items():
+                Item.objects.filter(pk__in=item_ids).update(views_count=F('views_count') + count)
+            ItemView.objects.bulk_create(
+                [
+                    ItemView(
+                        item_id=event['item_id'],
+                        user_id=event['user_id'],
+                        ip_address=event['ip_address'],
+                        user_agent=event['user_agent'] or '',
+                    )
+                    for event in events
+                    if event['item_id'] in existing
+                ],
+                batch_size=500,
+            )
+
+    @staticmethod
+    def flush():
+        """نقل كل الشرائح المغلقة إلى قاعدة البيانات، وإرجاع عدد المشاهدات المنقولة"""
+        if not ItemViewService.buffered():
+            return 0
+
+        # الشريحة الحالية والسابقة قد تكون بها كتابات جارية
+        last_closed = ItemViewService._current_slot() - 2
+        timeout = getattr(settings, 'ITEM_VIEW_BUFFER_TIMEOUT', 24 * 3600)
+        oldest = last_closed - timeout // ItemViewService.slot_seconds()
+        flushed_key = f'{VIEW_KEY_PREFIX}:flushed-slot'
+        lock_key = f'{VIEW_KEY_PREFIX}:flush-lock'
+        # تفريغ واحد في كل مرة حتى لا تُحتسب الشريحة مرتين
+        if not cache.add(lock_key, True, 10 * ItemViewService.slot_seconds()):
+            return 0
+
+        try:
+            flushed = ItemViewService._flush_slots(
+                max(cache.get(flushed_key, oldest), oldest) + 1, last_closed, flushed_key
+            )
+        finally:
+            cache.delete(lock_key)
+        return flushed
+
+    @staticmethod
+    def _flush_slots(start, last_closed, flushed_key):
+        flushed = 0
+        for slot in range(start, last_closed + 1):
+            counter_key = f'{VIEW_KEY_PREFIX}:{slot}:count'
+            count = cache.get(counter_key)
+            if count:
+                event_keys = [f'{VIEW_KEY_PREFIX}:{slot}:{sequence}' for sequence in range(1, count + 1)]
+                events = list(cache.get_many(event_keys).values())
+                if events:
+                    ItemViewService.write_views(events)
+                    flushed += len(events)
+                cache.delete_many(event_keys + [counter_key])
+            cache.set(flushed_key, slot, None)
+        return flushed
+
+
+class CategoryCatalog:
+    """
+    شجرة الفئات النشطة مع عدد المنتجات المتاحة في كل فئة.
+    تُبنى باستعلامين (الفئات + عدد مجمّع للمنتجات) وتُخزن في الكاش تحت رقم إصدار؛
+    أي تغيير في الفئات أو المنتجات يرفع الإصدار فتُبنى من جديد عند الطلب التالي.
+    """
+
+    @staticmethod
+    def timeout():
+        return getattr(settings, 'CATEGORY_CATALOG_TIMEOUT', 300)
+
+    @staticmethod
+    def version():
+        version_key = f'{CATALOG_KEY_PREFIX}:version'
+        version = cache.get(version_key)
+        if version is None:
+            version = int(time.time())
+            cache.add(version_key, version, None)
+            version = cache.get(version_key, version)
+        return version
+
+    @staticmethod
+    def invalidate():
+        version_key = f'{CATALOG_KEY_PREFIX}:version'
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, int(time.time()), None)
+
+    @staticmethod
+    def language(request):
+        return request.META.get('HTTP_ACCEPT_LANGUAGE', 'ar')[:2] if request else 'ar'
+
+    @staticmethod
+    def build():
+        counts = dict(
+            Item.objects.filter(status='available').order_by()
+            .values_list('category').annotate(count=Count('id'))
+        )
+        categories = list(Category.objects.filter(is_active=True))
+        children = {}
+        for category in categories:
+            children.setdefault(category.parent_id, []).append(category.pk)
+        return {
+            'counts': counts,
+            'categories': [
+                {
+                    'id': category.pk,
+                    'name_ar': category.name_ar,
+                    'name_en': category.name_en,
+                    'description_ar': category.description_ar,
+                    'description_en': category.description_en,
+                    'icon': category.icon,
+                    'color': category.color,
+                    'parent': category.parent_id,
+                    'children': children.get(category.pk, []),
+                    'items_count': counts.get(category.pk, 0),
+                    'sort_order': category.sort_order,
+                }
+                for category in categories
+            ],
+        }
+
+    @staticmethod
+    def catalog():
+        key = f'{CATALOG_KEY_PREFIX}:{CategoryCatalog.version()}'
+        data = cache.get(key)
+        if data is None:
+            data = CategoryCatalog.build()
+            cache.set(key, data, CategoryCatalog.timeout())
+        return data
+
+    @staticmethod
+    def categories(language='ar'):
+        """الفئات النشطة بأسماء اللغة المطلوبة، بترتيب العرض"""
+        key = f'{CATALOG_KEY_PREFIX}:{CategoryCatalog.version()}:{language}'
+        categories = cache.get(key)
+        if categories is None:
+            suffix = 'ar' if language == 'ar' else 'en'
+            categories = [
+                {
+                    'id': category['id'],
+                    'name': category[f'name_{suffix}'],
+                    'description': category[f'description_{suffix}'],
+                    'icon': category['icon'],
+                    'color': category['color'],
+                    'parent': category['parent'],
+                    'children': category['children'],
+                    'items_count': category['items_count'],
+                    'sort_order': category['sort_order'],
+                }
+                for category in CategoryCatalog.catalog()['categories']
+            ]
+            cache.set(key, categories, CategoryCatalog.timeout())
+        return categories
+
+    @staticmethod
+    def items_count(category_id):
+        return CategoryCatalog.catalog()['counts'].get(category_id, 0)
+
+
+class ItemFeed:
+    """
+    قوائم الصفحة الرئيسية (الأكثر شعبية، الأحدث، المميزة) محسوبة مسبقاً.
+    مهمة دورية (أو مجدولة عند تغير المنتجات) تحسب أفضل N معرف لكل قائمة وتخزنها في الكاش،
+    والطلب يجلب معرفات الصفحة فقط ثم المنتجات باستعلام in_bulk واحد،
+    فلا يعتمد زمن الصفحة الرئيسية على حجم جدول المنتجات.
+    """
+
+    FEEDS = ('popular', 'recent', 'featured')
+    REFRESH_SCHEDULED_KEY = f'{FEED_KEY_PREFIX}:refresh-scheduled'
+
+    @staticmethod
+    def size():
+        return getattr(settings, 'ITEM_FEED_SIZE', 200)
+
+    @staticmethod
+    def popularity_settings():
+        return {
+            'views': 1.0,
+            'likes': 5.0,
+            'ratings': 2.0,
+            'half_life_hours': 72.0,
+            'window_days': 30,
+            **getattr(settings, 'ITEM_FEED_POPULARITY', {}),
+        }
+
+    @staticmethod
+    def popularity_score(views, likes, rating_average, rating_count, age_hours, weights):
+        """التفاعل الموزون مضروباً في اضمحلال أسي بنصف عمر ثابت"""
+        engagement = (
+            weights['views'] * views
+            + weights['likes'] * likes
+            + weights['ratings'] * rating_average * rating_count
+        )
+        return engagement * 0.5 ** (age_hours / weights['half_life_hours'])
+
+    @staticmethod
+    def compute(name):
+        available = Item.objects.filter(status='available')
+        size = ItemFeed.size()
+        if name == 'recent':
+            return list(available.order_by('-created_at', '-id').values_list('id', flat=True)[:size])
+        if name == 'featured':
+            return list(
+                available.filter(is_featured=True).order_by('-created_at', '-id').values_list('id', flat=True)[:size]
+            )
+
+        # المنتجات الأقدم من النافذة لا تصل للقائمة مع الاضمحلال، فلا داعي لقراءتها
+        weights = ItemFeed.popularity_settings()
+        now = timezone.now()
+        candidates = (
+            available.filter(created_at__gte=now - timedelta(days=weights['window_days']))
+            .values_list('id', 'views_count', 'likes_count', 'rating_average', 'rating_count', 'created_at')
+            .iterator(chunk_size=2000)
+        )
+        scored = (
+            (
+                ItemFeed.popularity_score(
+                    views, likes, rating_average, rating_count,
+                    (now - created_at).total_seconds() / 3600, weights,
+                ),
+                item_id,
+            )
+            for item_id, views, likes, rating_average, rating_count, created_at in candidates
+        )
+        return [item_id for _, item_id in heapq.nlargest(size, scored)]
+
+    @staticmethod
+    def materialize(names=None):
+        """حساب القوائم وتخزينها، وإرجاع عدد المعرفات في كل قائمة"""
+        timeout = getattr(settings, 'ITEM_FEED_TIMEOUT', 3600)
+        sizes = {}
+        for name in names or ItemFeed.FEEDS:
+            ids = ItemFeed.compute(name)
+            cache.set(f'{FEED_KEY_PREFIX}:{name}', ids, timeout)
+            sizes[name] = len(ids)
+        return sizes
+
+    @staticmethod
+    def ids(name):
+        ids = cache.get(f'{FEED_KEY_PREFIX}:{name}')
+        if ids is None:
+            ids = ItemFeed.compute(name)
+            cache.set(f'{FEED_KEY_PREFIX}:{name}', ids, getattr(settings, 'ITEM_FEED_TIMEOUT', 3600))
+        return ids
+
+    @staticmethod
+    def hydrate(ids, queryset=None):
+        """المنتجات المتاحة لهذه المعرفات بنفس الترتيب، باستعلام واحد"""
+        if queryset is None:
+            queryset = Item.objects.all()
+        items = queryset.filter(status='available').in_bulk(ids)
+        return [items[item_id] for item_id in ids if item_id in items]
+
+    @staticmethod
+    def schedule_refresh():
+        """إعادة حساب القوائم مرة واحدة لكل فترة بدل مهمة لكل تعديل"""
+        delay = getattr(settings, 'ITEM_FEED_REFRESH_DELAY', 30)
+        if not cache.add(ItemFeed.REFRESH_SCHEDULED_KEY, True, delay):
+            return
+
+        from .tasks import materialize_item_feeds
+        try:
+            materialize_item_feeds.apply_async(countdown=delay)
+        except Exception as e:
+            cache.delete(ItemFeed.REFRESH_SCHEDULED_KEY)
+            logger.warning("Could not schedule item feed refresh: %s", e)
@@ -1,6 +1,13 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete
+from django.db import transaction
+from django.db.models import F
 from django.dispatch import receiver
-from .models import ItemLike, ItemRating, ItemView
+from .models import Category, Item, ItemImage, ItemLike, ItemRating
+from .images import ImageDerivatives
+from .search import ItemSearch
+from .services import CategoryCatalog, ItemFeed
+from .recommendations import RecommendationService
+from ai_services.moderation import ModerationQueue
 from notifications.services import NotificationService
 
 @receiver(post_save, sender=ItemLike)
@@ -23,24 +30,90 @@ def item_rated_notification(sender, instance, created, **kwargs):
             user=instance.rater
         )
 
-@receiver(post_save, sender=ItemView)
-def update_item_views_count(sender, instance, created, **kwargs):
-    """تحديث عداد المشاهدات"""
-    if created:
-        item = instance.item
-        item.views_count = item.views.count()
-        item.save()
-
 @receiver(post_save, sender=ItemLike)
 def update_item_likes_count(sender, instance, created, **kwargs):
-    """تحديث عداد الإعجابات عند الإضافة"""
-    item = instance.item
-    item.likes_count = item.likes.count()
-    item.save()
+    """زيادة عداد الإعجابات بشكل ذري عند الإضافة"""
+    if created:
+        Item.objects.filter(pk=instance.item_id).update(likes_count=F('likes_count') + 1)
 
 @receiver(post_delete, sender=ItemLike)
 def update_item_likes_count_delete(sender, instance, **kwargs):
-    """تحديث عداد الإعجابات عند الحذف"""
-    item = instance.item
-    item.likes_count = item.likes.count()
-    item.save()
\ No newline at end of file
+    """إنقاص عداد الإعجابات بشكل ذري عند الحذف"""
+    Item.objects.filter(pk=instance.item_id).update(likes_count=F('likes_count') - 1)
+
+@receiver(post_init, sender=Item)
+def remember_item_text(sender, instance, **kwargs):
+    ModerationQueue.remember(instance)
+
+@receiver(post_save, sender=Item)
+def queue_item_moderation(sender, instance, created, update_fields=None, **kwargs):
+    """إضافة نص المنتج لطابور المراجعة عند تغيره"""
+    if update_fields and not {'title', 'description'} & set(update_fields):
+        return
+    ModerationQueue.enqueue_on_commit(instance, created)
+
+@receiver(post_save, sender=Item)
+def index_item_for_search(sender, instance, update_fields=None, **kwargs):
+    """تحديث مستند البحث عند تغير النصوص المفهرسة للمنتج"""
+    if update_fields and not {'title', 'description', 'location', 'material', 'category'} & set(update_fields):
+        return
+    ItemSearch.index([instance])
+
+@receiver(post_save, sender=Category)
+def reindex_category_items(sender, instance, created, **kwargs):
+    """إعادة فهرسة منتجات الفئة لأن اسمها جزء من مستند البحث"""
+    if not created:
+        ItemSearch.index(Item.objects.filter(category=instance).select_related('category').iterator(chunk_size=500))
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_catalog(sender, **kwargs):
+    """إبطال شجرة الفئات المخزنة عند تعديل الفئات"""
+    CategoryCatalog.invalidate()
+
+@receiver(post_save, sender=Item)
+def invalidate_catalog_on_item_save(sender, instance, update_fields=None, **kwargs):
+    """إبطال أعداد المنتجات في الفئات عند تغير حالة المنتج أو فئته"""
+    if update_fields and not {'status', 'category'} & set(update_fields):
+        return
+    CategoryCatalog.invalidate()
+
+@receiver(post_delete, sender=Item)
+def invalidate_catalog_on_item_delete(sender, **kwargs):
+    CategoryCatalog.invalidate()
+
+@receiver(post_save, sender=Item)
+def refresh_item_feeds(sender, instance, created, update_fields=None, **kwargs):
+    """جدولة إعادة حساب قوائم الصفحة الرئيسية عند إضافة منتج أو تغير حالته"""
+    if not created and update_fields and not {'status', 'is_featured'} & set(update_fields):
+        return
+    transaction.on_commit(ItemFeed.schedule_refresh)
+
+@receiver(post_save, sender=ItemLike)
+@receiver(post_delete, sender=ItemLike)
+def invalidate_user_recommendations(sender, instance, **kwargs):
+    """
+    إعادة حساب توصيات المستخدم بعد إعجاب جديد أو إلغائه.
+    المشاهدات لا تُبطل التوصيات: تصل بكثرة وبوزن منخفض، وتظهر بعد انتهاء صلاحية الكاش.
+    """
+    RecommendationService.invalidate(instance.user_id)
+
+@receiver(post_save, sender=ItemRating)
+@receiver(post_delete, sender=ItemRating)
+def invalidate_rater_recommendations(sender, instance, **kwargs):
+    """إعادة حساب توصيات المقيّم بعد تقييم جديد أو تعديله أو حذفه"""
+    RecommendationService.invalidate(instance.rater_id)
+
+@receiver(post_save, sender=Item)
+def attach_uploaded_image(sender, instance, update_fields=None, **kwargs):
+    """تسجيل الصورة المرفوعة مع المنتج كصورة رئيسية حتى تمر على معالجة المقاسات"""
+    if not instance.image or (update_fields and 'image' not in update_fields):
+        return
+    if not instance.images.filter(image=instance.image.name).exists():
+        ItemImage.objects.create(item=instance, image=instance.image.name, is_primary=True)
+
+@receiver(post_save, sender=ItemImage)
+def process_item_image(sender, instance, created, update_fields=None, **kwargs):
+    """جدولة توليد المقاسات عند رفع صورة جديدة"""
+    if created or (update_fields is None and instance.image):
+        ImageDerivatives.schedule(instance)
@@ -0,0 +1,32 @@
+from celery import shared_task
+from .models import ItemImage
+from .images import ImageDerivatives
+from .services import ItemFeed, ItemViewService
+from .recommendations import ItemSimilarityBuilder
+
+@shared_task
+def flush_item_views():
+    """نقل المشاهدات المخزنة في الكاش إلى قاعدة البيانات"""
+    flushed = ItemViewService.flush()
+    return f"Flushed {flushed} item views"
+
+@shared_task
+def materialize_item_feeds():
+    """إعادة حساب قوائم الصفحة الرئيسية"""
+    sizes = ItemFeed.materialize()
+    return f"Materialized item feeds: {sizes}"
+
+@shared_task
+def build_item_similarities():
+    """إعادة بناء جدول التشابه بين المنتجات للتوصيات"""
+    rows = ItemSimilarityBuilder.build()
+    return f"Built {rows} item similarities"
+
+@shared_task
+def generate_image_derivatives(item_image_id):
+    """توليد المقاسات المصغرة لصورة منتج"""
+    item_image = ItemImage.objects.filter(pk=item_image_id).first()
+    if item_image is None or not item_image.image:
+        return "Image not found"
+    derivatives = ImageDerivatives.generate(item_image)
+    return f"Generated {len(derivatives)} sizes for image {item_image_id}"
@@ -0,0 +1,418 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from .images import ImageDerivatives
+from .models import Category, Item, ItemImage, ItemLike, ItemRating, ItemSimilarity, ItemView
+from .recommendations import ItemSimilarityBuilder, RecommendationService
+from .services import ItemFeed, ItemViewService
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ItemListQueriesTestCase(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@example.com', password='testpass123', full_name='Owner')
+        self.viewer = User.objects.create_user(email='viewer@example.com', password='testpass123', full_name='Viewer')
+        self.category = Category.objects.create(name_ar='بلاستيك', name_en='Plastic')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def create_items(self, count):
+        for i in range(count):
+            item = Item.objects.create(
+                owner=self.owner, category=self.category, title=f'منتج {i}',
+                description='وصف', price=10, location='القاهرة'
+            )
+            ItemImage.objects.create(item=item, image=SimpleUploadedFile(f'{i}.jpg', b'x'), sort_order=1)
+            ItemImage.objects.create(item=item, image=SimpleUploadedFile(f'{i}-main.jpg', b'x'), is_primary=True, sort_order=2)
+        return item
+
+    def test_list_queries_do_not_grow_with_page(self):
+        """اختبار ثبات عدد الاستعلامات مع زيادة عدد المنتجات"""
+        liked = self.create_items(2)
+        ItemLike.objects.bulk_create([ItemLike(item=liked, user=self.viewer)])
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/items/')
+
+        self.create_items(5)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/items/')
+
+        results = response.json()['results']
+        self.assertEqual(len(results), 7)
+        self.assertEqual([r['is_liked'] for r in results].count(True), 1)
+        self.assertTrue(all('-main' in r['image'] for r in results))
+
+class ItemViewServiceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='seller@example.com', password='testpass123', full_name='Seller')
+        category = Category.objects.create(name_ar='معادن', name_en='Metal')
+        self.item = Item.objects.create(
+            owner=self.owner, category=category, title='علب', description='وصف', price=5, location='الجيزة'
+        )
+
+    @override_settings(ITEM_VIEW_BUFFER_ENABLED=True, ITEM_VIEW_DEDUP_WINDOW=60)
+    def test_buffered_views_flushed_in_bulk(self):
+        """اختبار تخزين المشاهدات في الكاش ونقلها دفعة واحدة بعد إغلاق الشريحة"""
+        with mock.patch('items.services.time.time', return_value=6000):
+            with self.assertNumQueries(0):
+                ItemViewService.record(self.item, ip_address='1.1.1.1')
+                ItemViewService.record(self.item, ip_address='1.1.1.1')
+                ItemViewService.record(self.item, user=self.owner, ip_address='1.1.1.1')
+            self.assertEqual(ItemViewService.flush(), 0)
+
+        with mock.patch('items.services.time.time', return_value=6000 + 120):
+            self.assertEqual(ItemViewService.flush(), 2)
+            self.assertEqual(ItemViewService.flush(), 0)
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.views_count, 2)
+        self.assertEqual(ItemView.objects.filter(item=self.item).count(), 2)
+
+class CounterTestCase(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='counter@example.com', password='testpass123', full_name='Counter')
+        self.rater = User.objects.create_user(email='rater@example.com', password='testpass123', full_name='Rater')
+        category = Category.objects.create(name_ar='ورق', name_en='Paper')
+        self.item = Item.objects.create(
+            owner=self.owner, category=category, title='كرتون', description='وصف', price=3, location='طنطا'
+        )
+
+    def test_running_average_rating(self):
+        """اختبار تحديث متوسط التقييم بشكل تزايدي"""
+        self.item.add_rating(4)
+        self.item.add_rating(5)
+        self.assertEqual(self.item.rating_count, 2)
+        self.assertAlmostEqual(self.item.rating_average, 4.5)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """اختبار إصلاح العدادات المنحرفة من الجداول الأصلية"""
+        ItemLike.objects.bulk_create([ItemLike(item=self.item, user=self.rater)])
+        ItemRating.objects.bulk_create([ItemRating(item=self.item, rater=self.rater, rating=3)])
+        Item.objects.filter(pk=self.item.pk).update(likes_count=7, rating_average=1.0, rating_count=5)
+
+        call_command('reconcile_counters', stdout=StringIO())
+
+        self.item.refresh_from_db()
+        self.owner.refresh_from_db()
+        self.assertEqual(self.item.likes_count, 1)
+        self.assertEqual(self.item.rating_count, 1)
+        self.assertAlmostEqual(self.item.rating_average, 3.0)
+        self.assertEqual(self.owner.total_items_posted, 1)
+
+class ItemSearchTestCase(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(email='search@example.com', password='testpass123', full_name='Search')
+        self.category = Category.objects.create(name_ar='ورق', name_en='Paper')
+        self.bottles = Item.objects.create(
+            owner=owner, category=self.category, title='زجاجات بلاستيكية', description='عبوة مياه فارغة',
+            price=2, location='الإسكندرية'
+        )
+        self.boxes = Item.objects.create(
+            owner=owner, category=self.category, title='كرتون مستعمل', description='صناديق زجاجات قديمة',
+            price=4, location='القاهرة'
+        )
+        self.client = APIClient()
+
+    def search(self, **params):
+        response = self.client.get('/api/items/', params)
+        return [result['id'] for result in response.json()['results']]
+
+    def test_search_normalizes_and_ranks_title_matches_first(self):
+        """اختبار توحيد الحروف العربية وترتيب مطابقات العنوان أولاً"""
+        self.assertEqual(self.search(search='زُجاجات'), [self.bottles.pk, self.boxes.pk])
+        self.assertEqual(self.search(search='عبوه بلاستيكيه'), [self.bottles.pk])
+        self.assertEqual(self.search(search='Paper'), [self.boxes.pk, self.bottles.pk])
+
+    def test_index_follows_updates_and_location_filter(self):
+        """اختبار تحديث الفهرس عند الحفظ وفلترة الموقع"""
+        self.boxes.title = 'أوراق جرائد'
+        self.boxes.save()
+        self.assertEqual(self.search(search='كرتون'), [])
+        self.assertEqual(self.search(search='جرايد'), [])
+        self.assertEqual(self.search(search='جرائد'), [self.boxes.pk])
+        self.assertEqual(self.search(location='اسكندرية'), [])
+        self.assertEqual(self.search(location='الاسكندرية'), [self.bottles.pk])
+
+class NearbyItemsTestCase(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(email='geo@example.com', password='testpass123', full_name='Geo')
+        category = Category.objects.create(name_ar='معادن', name_en='Metal')
+
+        def create(title, latitude, longitude):
+            return Item.objects.create(
+                owner=owner, category=category, title=title, description='وصف', price=1,
+                location='مصر', latitude=latitude, longitude=longitude
+            )
+
+        self.tahrir = create('التحرير', 30.0444, 31.2357)
+        self.giza = create('الجيزة', 30.0131, 31.2089)
+        self.alexandria = create('الإسكندرية', 31.2001, 29.9187)
+        create('بدون موقع', None, None)
+        self.client = APIClient()
+
+    def test_near_filters_by_radius_and_sorts_by_distance(self):
+        """اختبار فلترة المنتجات القريبة وترتيبها حسب المسافة"""
+        response = self.client.get('/api/items/', {'near': '30.05,31.24', 'radius': 10})
+        results = response.json()['results']
+        self.assertEqual([result['id'] for result in results], [self.tahrir.pk, self.giza.pk])
+        self.assertAlmostEqual(results[0]['distance'], 0.78, delta=0.05)
+        self.assertAlmostEqual(results[1]['distance'], 5.1, delta=0.2)
+
+        response = self.client.get('/api/items/', {'near': '30.05,31.24', 'radius': 200, 'ordering': '-distance'})
+        self.assertEqual(response.json()['results'][0]['id'], self.alexandria.pk)
+
+    def test_geohash_follows_location_updates(self):
+        """اختبار تحديث خلية الموقع عند تعديل الإحداثيات"""
+        self.giza.latitude, self.giza.longitude = 31.2001, 29.9187
+        self.giza.save(update_fields=['latitude', 'longitude'])
+        self.giza.refresh_from_db()
+        self.assertEqual(self.giza.geohash, self.alexandria.geohash)
+        self.assertEqual(self.client.get('/api/items/', {'near': 'x'}).status_code, 400)
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(email='pages@example.com', password='testpass123', full_name='Pages')
+        self.category = Category.objects.create(name_ar='زجاج', name_en='Glass')
+        self.owner = owner
+        self.items = [self.create_item(i) for i in range(5)]
+        self.client = APIClient()
+
+    def create_item(self, i):
+        return Item.objects.create(
+            owner=self.owner, category=self.category, title=f'زجاجة {i}', description='وصف', price=1, location='مصر'
+        )
+
+    def test_cursor_pages_are_stable_under_inserts(self):
+        """اختبار التصفح بالمؤشر دون تكرار أو فقد عند إضافة منتجات أثناء التصفح"""
+        response = self.client.get('/api/items/', {'page_size': 2, 'with_count': 'true'}).json()
+        self.assertEqual(response['count'], 5)
+        self.assertIsNone(response['previous'])
+        seen = [result['id'] for result in response['results']]
+
+        self.create_item(99)
+        second = self.client.get(response['next']).json()
+        seen += [result['id'] for result in second['results']]
+        third = self.client.get(second['next']).json()
+        seen += [result['id'] for result in third['results']]
+
+        self.assertEqual(seen, [item.pk for item in reversed(self.items)])
+        self.assertIsNone(third['next'])
+        back = self.client.get(third['previous']).json()
+        self.assertEqual(back['results'], second['results'])
+
+    def test_other_orderings_fall_back_to_pages(self):
+        """اختبار العودة للتصفح بالصفحات عند الترتيب بحقل آخر"""
+        response = self.client.get('/api/items/', {'ordering': 'price', 'page': 1}).json()
+        self.assertEqual(response['count'], 5)
+        self.assertEqual(self.client.get('/api/items/', {'cursor': 'bad'}).status_code, 404)
+
+class CategoryCatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='catalog@example.com', password='testpass123', full_name='Catalog')
+        self.parent = Category.objects.create(name_ar='إلكترونيات', name_en='Electronics')
+        self.child = Category.objects.create(name_ar='هواتف', name_en='Phones', parent=self.parent, sort_order=1)
+        self.client = APIClient()
+
+    def categories(self, language='ar'):
+        response = self.client.get('/api/items/categories/', HTTP_ACCEPT_LANGUAGE=language)
+        return {category['id']: category for category in response.json()['results']}
+
+    def test_tree_is_cached_and_invalidated_on_changes(self):
+        """اختبار تخزين شجرة الفئات وإبطالها عند إضافة منتج أو تعديل فئة"""
+        self.categories()
+        with self.assertNumQueries(0):
+            categories = self.categories()
+        self.assertEqual(categories[self.parent.pk]['children'], [self.child.pk])
+        self.assertEqual(categories[self.child.pk]['items_count'], 0)
+
+        Item.objects.create(
+            owner=self.owner, category=self.child, title='هاتف', description='وصف', price=100, location='مصر'
+        )
+        self.child.name_en = 'Mobiles'
+        self.child.save()
+        self.assertEqual(self.categories()[self.child.pk]['items_count'], 1)
+        self.assertEqual(self.categories('en')[self.child.pk]['name'], 'Mobiles')
+
+class ItemFeedTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(email='feed@example.com', password='testpass123', full_name='Feed')
+        category = Category.objects.create(name_ar='أثاث', name_en='Furniture')
+
+        def create(title, **fields):
+            return Item.objects.create(
+                owner=owner, category=category, title=title, description='وصف', price=1, location='مصر', **fields
+            )
+
+        self.old_hit = create('قديم مشهور', views_count=400, is_featured=True)
+        self.fresh = create('جديد', views_count=100)
+        self.sold = create('مباع', views_count=10000, status='sold')
+        Item.objects.filter(pk=self.old_hit.pk).update(created_at=timezone.now() - timedelta(days=10))
+        self.client = APIClient()
+
+    def test_popularity_decays_with_age(self):
+        """اختبار تقدّم المنتج الأحدث على الأقدم الأكثر مشاهدة بسبب الاضمحلال الزمني"""
+        ItemFeed.materialize()
+        self.assertEqual(ItemFeed.ids('popular'), [self.fresh.pk, self.old_hit.pk])
+        self.assertEqual(ItemFeed.ids('featured'), [self.old_hit.pk])
+
+    def test_feed_pages_are_hydrated_without_sorting_the_table(self):
+        """اختبار جلب صفحة القائمة المحسوبة مسبقاً بعدد ثابت من الاستعلامات"""
+        ItemFeed.materialize()
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/items/recent/', {'limit': 1, 'offset': 1})
+        self.assertEqual([item['id'] for item in response.json()], [self.old_hit.pk])
+
+        Item.objects.filter(pk=self.fresh.pk).update(status='sold')
+        response = self.client.get('/api/items/popular/')
+        self.assertEqual([item['id'] for item in response.json()], [self.old_hit.pk])
+
+class RecommendationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create_user(email=f'r{i}@example.com', password='testpass123', full_name=f'R{i}')
+            for i in range(4)
+        ]
+        category = Category.objects.create(name_ar='كتب', name_en='Books')
+        seller = self.users[3]
+        self.items = [
+            Item.objects.create(
+                owner=seller, category=category, title=f'كتاب {i}', description='وصف', price=1, location='مصر',
+                views_count=i,
+            )
+            for i in range(4)
+        ]
+
+    def like(self, user, *items):
+        ItemLike.objects.bulk_create([ItemLike(user=user, item=item) for item in items])
+
+    def test_neighbours_of_liked_items_are_recommended_first(self):
+        """اختبار التوصية بالمنتجات التي أعجبت من لهم نفس الاهتمامات"""
+        first, second, third, fourth = self.items
+        self.like(self.users[0], first, second)
+        self.like(self.users[1], first, second, third)
+        self.like(self.users[2], first)
+        ItemView.objects.bulk_create([ItemView(item=fourth, user=self.users[1])])
+
+        self.assertGreater(ItemSimilarityBuilder.build(), 0)
+        self.assertEqual(
+            list(ItemSimilarity.objects.filter(item=first).values_list('neighbor', flat=True)),
+            [second.pk, third.pk, fourth.pk],
+        )
+
+        client = APIClient()
+        client.force_authenticate(self.users[2])
+        response = client.get('/api/items/recommended/')
+        self.assertEqual([item['id'] for item in response.json()][:3], [second.pk, third.pk, fourth.pk])
+
+    def test_ratings_and_orders_invalidate_cached_recommendations(self):
+        """اختبار إبطال التوصيات المخزنة عند تقييم أو طلب من المستخدم"""
+        from orders.models import Order
+
+        user = self.users[0]
+        key = RecommendationService.cache_key(user.pk)
+        RecommendationService.recommended_ids(user)
+        with mock.patch('items.signals.NotificationService'):
+            rating = ItemRating.objects.create(item=self.items[0], rater=user, rating=5)
+        self.assertIsNone(cache.get(key))
+
+        RecommendationService.recommended_ids(user)
+        rating.delete()
+        self.assertIsNone(cache.get(key))
+
+        RecommendationService.recommended_ids(user)
+        order = Order.objects.create(
+            buyer=user, seller=self.users[3], item=self.items[1], quantity=1, unit_price=1, total_price=1,
+        )
+        self.assertIsNone(cache.get(key))
+
+        RecommendationService.recommended_ids(user)
+        order.status = 'cancelled'
+        order.save()
+        self.assertIsNone(cache.get(key))
+
+    def test_cold_start_falls_back_to_popular(self):
+        """اختبار البداية الباردة بالأكثر شعبية دون منتجات المستخدم نفسه"""
+        ItemFeed.materialize()
+        ids = RecommendationService.recommended_ids(self.users[0])
+        self.assertEqual(ids, ItemFeed.ids('popular'))
+        self.assertEqual(RecommendationService.recommended_ids(self.users[3]), [])
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageDerivativesTestCase(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        owner = User.objects.create_user(email='images@example.com', password='testpass123', full_name='Images')
+        category = Category.objects.create(name_ar='ملابس', name_en='Clothes')
+        self.item = Item.objects.create(
+            owner=owner, category=category, title='قميص', description='وصف', price=1, location='مصر'
+        )
+
+    def photo(self):
+        """صورة JPEG أفقية مع وسم EXIF يطلب تدويرها 90 درجة"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        output = io.BytesIO()
+        Image.new('RGB', (400, 200), (0, 128, 0)).save(output, format='JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_queued_and_thumbnail_served(self):
+        """اختبار جدولة المعالجة عند الرفع وتوليد المقاسات وإرجاع الصورة المصغرة في القوائم"""
+        with mock.patch('items.tasks.generate_image_derivatives.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.item.image = self.photo()
+                self.item.save()
+        item_image = self.item.images.get()
+        self.assertTrue(item_image.is_primary)
+        delay.assert_called_once_with(item_image.pk)
+
+        derivatives = ImageDerivatives.generate(item_image)
+        self.assertEqual((derivatives['thumbnail']['width'], derivatives['thumbnail']['height']), (320, 320))
+        # التدوير حسب EXIF يجعل الصورة رأسية
+        self.assertEqual((derivatives['medium']['width'], derivatives['medium']['height']), (200, 400))
+        self.assertIn(item_image.content_hash, derivatives['medium']['webp'])
+
+        results = APIClient().get('/api/items/').json()['results']
+        self.assertTrue(results[0]['image'].endswith('/thumbnail.webp'))
+
+    def test_existing_derivatives_are_not_rendered_again(self):
+        """اختبار أن الملفات الموجودة لا تُعاد معالجتها وأن أبعادها تُقرأ من الملف المحفوظ"""
+        with mock.patch('items.tasks.generate_image_derivatives.delay'):
+            self.item.image = self.photo()
+            self.item.save()
+        item_image = self.item.images.get()
+        first = ImageDerivatives.generate(item_image)
+
+        # نسخة أخرى من الصورة نفسها بلا مقاسات مسجلة
+        item_image.derivatives = {}
+        with mock.patch.object(ImageDerivatives, 'render') as render:
+            second = ImageDerivatives.generate(item_image)
+        render.assert_not_called()
+        self.assertEqual(second, first)
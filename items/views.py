@@ -1,18 +1,22 @@
-from rest_framework import generics, permissions, filters, status
+from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import generics, permissions
 from rest_framework import status
+from django.db import IntegrityError, transaction
 from django.db.models import Q, Count, Avg, Sum
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Category, Item, ItemImage, ItemRating, ItemLike, ItemView
+from .models import Category, Item, ItemImage, ItemRating, ItemLike
 from .serializers import (
     CategorySerializer, ItemListSerializer, ItemDetailSerializer,
     ItemCreateUpdateSerializer, ItemRatingSerializer, ItemStatsSerializer
 )
-from .filters import ItemFilter
+from .filters import ItemFilter, ItemOrderingFilter, ItemSearchFilter
+from .services import CategoryCatalog, ItemFeed, ItemViewService
+from .recommendations import RecommendationService
 from .permissions import IsOwnerOrReadOnly
+from core.pagination import KeysetPagination
 import logging
 from django.http import FileResponse, Http404
 from django.conf import settings
@@ -23,14 +27,23 @@ class CategoryListView(generics.ListAPIView):
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
+    def list(self, request, *args, **kwargs):
+        # الشجرة كاملة من الكاش بدل تسلسل الفئات وعدّ منتجات كل فئة في كل طلب
+        categories = CategoryCatalog.categories(CategoryCatalog.language(request))
+        page = self.paginate_queryset(categories)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(categories)
+
 class ItemListView(generics.ListAPIView):
-    queryset = Item.objects.filter(status='available')
+    queryset = ItemListSerializer.setup_eager_loading(Item.objects.filter(status='available'))
     serializer_class = ItemListSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    # البحث بعد الترتيب حتى يرتب النتائج حسب التطابق إذا لم يُطلب ترتيب آخر
+    filter_backends = [DjangoFilterBackend, ItemOrderingFilter, ItemSearchFilter]
     filterset_class = ItemFilter
-    search_fields = ['title', 'description', 'location']
-    ordering_fields = ['created_at', 'price', 'views_count', 'likes_count']
+    ordering_fields = ['created_at', 'price', 'views_count', 'likes_count', 'distance']
     ordering = ['-created_at']
 
 
@@ -58,8 +71,7 @@ class ItemCreateView(generics.CreateAPIView):
     def perform_create(self, serializer):
         item = serializer.save(owner=self.request.user)
         # Update user statistics
-        self.request.user.total_items_posted += 1
-        self.request.user.save()
+        self.request.user.increment_counter('total_items_posted')
         return item
 
 
@@ -71,19 +83,16 @@ class ItemDetailView(generics.RetrieveAPIView):
     def retrieve(self, request, *args, **kwargs):
         item = self.get_object()
         
-        # Record view
-        ItemView.objects.create(
-            item=item,
-            user=request.user if request.user.is_authenticated else None,
+        # Record view (buffered and flushed to the database periodically)
+        ItemViewService.record(
+            item,
+            user=request.user,
             ip_address=request.META.get('REMOTE_ADDR'),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
         
-        # Update view count
-        item.views_count += 1
-        item.save()
-        
-        return super().retrieve(request, *args, **kwargs)
+        serializer = self.get_serializer(item)
+        return Response(serializer.data)
 
 class ItemUpdateView(generics.UpdateAPIView):
     queryset = Item.objects.all()
@@ -99,13 +108,23 @@ class MyItemsView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Item.objects.filter(owner=self.request.user)
+        return ItemListSerializer.setup_eager_loading(Item.objects.filter(owner=self.request.user))
 
 class FeaturedItemsView(generics.ListAPIView):
-    queryset = Item.objects.filter(status='available', is_featured=True)
+    queryset = ItemListSerializer.setup_eager_loading(Item.objects.filter(status='available', is_featured=True))
     serializer_class = ItemListSerializer
     permission_classes = [permissions.AllowAny]
 
+    def list(self, request, *args, **kwargs):
+        # تصفح قائمة المعرفات المحسوبة مسبقاً ثم جلب منتجات الصفحة فقط
+        ids = ItemFeed.ids('featured')
+        page = self.paginate_queryset(ids)
+        items = ItemFeed.hydrate(page if page is not None else ids, self.get_queryset())
+        serializer = self.get_serializer(items, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
 class ItemRatingListCreateView(generics.ListCreateAPIView):
     serializer_class = ItemRatingSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -121,8 +140,8 @@ class ItemRatingListCreateView(generics.ListCreateAPIView):
         if item.owner == self.request.user:
             raise serializers.ValidationError('لا يمكنك تقييم منتجك الخاص')
         
-        serializer.save(rater=self.request.user, item=item)
-        item.update_rating()
+        rating = serializer.save(rater=self.request.user, item=item)
+        item.add_rating(rating.rating)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -132,21 +151,20 @@ def toggle_like(request, item_id):
     if item.owner == request.user:
         return Response({'error': 'لا يمكنك الإعجاب بمنتجك الخاص'}, status=status.HTTP_400_BAD_REQUEST)
     
-    like, created = ItemLike.objects.get_or_create(item=item, user=request.user)
-    
-    if not created:
-        like.delete()
-        item.likes_count -= 1
-        liked = False
-    else:
-        item.likes_count += 1
-        liked = True
-    
-    item.save()
+    # likes_count is kept in sync atomically by the ItemLike signals
+    deleted, _ = ItemLike.objects.filter(item=item, user=request.user).delete()
+    liked = not deleted
+    if liked:
+        try:
+            with transaction.atomic():
+                ItemLike.objects.create(item=item, user=request.user)
+        except IntegrityError:
+            # A concurrent request already added the like
+            pass
     
     return Response({
         'liked': liked,
-        'likes_count': item.likes_count
+        'likes_count': Item.objects.values_list('likes_count', flat=True).get(pk=item.pk)
     })
 
 @api_view(['GET'])
@@ -178,38 +196,35 @@ def item_stats(request):
     serializer = ItemStatsSerializer(data)
     return Response(serializer.data)
 
+def feed_response(request, name, default_limit=10):
+    """صفحة من قائمة محسوبة مسبقاً (offset و limit اختياريان)"""
+    try:
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+        limit = min(max(int(request.query_params.get('limit', default_limit)), 1), 50)
+    except ValueError:
+        return Response({'error': 'offset و limit يجب أن تكون أرقاماً'}, status=status.HTTP_400_BAD_REQUEST)
+
+    ids = ItemFeed.ids(name)[offset:offset + limit]
+    items = ItemFeed.hydrate(ids, ItemListSerializer.setup_eager_loading(Item.objects.all()))
+    serializer = ItemListSerializer(items, many=True, context={'request': request})
+    return Response(serializer.data)
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def popular_items(request):
-    items = Item.objects.filter(status='available').order_by('-views_count', '-likes_count')[:10]
-    serializer = ItemListSerializer(items, many=True, context={'request': request})
-    return Response(serializer.data)
+    return feed_response(request, 'popular')
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def recent_items(request):
-    items = Item.objects.filter(status='available').order_by('-created_at')[:10]
-    serializer = ItemListSerializer(items, many=True, context={'request': request})
-    return Response(serializer.data)
+    return feed_response(request, 'recent')
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def recommended_items(request):
     user = request.user
-    
-    # Get user's liked categories
-    liked_categories = ItemLike.objects.filter(user=user).values_list('item__category', flat=True)
-    
-    # Get items from liked categories
-    recommended = Item.objects.filter(
-        status='available',
-        category__in=liked_categories
-    ).exclude(owner=user).order_by('-created_at')[:20]
-    
-    # If no recommendations, get popular items
-    if not recommended:
-        recommended = Item.objects.filter(status='available').exclude(owner=user).order_by('-views_count')[:20]
-    
+    ids = RecommendationService.recommended_ids(user)
+    recommended = ItemFeed.hydrate(ids, ItemListSerializer.setup_eager_loading(Item.objects.exclude(owner=user)))
     serializer = ItemListSerializer(recommended, many=True, context={'request': request})
     return Response(serializer.data)
 
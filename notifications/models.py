@@ -68,6 +68,7 @@ class Notification(models.Model):
             models.Index(fields=['recipient', 'is_read']),
             models.Index(fields=['created_at']),
             models.Index(fields=['notification_type']),
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notif_recipient_feed_idx'),
         ]
 
     def __str__(self):
@@ -11,10 +11,12 @@ from .serializers import (
     NotificationStatsSerializer
 )
 from .services import NotificationService
+from core.pagination import KeysetPagination
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0005_feed_indexes"),
+        ("orders", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["buyer", "-created_at", "-id"], name="orders_buyer_feed_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["seller", "-created_at", "-id"], name="orders_seller_feed_idx"
+            ),
+        ),
+    ]
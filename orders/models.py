@@ -58,6 +58,10 @@ class Order(models.Model):
         verbose_name = _('طلب')
         verbose_name_plural = _('الطلبات')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['buyer', '-created_at', '-id'], name='orders_buyer_feed_idx'),
+            models.Index(fields=['seller', '-created_at', '-id'], name='orders_seller_feed_idx'),
+        ]
 
     def __str__(self):
         return f'Order {self.order_number} - {self.item.title}'
@@ -93,11 +97,10 @@ class Order(models.Model):
         # Update item status if all quantity is ordered
         if self.quantity >= self.item.quantity:
             self.item.status = 'sold'
-            self.item.save()
+            self.item.save(update_fields=['status', 'updated_at'])
         
         # Update user statistics
-        self.buyer.total_orders_made += 1
-        self.buyer.save()
+        self.buyer.increment_counter('total_orders_made')
 
 class OrderMessage(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='messages', verbose_name=_('الطلب'))
@@ -1,8 +1,15 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from .models import Order
+from items.recommendations import RecommendationService
 from notifications.services import NotificationService
 
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_buyer_recommendations(sender, instance, **kwargs):
+    """إعادة حساب توصيات المشتري عند طلب جديد أو تغير حالته (الطلبات الملغاة لا تُحتسب)"""
+    RecommendationService.invalidate(instance.buyer_id)
+
 @receiver(post_save, sender=Order)
 def order_status_notification(sender, instance, created, **kwargs):
     """إرسال إشعارات عند تغيير حالة الطلب"""
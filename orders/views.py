@@ -9,10 +9,12 @@ from .serializers import (
     OrderTrackingSerializer, OrderRatingSerializer, OrderUpdateSerializer
 )
 from .permissions import IsOrderParticipant
+from core.pagination import KeysetPagination
 
 class OrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -49,6 +51,7 @@ class OrderUpdateView(generics.UpdateAPIView):
 class MyOrdersView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -107,7 +110,7 @@ class OrderRatingView(generics.ListCreateAPIView):
             rating_type = 'seller_to_buyer'
             rated_user = order.buyer
         
-        serializer.save(
+        rating = serializer.save(
             order=order,
             rater=self.request.user,
             rated_user=rated_user,
@@ -115,7 +118,7 @@ class OrderRatingView(generics.ListCreateAPIView):
         )
         
         # Update user rating
-        rated_user.update_rating()
+        rated_user.add_rating(rating.rating)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
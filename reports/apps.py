@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
-    verbose_name = 'إدارة الشكاوى والبلاغات'
\ No newline at end of file
+    verbose_name = 'إدارة الشكاوى والبلاغات'
+
+    def ready(self):
+        import reports.signals
\ No newline at end of file
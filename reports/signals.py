@@ -0,0 +1,14 @@
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from .models import Report
+from ai_services.moderation import ModerationQueue
+
+@receiver(post_init, sender=Report)
+def remember_report_text(sender, instance, **kwargs):
+    ModerationQueue.remember(instance)
+
+@receiver(post_save, sender=Report)
+def queue_report_moderation(sender, instance, created, **kwargs):
+    """إضافة البلاغات الجديدة لطابور المراجعة"""
+    if created:
+        ModerationQueue.enqueue_on_commit(instance, created)